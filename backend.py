@@ -1,20 +1,47 @@
-from PyQt5.QtCore import pyqtSignal, QObject, QThreadPool, QRunnable, \
-    pyqtSlot, QThread
+from PyQt5.QtCore import pyqtSignal, QObject
+import importlib
+import threading
 import urllib.parse
 import os
-from dict_to_xl import dict_to_xlsx
+from jobs import JobManager
+from parse_cache import ParseCache
+from profiling import Stats
+
+
+def preload():
+    """
+    Imports the converter (pdfminer, NumPy, xlsxwriter) in the background,
+    so the window is drawn without waiting for it and the first export
+    usually finds it loaded
+    """
+    threading.Thread(target=importlib.import_module, args=("dict_to_xl",),
+                     daemon=True).start()
+
+
+def dict_to_xlsx(*args, **kwargs):
+    """
+    dict_to_xl.dict_to_xlsx, imported on first use
+    """
+    from dict_to_xl import dict_to_xlsx
+    return dict_to_xlsx(*args, **kwargs)
 
 
 class PDFToExcel(QObject):
     front_add_path = pyqtSignal(str)
     front_remove_path = pyqtSignal(str)
+    batch_finished = pyqtSignal(dict)
 
-    def __init__(self, front_obj):
+    def __init__(self, front_obj, max_workers=2):
         super().__init__()
         self.names_paths = {}
+        self.parse_cache = ParseCache()
+        # Files converted at the same time, the rest wait in the queue
+        self.jobs = JobManager(max_workers)
+        self.batch = None
         self.front = front_obj
         self.front_add_path.connect(self.front.add_path_to_list)
         self.front_remove_path.connect(self.front.drop_path_from_list)
+        self.batch_finished.connect(self.front.export_finished)
 
     def add_paths_drag_n_drop(self, paths):
         for file in paths.split('\n'):
@@ -47,16 +74,40 @@ class PDFToExcel(QObject):
         self.front_remove_path.emit(path)
 
     def export_pdf_to_excel(self, args):
-        output_path, include_od = args
+        output_path, include_od, formats = args
         output_path = os.path.normpath(output_path)
-        pool = QThreadPool()
-        # pool.globalInstance().setMaxThreadCount(2)
+        workers = []
         for front_name, input_path in self.names_paths.items():
             worker = Worker(dict_to_xlsx, front_name, input_path,
-                            output_path, report_od=include_od)
+                            output_path, report_od=include_od,
+                            cache=self.parse_cache, formats=formats,
+                            # Several files are written at the same time,
+                            # stream their rows instead of holding them
+                            constant_memory=True)
             worker.signals.progress.connect(self.front.progress_started)
             worker.signals.result.connect(self.front.change_color_finished)
-            pool.globalInstance().start(worker)  # .globalInstance() is the key!
+            worker.signals.stats.connect(self.front.show_stats)
+            workers.append((front_name, worker.run))
+        self.batch = self.jobs.submit_batch(
+            workers,
+            on_done=lambda batch: self.batch_finished.emit(batch.summary()))
+
+    def cancel_export(self):
+        """
+        Drops the files still waiting and stops the running ones at their
+        next page
+        """
+        if self.batch is not None:
+            self.batch.cancel()
+
+    def shutdown(self):
+        """
+        Cancels every conversion without waiting for them, so the window
+        closes at once. The process itself exits once the running files
+        reach their next cancellation check (a page, or the next output
+        file to write).
+        """
+        self.jobs.shutdown(wait=False, cancel=True)
 
 
 class WorkerSignals(QObject):
@@ -64,12 +115,17 @@ class WorkerSignals(QObject):
     error = pyqtSignal(tuple)
     result = pyqtSignal(tuple)
     progress = pyqtSignal(tuple)
+    stats = pyqtSignal(tuple)
     internal_progress = pyqtSignal(float)
 
 
-class Worker(QRunnable):
+class Worker:
+    """
+    Runs task for one file of the list, relaying its progress, status and
+    timings to the GUI through signals
+    """
+
     def __init__(self, task, name, *args, **kwargs):
-        super().__init__()
         self.task = task
         self.front_name = name
         self.args = args
@@ -77,9 +133,15 @@ class Worker(QRunnable):
         self.signals = WorkerSignals()
         self.signals.internal_progress.connect(self.report_progress)
         self.kwargs["sgn_progress"] = self.signals.internal_progress
+        self.kwargs["stats"] = Stats()
+
+    def run(self, cancel_event=None):
+        """
+        Job body for jobs.JobManager
 
-    @pyqtSlot()
-    def run(self):
+        :return: Status code of task
+        """
+        self.kwargs["cancel_event"] = cancel_event
         res = self.task(*self.args, **self.kwargs)
         if res == 0:
             self.signals.result.emit((self.front_name, 0))
@@ -87,8 +149,14 @@ class Worker(QRunnable):
             self.signals.result.emit((self.front_name, 1))
         elif res == 2:
             self.signals.result.emit((self.front_name, 2))
+        elif res == 4:
+            self.signals.result.emit((self.front_name, 4))
         else:
             self.signals.result.emit((self.front_name, 3))
+        # After result, so the timings are appended to the final tooltip
+        self.signals.stats.emit(
+            (self.front_name, self.kwargs["stats"].as_dict()))
+        return res
 
     def report_progress(self, progress):
         self.signals.progress.emit((self.front_name, progress))
@@ -0,0 +1,144 @@
+"""
+Times calibration.fit_quality on hundreds of curves at once against fitting
+them one by one with np.polyfit and leaving every standard out in turn.
+
+    python benchmarks/calibration_quality.py --molecules 500 --standards 8
+
+The standards get 2 % of noise and every fifth molecule one standard 50 %
+off. For every model the coefficients must match np.polyfit with the same
+weights, the studentized residuals and Cook's distances must match the
+leave-one-out refits, and rejecting outliers must leave out every spoiled
+standard. Clean curves losing a standard are only counted: with few
+standards a studentized residual over 3 is not that rare.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import synthetic_processed  # noqa: E402
+from peak_table import PeakTable  # noqa: E402
+from calibration import CalibrationModel, fit_calibrations, fit_quality, \
+    padded_standards, INVERSE_X, INVERSE_X2, NO_WEIGHTING, LINEAR, \
+    QUADRATIC  # noqa: E402
+
+MODELS = (CalibrationModel(),
+          CalibrationModel(INVERSE_X, LINEAR),
+          CalibrationModel(INVERSE_X2, QUADRATIC),
+          CalibrationModel(INVERSE_X2, LINEAR, True))
+SPOILED_EVERY = 5
+
+
+def reference_fit(x, y, weights, degree):
+    """
+    One curve with np.polyfit, refitted without each standard
+
+    :return: Tuple (coefficients from the constant up, studentized
+             residuals, Cook's distances)
+    """
+    terms = degree + 1
+    root = np.sqrt(weights)
+    full = np.polyfit(x, y, degree, w=root)
+    residuals = (y - np.polyval(full, x)) * root
+    variance = (residuals ** 2).sum() / (len(x) - terms)
+    design = np.vander(x, terms, increasing=True)
+    hat = design @ np.linalg.inv(design.T @ (design * weights[:, None])) \
+        @ design.T * weights
+    studentized = []
+    cooks = []
+    for i in range(len(x)):
+        keep = np.arange(len(x)) != i
+        loo = np.polyfit(x[keep], y[keep], degree, w=root[keep])
+        loo_residuals = (y[keep] - np.polyval(loo, x[keep])) * root[keep]
+        loo_variance = (loo_residuals ** 2).sum() / (keep.sum() - terms)
+        studentized.append(residuals[i] /
+                           np.sqrt(loo_variance * (1 - hat[i, i])))
+        shift = (np.polyval(full, x) - np.polyval(loo, x)) ** 2 * weights
+        cooks.append(shift.sum() / (terms * variance))
+    return full[::-1], np.array(studentized), np.array(cooks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--molecules", type=int, default=500)
+    parser.add_argument("--standards", type=int, default=8)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    processed, names = synthetic_processed(args.samples, args.molecules,
+                                           args.standards)
+    spoiled = np.zeros(len(names), dtype=bool)
+    for i, (name, standards) in enumerate(
+            sorted(processed["standards"].items())):
+        for conc in standards:
+            standards[conc] *= 1 + rng.normal(0, 0.02)
+        if i % SPOILED_EVERY == 0:
+            standards[max(standards)] *= 1.5
+            spoiled[names.index(name)] = True
+    table = PeakTable.from_processed(processed, names)
+    conc, area, valid = padded_standards(table)
+    curves = np.flatnonzero(valid.any(axis=1))
+    print(f"{len(curves)} curves of {args.standards} standards")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        fit_calibrations(table)
+    classic = (time.perf_counter() - start) / args.repeat
+    print(f"{'fit_calibrations':32s} {classic * 1000:8.2f} ms")
+
+    failed = False
+    for model in MODELS:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            quality = fit_quality(table, model)
+        vectorized = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for m in curves:
+            x, y = conc[m][valid[m]], area[m][valid[m]]
+            weights = {NO_WEIGHTING: np.ones_like(x), INVERSE_X: 1 / x,
+                       INVERSE_X2: 1 / x ** 2}[model.weighting]
+            coefficients, studentized, cooks = reference_fit(
+                x, y, weights, model.degree)
+            if model.reject_outliers:
+                # Refits after rejecting do not compare point by point
+                continue
+            used = quality.used[m]
+            if not (np.allclose(quality.coefficients[m, :model.degree + 1],
+                                coefficients) and
+                    np.allclose(quality.studentized[m][used], studentized)
+                    and np.allclose(quality.cooks[m][used], cooks)):
+                print(f"FAIL: {quality.describe(m)} differs for {names[m]}")
+                failed = True
+                break
+        one_by_one = time.perf_counter() - start
+
+        label = ", ".join(str(value) for value in model)
+        print(f"{label:32s} {vectorized * 1000:8.2f} ms, one by one "
+              f"{one_by_one * 1000:8.2f} ms ({one_by_one / vectorized:.0f}x)")
+        if model.reject_outliers:
+            rejected = quality.rejected.any(axis=1)
+            if not rejected[spoiled].all():
+                print(f"FAIL: {int((~rejected[spoiled]).sum())} spoiled "
+                      f"standards were kept")
+                failed = True
+            print(f"{'':32s} {int(rejected[spoiled].sum())} of "
+                  f"{int(spoiled.sum())} spoiled curves and "
+                  f"{int(rejected[~spoiled].sum())} clean ones excluded a "
+                  f"standard")
+    if failed:
+        print("FAIL")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Measures the downsampling of ctx_to_xl on a long synthetic chromatogram and
+checks that the chart keeps its shape.
+
+    python benchmarks/chart_downsampling.py --points 5000000 --budget 4000
+
+Every peak must keep its apex height in the chart, LTTB must pick the same
+points as a plain loop over the points, and the .npy sidecar must hold the
+full trace.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from synthetic import chromatogram  # noqa: E402
+from ctx_reader import Trace  # noqa: E402
+from ctx_to_xl import (minmax_indices, lttb_indices, write_chromatogram,  # noqa: E402
+                       sidecar_path, MINMAX, LTTB)
+
+
+def reference_lttb(x, y, max_points):
+    """
+    Textbook LTTB, one point at a time
+    """
+    n = len(y)
+    buckets = max_points - 2
+    edges = [i * (n - 2) // buckets + 1 for i in range(buckets + 1)]
+    kept = [0]
+    for bucket in range(buckets):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 1 < buckets:
+            nlo, nhi = edges[bucket + 1], edges[bucket + 2]
+            cx = sum(x[nlo:nhi]) / (nhi - nlo)
+            cy = sum(y[nlo:nhi]) / (nhi - nlo)
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        ax, ay = x[kept[-1]], y[kept[-1]]
+        best, best_area = lo, -1.0
+        for i in range(lo, hi):
+            area = abs((ax - cx) * (y[i] - ay) - (ax - x[i]) * (cy - ay))
+            if area > best_area:
+                best, best_area = i, area
+        kept.append(best)
+    kept.append(n - 1)
+    return np.array(kept)
+
+
+def apex_error(time_axis, signal, index, peaks):
+    """
+    :return: Largest relative difference between the apex of each peak and
+             the highest kept point around it
+    """
+    worst = 0.0
+    for center, sigma, _ in peaks:
+        window = (time_axis >= center - sigma) & (time_axis <= center + sigma)
+        kept = window[index]
+        full = signal[window].max()
+        worst = max(worst, abs(full - signal[index][kept].max()) / full)
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--points", type=int, default=5000000)
+    parser.add_argument("--budget", type=int, default=4000)
+    args = parser.parse_args()
+
+    time_axis, signals, peaks = chromatogram(points=args.points)
+    signal = signals[0]
+    print(f"{args.points} points, {len(peaks)} peaks, budget {args.budget}")
+    failed = False
+    for label, downsample in ((MINMAX, lambda: minmax_indices(
+            signal, args.budget)), (LTTB, lambda: lttb_indices(
+                time_axis, signal, args.budget))):
+        start = time.perf_counter()
+        index = downsample()
+        elapsed = time.perf_counter() - start
+        error = apex_error(time_axis, signal, index, peaks)
+        print(f"{label:7s} {elapsed:7.3f} s  {len(index)} points  "
+              f"apex error {error:.2%}")
+        failed |= error > 0.02
+
+    small_x, small_y = time_axis[::500].tolist(), signal[::500].tolist()
+    if not np.array_equal(lttb_indices(np.array(small_x), np.array(small_y),
+                                       300),
+                          reference_lttb(small_x, small_y, 300)):
+        print("FAIL: LTTB differs from the reference")
+        failed = True
+
+    trace = Trace("synthetic.ctx", ["Tiempo (min)", "Canal A (mAU)"],
+                  np.vstack((time_axis, signal)))
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "Cromatograma synthetic.xlsx")
+        start = time.perf_counter()
+        res = write_chromatogram(trace, path, args.budget)
+        elapsed = time.perf_counter() - start
+        print(f"xlsx    {elapsed:7.3f} s  {os.path.getsize(path) / 1024:.0f} "
+              f"KB, sidecar {os.path.getsize(sidecar_path(path)) / 2 ** 20:.0f}"
+              f" MB")
+        if res != 0 or not np.array_equal(np.load(sidecar_path(path)),
+                                          trace.data):
+            print("FAIL: sidecar differs from the trace")
+            failed = True
+    if failed:
+        print("FAIL")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Measures how ctx_reader loads a raw chromatogram: parsing the text into
+memory, converting it to the binary cache, and mapping the cache again.
+
+    python benchmarks/ctx_loading.py --points 2000000 --channels 2
+
+Peak memory is the one traced by tracemalloc, which NumPy reports its
+arrays to. Converting keeps only one chunk of text and points in memory.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from synthetic import write_ctx  # noqa: E402
+from ctx_reader import read_ctx, convert_ctx, load_ctx  # noqa: E402
+
+
+def measure(label, task, size_mb):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = task()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:8s} {elapsed:7.3f} s  {size_mb / elapsed:7.1f} MB/s  "
+          f"peak {peak / 2 ** 20:7.1f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--points", type=int, default=2000000)
+    parser.add_argument("--channels", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "synthetic.ctx")
+        write_ctx(path, points=args.points, channels=args.channels)
+        size_mb = os.path.getsize(path) / 2 ** 20
+        print(f"{args.points} points x {args.channels} channels, "
+              f"{size_mb:.1f} MB of text")
+        cache_dir = os.path.join(folder, "cache")
+        parsed = measure("parse", lambda: read_ctx(path), size_mb)
+        measure("convert", lambda: convert_ctx(path, cache_dir), size_mb)
+        mapped = measure("map", lambda: load_ctx(path, cache_dir=cache_dir),
+                         size_mb)
+        if not np.array_equal(parsed.data, mapped.data):
+            print("FAIL: cached points differ")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
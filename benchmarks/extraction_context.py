@@ -0,0 +1,88 @@
+"""
+Measures the per-file overhead of read_pdf on a batch of small reports with
+and without a reused pdf_io.ExtractionContext.
+
+    python benchmarks/extraction_context.py --files 40 --backend fast
+
+Modes, each reading the same batch of 5 to 20 page synthetic reports with
+TrueType fonts (see synthetic.write_pdf), one file after the other:
+    cold     a new context and font cache per file: every file builds its
+             resource manager, extractor and fonts
+    fonts    a new context per file sharing one font cache, as read_pdf did
+             before contexts were kept
+    context  one context for the whole batch, as every thread now keeps
+Every mode must read the same results.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_report  # noqa: E402
+from pdf_io import ExtractionContext, FontCache  # noqa: E402
+from pdf_to_dict import read_pdf, EXTRACTORS  # noqa: E402
+
+
+def run(paths, backend, mode):
+    """
+    :return: Tuple (seconds per file, list of read_pdf results)
+    """
+    font_cache = FontCache()
+    context = ExtractionContext(font_cache)
+    results = []
+    start = time.perf_counter()
+    for path in paths:
+        if mode == "cold":
+            context = ExtractionContext(FontCache())
+        elif mode == "fonts":
+            context = ExtractionContext(font_cache)
+        results.append(read_pdf(path, backend=backend, context=context))
+    return (time.perf_counter() - start) / len(paths), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--backend", choices=sorted(EXTRACTORS),
+                        default="pdfminer")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        pages = 0
+        for i in range(args.files):
+            path = os.path.join(folder, f"report{i}.pdf")
+            # Standards take 6 pages, samples one each
+            pages += write_report(path, truetype=True, seed=i,
+                                  samples=rng.randint(0, 14), standards=5)
+            paths.append(path)
+        print(f"{args.files} files, {pages / args.files:.1f} pages each, "
+              f"backend {args.backend}")
+        best = {}
+        reference = None
+        for _ in range(args.repeat):
+            for mode in ("cold", "fonts", "context"):
+                elapsed, results = run(paths, args.backend, mode)
+                reference = reference or results
+                if results != reference:
+                    print(f"FAIL: {mode} read different results")
+                    return 1
+                best[mode] = min(best.get(mode, elapsed), elapsed)
+    for mode, elapsed in best.items():
+        saved = best["cold"] - elapsed
+        print(f"{mode:8s} {elapsed * 1000:7.2f} ms per file, "
+              f"{saved * 1000:6.2f} ms saved "
+              f"({saved / best['cold']:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Fills a history database with synthetic runs spread over two years and
+times recording them and querying it.
+
+    python benchmarks/history_queries.py --runs 1000 --samples 50 --molecules 20
+
+Every run is the same synthetic sequence on another date, one transaction
+each. The queries are the areas of one molecule in the last 90 days, of one
+sample pattern over the whole history and the calibration fits of the
+molecule. They must return as many rows as the dates say, in date order,
+and read the areas of the molecule from their primary key range instead of
+scanning the table.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import synthetic_processed  # noqa: E402
+from peak_table import PeakTable  # noqa: E402
+from calibration import fit_calibrations  # noqa: E402
+from history import RunHistory, DAY  # noqa: E402
+
+HISTORY_DAYS = 730
+QUERY_DAYS = 90
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--molecules", type=int, default=20)
+    args = parser.parse_args()
+
+    processed, names = synthetic_processed(args.samples, args.molecules)
+    table = PeakTable.from_processed(processed, names)
+    calibrations = fit_calibrations(table)
+    molecule = names[0]
+    now = time.time()
+    dates = np.sort(now - np.random.RandomState(0).uniform(
+        0, HISTORY_DAYS * DAY, args.runs))
+
+    failed = False
+    with tempfile.TemporaryDirectory() as folder:
+        with RunHistory(os.path.join(folder, "history.sqlite")) as history:
+            start = time.perf_counter()
+            for i, run_date in enumerate(dates.tolist()):
+                history.record(table, calibrations, f"run {i}",
+                               run_date=run_date)
+            elapsed = time.perf_counter() - start
+            rows = args.runs * len(table)
+            print(f"{args.runs} runs of {len(table)} peaks in {elapsed:.2f} s"
+                  f": {elapsed / args.runs * 1000:.2f} ms per run, "
+                  f"{rows / elapsed:,.0f} rows/s")
+
+            recent = int((dates >= now - QUERY_DAYS * DAY).sum())
+            columns, elapsed = timed(history.areas, molecule,
+                                     days=QUERY_DAYS, until=now)
+            expected = recent * args.samples
+            print(f"{molecule}, last {QUERY_DAYS} days: "
+                  f"{len(columns['area']):,} areas in {elapsed * 1000:.1f} ms")
+            failed |= len(columns["area"]) != expected
+            failed |= bool(np.any(np.diff(columns["date"].astype(np.int64))
+                                  < 0))
+
+            columns, elapsed = timed(history.areas, molecule, until=now)
+            print(f"{molecule}, all: {len(columns['area']):,} areas in "
+                  f"{elapsed * 1000:.1f} ms "
+                  f"({len(columns['area']) / elapsed:,.0f} rows/s)")
+            failed |= len(columns["area"]) != args.runs * args.samples
+
+            sample = table.sample_list()[0]
+            columns, elapsed = timed(history.areas, molecule, sample=sample,
+                                     until=now)
+            print(f"{molecule}, {sample}: {len(columns['area']):,} areas in "
+                  f"{elapsed * 1000:.1f} ms")
+            failed |= len(columns["area"]) != args.runs
+            failed |= set(columns["sample"].tolist()) != {sample}
+
+            columns, elapsed = timed(history.fits, molecule, days=QUERY_DAYS,
+                                     until=now)
+            print(f"{molecule} fits, last {QUERY_DAYS} days: "
+                  f"{len(columns['slope'])} in {elapsed * 1000:.1f} ms")
+            failed |= len(columns["slope"]) != recent
+
+            plan = " ".join(str(row) for row in history.connection.execute(
+                "EXPLAIN QUERY PLAN SELECT area FROM areas WHERE "
+                "molecule_id = 1 AND run_date BETWEEN 0 AND 1"))
+            if "PRIMARY KEY" not in plan:
+                print(f"FAIL: the date query scans the table: {plan}")
+                failed = True
+        size = os.path.getsize(os.path.join(folder, "history.sqlite"))
+        print(f"database of {size / 2 ** 20:.0f} MB")
+    if failed:
+        print("FAIL")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
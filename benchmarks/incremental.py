@@ -0,0 +1,68 @@
+"""
+Measures read_pdf on a sequence report exported again as the run grows,
+reading every version from scratch and through a ParseCache, which only
+extracts the pages each version adds.
+
+    python benchmarks/incremental.py --samples 200 --step 20
+
+Every version is checked to give the same result both ways.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_report  # noqa: E402
+from parse_cache import ParseCache  # noqa: E402
+from pdf_to_dict import read_pdf, EXTRACTORS, DEFAULT_BACKEND  # noqa: E402
+from profiling import Stats  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--samples", type=int, default=200,
+                        help="Samples of the last version")
+    parser.add_argument("--step", type=int, default=20,
+                        help="Samples added by each version")
+    parser.add_argument("--molecules", type=int, default=12)
+    parser.add_argument("--backend", choices=sorted(EXTRACTORS),
+                        default=DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    same = True
+    total_full = total_incremental = 0.0
+    with tempfile.TemporaryDirectory() as folder:
+        cache = ParseCache(os.path.join(folder, "cache"))
+        path = os.path.join(folder, "sequence.pdf")
+        for samples in range(args.step, args.samples + 1, args.step):
+            # Same seed, so each version starts with the pages of the last
+            write_report(path, samples=samples, molecules=args.molecules)
+            start = time.perf_counter()
+            full = read_pdf(path, backend=args.backend)
+            full_time = time.perf_counter() - start
+            stats = Stats()
+            start = time.perf_counter()
+            incremental = cache.read_pdf(path, stats=stats,
+                                         backend=args.backend)
+            incremental_time = time.perf_counter() - start
+            same &= incremental == full
+            total_full += full_time
+            total_incremental += incremental_time
+            reused = stats.as_dict()["counters"].get("reused_pages", 0)
+            print(f"{samples:5d} samples: full {full_time:6.2f} s, "
+                  f"incremental {incremental_time:6.2f} s "
+                  f"({reused} pages reused)")
+    print(f"total: full {total_full:.2f} s, "
+          f"incremental {total_incremental:.2f} s")
+    if not same:
+        print("FAIL: results differ")
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
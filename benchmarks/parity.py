@@ -0,0 +1,121 @@
+"""
+Checks that every text extraction backend gives the same read_pdf result as
+the pdfminer reference, and that reading through a ParseCache does too.
+
+Runs over a set of synthetic reports plus any PDF given, and prints the
+extraction time of each backend. The cache is checked cold, with the pages
+of the file already known but not its result, and on a hit. Exits with 1
+if any result differs.
+
+    python benchmarks/parity.py
+    python benchmarks/parity.py reportes/*.pdf
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_report  # noqa: E402
+from pdf_to_dict import (EXTRACTORS, DEFAULT_BACKEND,  # noqa: E402
+                         iter_page_texts, read_pdf)
+from parse_cache import ParseCache  # noqa: E402
+
+REPORTS = {
+    "mixed": {"samples": 40, "molecules": 12},
+    "en": {"samples": 20, "molecules": 8, "language": "en"},
+    "es-split-pages": {"samples": 20, "molecules": 16, "language": "es",
+                       "pages_per_sample": 3},
+    "no-internal-standard": {"samples": 10, "molecules": 5,
+                             "internal_standard": False},
+    # The same blank page three times, read once and reused through the
+    # page cache
+    "repeated-blank": {"samples": 12, "molecules": 6, "blank_every": 4},
+    # Unnamed pages, whose text is read as part of the next page
+    "unnamed": {"samples": 12, "molecules": 6, "unnamed_every": 3},
+}
+
+
+def _read(path, backend):
+    """
+    :return: read_pdf result, or the repr of the exception it raised, which
+             must match as well
+    """
+    try:
+        return read_pdf(path, backend=backend)
+    except Exception as error:
+        return repr(error)
+
+
+def compare(path):
+    """
+    :return: True if all backends agree on path
+    """
+    reference = _read(path, DEFAULT_BACKEND)
+    reference_pages = list(iter_page_texts(path, backend=DEFAULT_BACKEND))
+    same = True
+    timings = []
+    for backend in EXTRACTORS:
+        start = time.perf_counter()
+        pages = list(iter_page_texts(path, backend=backend))
+        timings.append(f"{backend} {time.perf_counter() - start:.2f} s")
+        if backend == DEFAULT_BACKEND:
+            continue
+        if _read(path, backend) != reference:
+            same = False
+            print(f"  {backend}: read_pdf result differs")
+        diff = sum(1 for ref, page in zip(reference_pages, pages)
+                   if ref != page)
+        diff += abs(len(reference_pages) - len(pages))
+        if diff:
+            # Not an error by itself, only the parsed result has to match
+            print(f"  {backend}: text of {diff} pages differs")
+    same &= compare_cached(path, reference)
+    print(f"{'ok  ' if same else 'FAIL'} {os.path.basename(path)}: "
+          f"{', '.join(timings)}")
+    return same
+
+
+def compare_cached(path, reference):
+    """
+    :return: True if ParseCache.read_pdf gives the reference result cold,
+             from cached pages and from its cached result
+    """
+    same = True
+    with tempfile.TemporaryDirectory() as folder:
+        cache = ParseCache(folder)
+        for label in ("cold", "pages", "hit"):
+            if label == "pages":
+                # Keep the per-page entries, forget the result of the file
+                os.remove(cache._entry_path(cache.key(path)))
+            try:
+                result = cache.read_pdf(path)
+            except Exception as error:
+                result = repr(error)
+            if result != reference:
+                same = False
+                print(f"  cache ({label}): read_pdf result differs")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("paths", nargs="*", help="Extra PDFs to compare")
+    args = parser.parse_args()
+    same = True
+    with tempfile.TemporaryDirectory() as folder:
+        for name, options in REPORTS.items():
+            path = os.path.join(folder, f"{name}.pdf")
+            write_report(path, **options)
+            same &= compare(path)
+    for path in args.paths:
+        same &= compare(path)
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Measures the page time of read_pdf's extraction with and without pdf_io.
+
+    python benchmarks/pdf_loading.py --samples 500 --files 3
+
+Modes, each extracting the same synthetic sequences (TrueType fonts in a
+resource dictionary shared by all pages, see synthetic.write_pdf):
+    plain   PDFDocument(caching=False) and a new PDFResourceManager per
+            file, as read_pdf used to open documents
+    pdf_io  open_pdf's memory map and bounded object cache, with a font
+            cache shared by the files; the first file builds the fonts,
+            the rest take them from the cache
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_report  # noqa: E402
+from pdfminer.pdfparser import PDFParser, PDFDocument  # noqa: E402
+from pdfminer.pdfinterp import PDFResourceManager  # noqa: E402
+from pdf_io import (open_pdf, FontCache,  # noqa: E402
+                    SharedFontResourceManager)
+from pdf_to_dict import EXTRACTORS  # noqa: E402
+
+
+def _plain_pages(path, backend):
+    with open(path, "rb") as file_content:
+        parser = PDFParser(file_content)
+        doc = PDFDocument(caching=False)
+        parser.set_document(doc)
+        doc.set_parser(parser)
+        doc.initialize('')
+        extractor = EXTRACTORS[backend](PDFResourceManager())
+        return [extractor.page_text(page) for page in doc.get_pages()]
+
+
+def _pdf_io_pages(path, backend, font_cache):
+    with open_pdf(path) as doc:
+        extractor = EXTRACTORS[backend](SharedFontResourceManager(font_cache))
+        return [extractor.page_text(page) for page in doc.get_pages()]
+
+
+def run(paths, backend, repeat):
+    """
+    :return: Dict {mode: seconds per page of every file}, best of repeat
+    """
+    best = {}
+    for _ in range(repeat):
+        font_cache = FontCache()
+        for mode, read in (("plain", lambda p: _plain_pages(p, backend)),
+                           ("pdf_io", lambda p: _pdf_io_pages(
+                               p, backend, font_cache))):
+            times = []
+            for path in paths:
+                start = time.perf_counter()
+                pages = read(path)
+                times.append((time.perf_counter() - start) / len(pages))
+            if mode not in best or sum(times) < sum(best[mode]):
+                best[mode] = times
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--molecules", type=int, default=12)
+    parser.add_argument("--files", type=int, default=3,
+                        help="Reports printed from the same template")
+    parser.add_argument("--backend", choices=sorted(EXTRACTORS),
+                        default="pdfminer")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for n in range(args.files):
+            path = os.path.join(folder, f"report{n}.pdf")
+            pages = write_report(path, truetype=True, samples=args.samples,
+                                 molecules=args.molecules, seed=n)
+            paths.append(path)
+        best = run(paths, args.backend, args.repeat)
+
+    print(f"{args.files} files x {pages} pages, {args.backend} backend "
+          f"(ms per page)")
+    print("        " + "".join(f"{f'file {n + 1}':>10}"
+                                for n in range(args.files)))
+    for mode, times in best.items():
+        print(f"{mode:>7} " + "".join(f"{1000 * t:10.2f}" for t in times))
+    reduction = [1 - new / old for old, new in zip(best["plain"],
+                                                   best["pdf_io"])]
+    print("   less " + "".join(f"{100 * r:9.1f}%" for r in reduction))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Times peaks.find_peaks on a multi-million-point synthetic chromatogram and
+checks its areas against the exact areas of the Gaussian peaks.
+
+    python benchmarks/peak_detection.py --points 5000000 --budget 1.0
+
+Exits with 1 if a method takes longer than the budget, misses a peak or
+its areas are off by more than the tolerance. The areas are also run
+through traces_to_processed and PeakTable, as dict_to_xl would take them.
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+from synthetic import chromatogram  # noqa: E402
+from ctx_reader import Trace  # noqa: E402
+from peak_table import PeakTable  # noqa: E402
+from calibration import fit_calibrations  # noqa: E402
+import peaks  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--points", type=int, default=5000000)
+    parser.add_argument("--peaks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="Seconds allowed per trace")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Relative area error allowed")
+    args = parser.parse_args()
+
+    time_axis, signals, truth = chromatogram(points=args.points,
+                                             peaks=args.peaks)
+    signal = signals[0]
+    windows = {f"Pico {i:02d}": (center - 3 * sigma, center + 3 * sigma)
+               for i, (center, sigma, _) in enumerate(truth)}
+    exact = {f"Pico {i:02d}": height * sigma * math.sqrt(2 * math.pi)
+             for i, (_, sigma, height) in enumerate(truth)}
+    ok = True
+    for method in (peaks.TRAPEZOID, peaks.SIMPSON):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = peaks.find_peaks(time_axis, signal, method=method)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        areas = peaks.window_areas(found, windows)
+        errors = [abs(areas[name] / exact[name] - 1)
+                  for name in exact if name in areas]
+        missing = len(exact) - len(errors)
+        print(f"{method:9s} {best:.3f} s for {args.points} points "
+              f"({args.points / best / 1e6:.1f} M points/s), "
+              f"{len(found.apex)} peaks, {missing} missing, "
+              f"max area error {100 * max(errors or [0]):.2f} %")
+        ok &= best <= args.budget and not missing and \
+            max(errors or [0]) <= args.tolerance
+
+    # Standards at three levels, the same peaks scaled, plus one sample
+    trace = Trace("sintético", ["Tiempo", "Canal A"],
+                  np.vstack((time_axis, signal)))
+    scaled = [(Trace("std", ["Tiempo", "Canal A"],
+                     np.vstack((time_axis, signal * level))),
+               {name: float(level) for name in windows})
+              for level in (1, 2, 3)]
+    processed, molecule_names = peaks.traces_to_processed(
+        {"Muestra": trace}, scaled, windows)
+    calibrations = fit_calibrations(
+        PeakTable.from_processed(processed, molecule_names))
+    print(f"{len(molecule_names)} molecules calibrated, "
+          f"min R² {calibrations.r2.min():.5f}")
+    if not ok:
+        print("FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
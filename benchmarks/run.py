@@ -0,0 +1,156 @@
+"""
+Times read_pdf and write_workbook stage by stage on synthetic reports.
+
+    python benchmarks/run.py --samples 50,300 --molecules 12
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --baseline baseline.json
+
+Stages:
+    extract  text extraction (iter_page_texts), with --backend
+    parse    page classification and peak table rows (classify_pages,
+             iter_peak_rows, collect_peaks)
+    fit      PeakTable construction and calibration fits
+    write    write_workbook, including workbook.close()
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_report  # noqa: E402
+from calibration import fit_calibrations  # noqa: E402
+from dict_to_xl import write_workbook  # noqa: E402
+from pdf_to_dict import (iter_page_texts, classify_pages,  # noqa: E402
+                         iter_peak_rows, collect_peaks)
+from peak_table import PeakTable  # noqa: E402
+
+STAGES = ("extract", "parse", "fit", "write")
+
+
+def run_stages(pdf_path, xlsx_path, trace_memory=False, backend="pdfminer"):
+    """
+    :return: Dict {stage: {"wall": s, "cpu": s[, "peak_mb": MB]}}
+    """
+    timings = {}
+    state = {}
+
+    def stage(name, task):
+        if trace_memory:
+            tracemalloc.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        state[name] = task()
+        timings[name] = {"wall": time.perf_counter() - wall,
+                         "cpu": time.process_time() - cpu}
+        if trace_memory:
+            timings[name]["peak_mb"] = \
+                tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+    stage("extract", lambda: list(iter_page_texts(pdf_path,
+                                                  backend=backend)))
+    stage("parse", lambda: collect_peaks(
+        iter_peak_rows(classify_pages(state["extract"]))))
+    stage("fit", lambda: fit_calibrations(
+        PeakTable.from_processed(*state["parse"])).table)
+    stage("write", lambda: write_workbook(state["fit"], xlsx_path))
+    return timings
+
+
+def benchmark(samples, molecules, pages_per_sample, repeat, trace_memory,
+              backend="pdfminer"):
+    with tempfile.TemporaryDirectory() as folder:
+        pdf_path = os.path.join(folder, "bench.pdf")
+        xlsx_path = os.path.join(folder, "bench.xlsx")
+        pages = write_report(pdf_path, samples=samples, molecules=molecules,
+                             pages_per_sample=pages_per_sample)
+        best = None
+        for _ in range(repeat):
+            timings = run_stages(pdf_path, xlsx_path, backend=backend)
+            if best is None or sum(t["wall"] for t in timings.values()) < \
+                    sum(t["wall"] for t in best.values()):
+                best = timings
+        if trace_memory:
+            # Separate pass, tracemalloc slows everything down
+            memory = run_stages(pdf_path, xlsx_path, trace_memory=True,
+                                backend=backend)
+            for name in STAGES:
+                best[name]["peak_mb"] = memory[name]["peak_mb"]
+    return {"samples": samples, "molecules": molecules, "pages": pages,
+            "stages": best}
+
+
+def report(result, baseline=None):
+    stages = result["stages"]
+    total = sum(stages[name]["wall"] for name in STAGES)
+    print(f"\n{result['samples']} samples x {result['molecules']} molecules, "
+          f"{result['pages']} pages: {total:.2f} s, "
+          f"{result['pages'] / stages['extract']['wall']:.1f} pages/s "
+          f"extracted")
+    for name in STAGES:
+        timing = stages[name]
+        line = (f"  {name:>8}: {timing['wall']:8.3f} s wall "
+                f"{timing['cpu']:8.3f} s cpu "
+                f"{100 * timing['wall'] / total:5.1f} %")
+        if "peak_mb" in timing:
+            line += f" {timing['peak_mb']:8.1f} MB peak"
+        if baseline:
+            line += f"  x{timing['wall'] / baseline[name]['wall']:.2f} " \
+                    f"vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--samples", default="50,300",
+                        help="Comma separated sample counts")
+    parser.add_argument("--molecules", type=int, default=12)
+    parser.add_argument("--pages-per-sample", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", choices=("pdfminer", "fast"),
+                        default="pdfminer",
+                        help="Text extraction backend of the extract stage")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip the tracemalloc pass")
+    parser.add_argument("--save", default=None,
+                        help="Store the results as a JSON baseline")
+    parser.add_argument("--baseline", default=None,
+                        help="Compare against a stored JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="Slowdown vs baseline that fails the run")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as stored:
+            baseline = {(b["samples"], b["molecules"]): b["stages"]
+                        for b in json.load(stored)["results"]}
+
+    results = []
+    slower = False
+    for samples in (int(n) for n in args.samples.split(",")):
+        result = benchmark(samples, args.molecules, args.pages_per_sample,
+                           args.repeat, not args.no_memory, args.backend)
+        previous = baseline.get((samples, args.molecules))
+        report(result, previous)
+        results.append(result)
+        if previous:
+            slower |= any(result["stages"][name]["wall"] >
+                          args.tolerance * previous[name]["wall"]
+                          for name in STAGES)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as out:
+            json.dump({"python": sys.version.split()[0],
+                       "results": results}, out, indent=1)
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Runs server.py on a free local port and converts synthetic reports through
+it from concurrent clients, as a CI check of the service.
+
+    python benchmarks/server_load.py --requests 24 --clients 8 --workers 2
+
+The JSON answer must match read_pdf, every request must get either its
+result or a 503 once the queue is full, and /metrics must count them all.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_report  # noqa: E402
+from pdf_to_dict import read_pdf  # noqa: E402
+from server import make_server  # noqa: E402
+
+
+def request(url, data=None):
+    """
+    :return: Tuple (HTTP status, headers, body)
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(
+                url, data=data), timeout=300) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "sequence.pdf")
+        write_report(path, samples=args.samples)
+        with open(path, "rb") as pdf:
+            data = pdf.read()
+
+        start = time.perf_counter()
+        server = make_server(port=0, workers=args.workers,
+                             queue_limit=args.queue, quiet=True)
+        print(f"warm pool of {args.workers} in "
+              f"{time.perf_counter() - start:.2f} s at {server.url}")
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            status, _, body = request(server.url + "/health")
+            failed |= status != 200
+
+            status, headers, body = request(
+                server.url + "/convert?format=json&name=sequence.pdf", data)
+            result, molecule_names = read_pdf(path)
+            # JSON keys are strings, so compare through JSON as well
+            expected = json.loads(json.dumps(
+                {"molecules": molecule_names, "result": result}))
+            if status != 200 or json.loads(body.decode("utf-8")) != expected:
+                print(f"FAIL: JSON answer differs ({status})")
+                failed = True
+
+            status, headers, body = request(server.url + "/convert", data)
+            if status != 200 or not body.startswith(b"PK"):
+                print(f"FAIL: no workbook ({status})")
+                failed = True
+
+            status, _, _ = request(server.url + "/convert", b"not a pdf")
+            if status != 422:
+                print(f"FAIL: broken PDF answered {status}")
+                failed = True
+
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(args.clients) as pool:
+                statuses = list(pool.map(
+                    lambda _: request(server.url + "/convert", data)[0],
+                    range(args.requests)))
+            elapsed = time.perf_counter() - start
+            ok = statuses.count(200)
+            busy = statuses.count(503)
+            print(f"{args.requests} requests from {args.clients} clients in "
+                  f"{elapsed:.2f} s: {ok} converted, {busy} rejected")
+            if ok + busy != args.requests or not ok:
+                print(f"FAIL: unexpected statuses {sorted(set(statuses))}")
+                failed = True
+            if args.clients > args.queue and not busy:
+                print("FAIL: the queue limit never rejected a request")
+                failed = True
+
+            # A request leaves the queue just after its answer is sent
+            deadline = time.perf_counter() + 5
+            while True:
+                _, _, body = request(server.url + "/metrics")
+                metrics = json.loads(body.decode("utf-8"))
+                if not metrics["pending"] or time.perf_counter() > deadline:
+                    break
+                time.sleep(0.01)
+            print(json.dumps(metrics, indent=1))
+            if metrics["requests"] != ok + 3 or \
+                    metrics["rejected"] != busy or metrics["pending"]:
+                print("FAIL: metrics do not add up")
+                failed = True
+        finally:
+            server.shutdown()
+            server.server_close()
+    if failed:
+        print("FAIL")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
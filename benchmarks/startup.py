@@ -0,0 +1,86 @@
+"""
+Checks the startup of the command line tools and the GUI with python -X
+importtime: none of them may import the converter before it is used, and
+their imports must fit in a time budget.
+
+    python benchmarks/startup.py --budget 100 --runs 5
+
+For each entry point it prints the best of the runs of the total import
+time, the slowest modules, and fails if NumPy, pdfminer, xlsxwriter or
+pyarrow were imported or the budget was exceeded.
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name: arguments after python -X importtime
+ENTRY_POINTS = {
+    "cli --help": ["cli.py", "--help"],
+    "watcher --help": ["watcher.py", "--help"],
+    "server --help": ["server.py", "--help"],
+    "parse_cache --help": ["parse_cache.py", "--help"],
+    # The window module without opening it, needs PyQt5
+    "main (GUI)": ["-c", "import main"],
+}
+HEAVY_MODULES = ("numpy", "pdfminer", "xlsxwriter", "pyarrow")
+DEFAULT_BUDGET_MS = 100.0
+
+
+def import_times(args):
+    """
+    :return: List of (module, self microseconds) imported by running python
+             with args
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args, cwd=ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(own)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Milliseconds of imports allowed per entry point")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=3,
+                        help="Slowest modules shown per entry point")
+    args = parser.parse_args()
+
+    failed = False
+    for label, entry in ENTRY_POINTS.items():
+        if label.startswith("main") and not importlib.util.find_spec("PyQt5"):
+            print(f"{label:20s} skipped, PyQt5 is not installed")
+            continue
+        runs = [import_times(entry) for _ in range(args.runs)]
+        best = min(runs, key=lambda times: sum(own for _, own in times))
+        total = sum(own for _, own in best) / 1000
+        heavy = sorted({name.split(".")[0] for name, _ in best} &
+                       set(HEAVY_MODULES))
+        slowest = ", ".join(f"{name} {own / 1000:.1f}" for name, own in
+                            sorted(best, key=lambda item: -item[1])[:args.top])
+        print(f"{label:20s} {total:7.1f} ms  ({slowest})")
+        if heavy:
+            print(f"FAIL: {label} imports {', '.join(heavy)}")
+            failed = True
+        if total > args.budget:
+            print(f"FAIL: {label} over the budget of {args.budget:.0f} ms")
+            failed = True
+    if failed:
+        print("FAIL")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+Synthetic HPLC sequence reports, laid out the way read_pdf expects them.
+
+The PDFs are written by hand with a single Type1 font, so no extra
+dependencies are needed. Each injection is one page (or more, see
+pages_per_sample) with a "Sample Name" or "Nombre de la muestra" header and
+a peak table whose header holds the "Name" and "Area" columns.
+
+    python benchmarks/synthetic.py report.pdf --samples 300 --molecules 12
+"""
+import argparse
+import random
+
+MOLECULES = ["Glucosa", "Fructosa", "Sacarosa", "Glicerol", "Etanol",
+             "Acido acetico", "Acido lactico", "Acido succinico",
+             "Acido 2 oxo glutarico", "Xilosa", "Arabinosa", "Manitol",
+             "Acido formico", "Acido piruvico", "Acido malico",
+             "Acido citrico"]
+INTERNAL_STANDARD = "Ribitol_IS"
+HEADERS = {"en": ("Sample Name", "Vial Type"),
+           "es": ("Nombre de la muestra", "Tipo")}
+
+
+def molecule_names(molecules):
+    """
+    :return: molecules names, reusing the list above with a numeric suffix
+             when more are requested
+    """
+    names = []
+    for i in range(molecules):
+        base = MOLECULES[i % len(MOLECULES)]
+        names.append(base if i < len(MOLECULES) else
+                     f"{base} {i // len(MOLECULES)}")
+    return names
+
+
+def _decimal(value, digits):
+    return f"{value:.{digits}f}".replace(".", ",")
+
+
+def _table(names, areas, concentrations=None):
+    header = "No. Ret.Time Name Area Height Conc"
+    rows = [header]
+    for n, (name, area) in enumerate(zip(names, areas), 1):
+        conc = concentrations[n - 1] if concentrations else 0.0
+        rows.append(f"{n} {2.5 + 0.7 * n:.2f} {name} {_decimal(area, 3)} "
+                    f"{int(area / 9)} {_decimal(conc, 2)}")
+    return rows
+
+
+def report_pages(samples=50, molecules=8, standards=5, pages_per_sample=1,
+                 language="mixed", internal_standard=True, seed=0,
+                 blank_every=0, unnamed_every=0):
+    """
+    Builds the text lines of every page of a synthetic sequence report
+
+    :param samples: Number of sample injections
+    :param molecules: Peaks per injection, some of them with long names
+                      containing spaces
+    :param standards: Calibration levels. The last one spans two pages, the
+                      second without the std vial type, as multi-page
+                      standards do in real reports
+    :param pages_per_sample: Pages each sample table is split across
+    :param language: "en", "es" or "mixed" headers
+    :param internal_standard: Whether to add a _IS peak to every sample
+    :param blank_every: When set, the blank page is repeated, identical,
+                        after every that many samples
+    :param unnamed_every: When set, a page without sample name holding a
+                          summary table goes before every that many
+                          samples. read_pdf reads its text as part of the
+                          next page.
+    :return: List of pages, each a list of lines
+    """
+    rng = random.Random(seed)
+    names = molecule_names(molecules)
+    slopes = [rng.uniform(50, 500) for _ in names]
+    pages = []
+
+    def header(i):
+        lang = language if language != "mixed" else ("en", "es")[i % 2]
+        return HEADERS[lang]
+
+    for level in range(1, standards + 1):
+        sample_label, vial_label = header(level)
+        conc = [float(level) for _ in names]
+        areas = [slope * c + rng.uniform(-5, 5) for slope, c in
+                 zip(slopes, conc)]
+        # Standards are named after their level, the vial type marks them
+        title = [f"{sample_label}: Cal {level}", f"{vial_label}: std",
+                 "Injection Volume: 10,0", ""]
+        if level == standards and molecules > 1:
+            half = molecules // 2
+            pages.append(title + _table(names[:half], areas[:half],
+                                        conc[:half]) + [""])
+            pages.append([f"{sample_label}: Cal {level}", ""] +
+                         _table(names[half:], areas[half:], conc[half:]) +
+                         [""])
+        else:
+            pages.append(title + _table(names, areas, conc) + [""])
+
+    blank_label, _ = header(0)
+    blank = [f"{blank_label}: BCO", "", "No. Ret.Time Name Area Height",
+             "1 1,00 Ruido 1,000 1", ""]
+    pages.append(blank)
+
+    for s in range(samples):
+        if blank_every and s and s % blank_every == 0:
+            pages.append(blank)
+        if unnamed_every and s and s % unnamed_every == 0:
+            pages.append(["Resumen de la secuencia", "",
+                          "No. Ret.Time Name Area Height",
+                          f"1 1,00 Ruido {_decimal(s, 3)} 1", ""])
+        sample_label, vial_label = header(s)
+        sample_names = list(names)
+        areas = [slope * rng.uniform(0.1, standards) for slope in slopes]
+        if internal_standard:
+            sample_names.append(INTERNAL_STANDARD)
+            areas.append(rng.uniform(900, 1100))
+        per_page = -(-len(sample_names) // pages_per_sample)
+        for p in range(pages_per_sample):
+            chunk = slice(p * per_page, (p + 1) * per_page)
+            if not sample_names[chunk]:
+                break
+            pages.append([f"{sample_label}: Muestra {s + 1}",
+                          f"{vial_label}: sample", ""] +
+                         _table(sample_names[chunk], areas[chunk]) + [""])
+    return pages
+
+
+# ToUnicode map of the TrueType fonts, single byte codes map to Latin-1
+TO_UNICODE = b"""/CIDInit /ProcSet findresource begin
+12 dict begin
+begincmap
+/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def
+/CMapName /Adobe-Identity-UCS def
+/CMapType 2 def
+1 begincodespacerange
+<00> <FF>
+endcodespacerange
+2 beginbfrange
+<20> <7E> <0020>
+<A0> <FF> <00A0>
+endbfrange
+endcmap
+CMapName currentdict /CMap defineresource pop
+end
+end"""
+TRUETYPE_FONTS = ("Arial", "Arial,Bold", "Arial,Italic")
+
+
+def _truetype_font(add, name):
+    """
+    Adds a non-embedded TrueType font with explicit widths and a ToUnicode
+    map, as office printers emit them
+
+    :return: Object number of the font dictionary
+    """
+    widths = b" ".join(b"278" if code == 32 else b"556"
+                       for code in range(32, 256))
+    descriptor = add(
+        b"<< /Type /FontDescriptor /FontName /%s /Flags 32 "
+        b"/FontBBox [-665 -325 2000 1006] /ItalicAngle 0 /Ascent 905 "
+        b"/Descent -212 /CapHeight 716 /StemV 80 >>" % name.encode())
+    cmap = add(b"<< /Length %d >>\nstream\n" % len(TO_UNICODE) + TO_UNICODE +
+               b"\nendstream")
+    return add(
+        b"<< /Type /Font /Subtype /TrueType /BaseFont /%s "
+        b"/FirstChar 32 /LastChar 255 /Widths [%s] /FontDescriptor %d 0 R "
+        b"/Encoding /WinAnsiEncoding /ToUnicode %d 0 R >>"
+        % (name.encode(), widths, descriptor, cmap))
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(pages, path, truetype=False):
+    """
+    Writes each page as lines of Helvetica text from the top of an A4 page
+
+    :param truetype: Use TrueType fonts with widths and ToUnicode maps in a
+                     resource dictionary shared by every page, which is
+                     closer to what the instrument prints
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    if truetype:
+        fonts = [_truetype_font(add, name) for name in TRUETYPE_FONTS]
+        resources = b"%d 0 R" % add(
+            b"<< /Font << " +
+            b" ".join(b"/F%d %d 0 R" % (n, font)
+                      for n, font in enumerate(fonts, 1)) +
+            b" >> >>")
+    else:
+        font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                   b"/Encoding /WinAnsiEncoding >>")
+        resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+    pages_id = add(None)
+    kids = []
+    for lines in pages:
+        content = ["BT /F1 9 Tf 11 TL 36 800 Td"]
+        for line in lines:
+            content.append(f"({_escape(line)}) Tj T*")
+        content.append("ET")
+        data = "\n".join(content).encode("cp1252")
+        stream = add(b"<< /Length %d >>\nstream\n" % len(data) + data +
+                     b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources %s /Contents %d 0 R >>"
+            % (pages_id, resources, stream)))
+    objects[pages_id - 1] = (
+        b"<< /Type /Pages /Kids [" +
+        b" ".join(b"%d 0 R" % kid for kid in kids) +
+        b"] /Count %d >>" % len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += (b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, catalog, xref))
+    with open(path, "wb") as pdf:
+        pdf.write(out)
+    return len(pages)
+
+
+def write_report(path, truetype=False, **kwargs):
+    """
+    Writes a synthetic report to path, see report_pages for the options and
+    write_pdf for truetype
+
+    :return: Number of pages written
+    """
+    return write_pdf(report_pages(**kwargs), path, truetype)
+
+
+def synthetic_processed(samples, molecules, standards=6):
+    """
+    Builds a read_pdf result directly, without going through a PDF
+
+    :return: (processed, molecule_names) shaped like read_pdf's output
+    """
+    names = [f"Molecula {i:03d}" for i in range(molecules)]
+    processed = {"samples": {}, "standards": {}, "int_standards": {}}
+    for i, name in enumerate(names):
+        processed["standards"][name] = {
+            float(c): 1000.0 * c * (i + 1) + 15.0
+            for c in range(1, standards + 1)}
+    for s in range(samples):
+        processed["samples"][f"Muestra {s}"] = {
+            name: 10.0 + (s * 7 + i * 13) % 5000
+            for i, name in enumerate(names)}
+        processed["int_standards"][f"Muestra {s}"] = {
+            INTERNAL_STANDARD: 2000.0 + s % 100}
+    return processed, sorted(names + [INTERNAL_STANDARD])
+
+
+def chromatogram(points=200000, peaks=8, channels=1, duration=30.0,
+                 noise=0.2, seed=0):
+    """
+    Raw detector signal with Gaussian peaks over a drifting baseline
+
+    :param points: Samples per channel
+    :param peaks: Peaks per channel, evenly spread over the run
+    :param duration: Minutes of the run
+    :return: Tuple (time array, (channels x points) signal array, list of
+             (center, sigma, height) of the peaks of the first channel)
+    """
+    import numpy as np
+    rng = np.random.RandomState(seed)
+    time = np.linspace(0, duration, points)
+    signals = np.empty((channels, points))
+    first = None
+    for channel in range(channels):
+        centers = (np.arange(peaks) + 0.5 + rng.uniform(-0.2, 0.2, peaks)) \
+            * duration / peaks
+        # Peaks a few seconds wide, never wider than their share of the run
+        sigmas = np.minimum(rng.uniform(0.02, 0.06, peaks),
+                            duration / peaks / 12)
+        heights = rng.uniform(20, 500, peaks)
+        baseline = 2 + 3 * time / duration + 0.5 * np.sin(time / duration * 6)
+        signal = baseline + rng.normal(0, noise, points)
+        for center, sigma, height in zip(centers, sigmas, heights):
+            lo, hi = np.searchsorted(time, (center - 8 * sigma,
+                                            center + 8 * sigma))
+            signal[lo:hi] += height * np.exp(
+                -0.5 * ((time[lo:hi] - center) / sigma) ** 2)
+        signals[channel] = signal
+        if first is None:
+            first = list(zip(centers.tolist(), sigmas.tolist(),
+                             heights.tolist()))
+    return time, signals, first
+
+
+def write_ctx(path, chunk_points=100000, **kwargs):
+    """
+    Writes a chromatogram as the instrument exports it: ";" separated
+    columns with decimal commas below a header line. See chromatogram for
+    the options.
+
+    :return: The peaks of chromatogram
+    """
+    time, signals, peaks = chromatogram(**kwargs)
+    header = ["Tiempo (min)"] + [f"Canal {chr(65 + i)} (mAU)"
+                                 for i in range(len(signals))]
+    with open(path, "w", encoding="utf-8", newline="\n") as ctx:
+        ctx.write(";".join(header) + "\n")
+        for start in range(0, len(time), chunk_points):
+            stop = start + chunk_points
+            columns = [time[start:stop].tolist()] + \
+                [signal[start:stop].tolist() for signal in signals]
+            ctx.write("".join(
+                ";".join(f"{value:.5f}" for value in row).replace(".", ",")
+                + "\n" for row in zip(*columns)))
+    return peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("path")
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--molecules", type=int, default=8)
+    parser.add_argument("--standards", type=int, default=5)
+    parser.add_argument("--pages-per-sample", type=int, default=1)
+    parser.add_argument("--language", choices=("en", "es", "mixed"),
+                        default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    pages = write_report(args.path, samples=args.samples,
+                         molecules=args.molecules, standards=args.standards,
+                         pages_per_sample=args.pages_per_sample,
+                         language=args.language, seed=args.seed)
+    print(f"{args.path}: {pages} pages")
+
+
+if __name__ == '__main__':
+    main()
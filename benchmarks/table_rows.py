@@ -0,0 +1,110 @@
+"""
+Micro-benchmark of pdf_to_dict.table_rows against the parser it replaced,
+which collapsed spaces with a regex on every line and rebuilt each row of a
+wider-than-header table by popping from lists into a dict.
+
+    python benchmarks/table_rows.py --rows 100000
+
+Both parsers read the page texts of a synthetic report and must give the
+same rows.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import report_pages  # noqa: E402
+from pdf_to_dict import table_rows  # noqa: E402
+
+
+def reference_table_rows(text):
+    """
+    table_rows as it was before TableLayout
+    """
+    data_section = False
+    started_saving_data = False
+    col_names = None
+    for line in text.split("\n"):
+        if all(i in line for i in ("Area", "Name")):
+            col_names = [i for i in line.split(" ") if not i.isdigit()]
+            data_section = True
+            continue
+        if data_section:
+            if line == "" and started_saving_data:
+                break
+
+            line = re.sub(' +', ' ', line).strip()
+            vals = [i for i in line.split(" ") if i != ""]
+            if len(vals) < 3 and started_saving_data:
+                break
+            if len(vals) < len(col_names):
+                continue
+            if len(vals) > len(col_names):
+                started_saving_data = True
+                col_names_ = col_names[:]
+                positive_name_col_idx = col_names_.index("Name")
+                reverse_name_col_idx = positive_name_col_idx - len(
+                    col_names_) + 1
+                line_dict = {}
+                for positive_idx in range(positive_name_col_idx):
+                    col_name, value = col_names_.pop(0), vals.pop(0)
+                    line_dict[col_name] = value
+                for negative_idx in range(reverse_name_col_idx, 0):
+                    col_name = col_names_.pop(negative_idx)
+                    value = vals.pop(negative_idx)
+                    line_dict[col_name] = value
+                if len(vals) > 0 and len(col_names_) > 0:
+                    line_dict["Name"] = " ".join(vals)
+            else:
+                started_saving_data = True
+                line_dict = {k: v for k, v in zip(col_names, vals)}
+            if "Name" in line_dict and "Area" in line_dict:
+                conc = line_dict.get("Conc")
+                if conc is None:
+                    conc = list(line_dict.values())[-1]
+                yield line_dict["Name"], line_dict["Area"], conc
+
+
+def _time(parser, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = [row for text in texts for row in parser(text)]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--molecules", type=int, default=16,
+                        help="Rows per page, half of them with long names")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = ["\n".join(page) + "\n\f"
+             for page in report_pages(samples=args.rows // args.molecules,
+                                      molecules=args.molecules)]
+    reference_time, reference = _time(reference_table_rows, texts,
+                                      args.repeat)
+    compiled_time, compiled = _time(table_rows, texts, args.repeat)
+    print(f"{len(reference)} rows in {len(texts)} pages")
+    print(f"reference {reference_time:.3f} s, "
+          f"{1e6 * reference_time / len(reference):.2f} us/row")
+    print(f"compiled  {compiled_time:.3f} s, "
+          f"{1e6 * compiled_time / len(compiled):.2f} us/row "
+          f"({reference_time / compiled_time:.1f}x)")
+    if compiled != reference:
+        print("FAIL: rows differ")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Compares the peak memory of write_workbook with and without constant_memory.
+
+Each mode runs in a fresh child process writing the same synthetic sequence,
+and the child reports its own peak RSS.
+
+    python benchmarks/xlsx_memory.py --samples 5000 --molecules 40
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def child(mode, samples, molecules):
+    from dict_to_xl import write_workbook
+    from peak_table import PeakTable
+    from synthetic import synthetic_processed
+    table = PeakTable.from_processed(*synthetic_processed(samples, molecules))
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        res = write_workbook(table, os.path.join(folder, "bench.xlsx"),
+                             report_od=True,
+                             constant_memory=mode == "constant")
+        elapsed = time.perf_counter() - start
+    print(f"{res} {elapsed:.3f} {peak_rss_mb()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--molecules", type=int, default=20)
+    parser.add_argument("--child", choices=("default", "constant"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.samples, args.molecules)
+        return
+
+    print(f"{args.samples} samples x {args.molecules} molecules")
+    for mode in ("default", "constant"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", mode,
+             "--samples", str(args.samples),
+             "--molecules", str(args.molecules)],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True)
+        res, elapsed, rss = out.stdout.split()[-3:]
+        rss = "n/a" if rss == "None" else f"{float(rss):.1f} MB"
+        print(f"{mode:>9}: status {res}, {float(elapsed):.2f} s, "
+              f"peak RSS {rss}")
+
+
+if __name__ == '__main__':
+    main()
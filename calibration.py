@@ -0,0 +1,449 @@
+from collections import namedtuple
+import numpy as np
+from peak_table import STANDARD
+
+
+class Calibrations:
+    """
+    Straight-line calibration of every molecule of a PeakTable. All
+    attributes are arrays indexed like table.molecule_names:
+        points:        number of standards
+        fitted:        whether there were enough standards for a fit
+        slope:         m of y = m x + n
+        intercept:     n of y = m x + n
+        r2:            squared Pearson correlation of the standards
+        ss_residuals:  sum of squared residuals of the fit with intercept
+        slope_zero:    m of the fit forced through the origin
+        r2_zero:       R² of the fit forced through the origin
+        negative:      whether some positive sample area would give a
+                       negative concentration with the intercept fit
+        zero_intercept: whether the sheet should use the fit through the
+                       origin, as dict_to_xlsx does when negative is set
+        curvature:     c of y = m x + n + c x², 0 but for quadratic models
+    plus residuals, aligned with table.standard_rows, and concentrations, a
+    (samples x molecules) matrix aligned with table.sample_areas().
+
+    quality is the QualityFit of the same curves, with their diagnostics.
+    model is None for the straight line above, or the CalibrationModel
+    whose QualityFit gives slope, intercept, r2 and concentrations instead,
+    see use_quality.
+    """
+
+    def __init__(self, table, standard_rows, points, slope, intercept, r2,
+                 residuals, ss_residuals, slope_zero, r2_zero, negative,
+                 concentrations):
+        self.table = table
+        self.standard_rows = standard_rows
+        self.points = points
+        self.fitted = points >= 2
+        self.slope = slope
+        self.intercept = intercept
+        self.r2 = r2
+        self.residuals = residuals
+        self.ss_residuals = ss_residuals
+        self.slope_zero = slope_zero
+        self.r2_zero = r2_zero
+        self.negative = negative
+        self.zero_intercept = negative
+        self.concentrations = concentrations
+        self.curvature = np.zeros(len(points))
+        self.quality = None
+        self.model = None
+
+    def use_quality(self, quality):
+        """
+        Takes the curves of a QualityFit instead of the straight line, with
+        no fallback to the fit through the origin
+        """
+        self.quality = quality
+        self.model = quality.model
+        self.fitted = quality.fitted
+        self.intercept = quality.coefficients[:, 0]
+        self.slope = quality.coefficients[:, 1]
+        self.curvature = quality.coefficients[:, 2]
+        self.r2 = quality.r2
+        self.negative = quality.negative & quality.fitted
+        self.zero_intercept = np.zeros_like(self.negative)
+        self.concentrations = quality.concentrations
+
+    def parameters(self, molecule):
+        """
+        :return: Tuple (m, n) actually used for the molecule
+        """
+        if not isinstance(molecule, (int, np.integer)):
+            molecule = self.table.molecule_index[molecule]
+        if self.zero_intercept[molecule]:
+            return self.slope_zero[molecule], 0.0
+        return self.slope[molecule], self.intercept[molecule]
+
+
+def fit_calibrations(table, model=None):
+    """
+    Fits the standard curve of every molecule of the table at once, both
+    with and without intercept, using per-molecule sums instead of one
+    least-squares problem per molecule
+
+    :param table: PeakTable
+    :param model: Optional CalibrationModel, or a (weighting, degree,
+                  reject_outliers) tuple, whose curves replace the straight
+                  line. Its diagnostics are computed either way.
+    :return: Calibrations
+    """
+    n_molecules = len(table.molecule_names)
+    standard_rows = np.flatnonzero(table.kind == STANDARD)
+    mol = table.molecule[standard_rows]
+    x = table.conc[standard_rows]
+    y = table.area[standard_rows]
+
+    def per_molecule(values):
+        return np.bincount(mol, weights=values, minlength=n_molecules)
+
+    points = np.bincount(mol, minlength=n_molecules)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Centered sums keep the fit stable for large areas
+        x_mean = per_molecule(x) / points
+        y_mean = per_molecule(y) / points
+        dx = x - x_mean[mol]
+        dy = y - y_mean[mol]
+        sxx = per_molecule(dx * dx)
+        syy = per_molecule(dy * dy)
+        sxy = per_molecule(dx * dy)
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean
+        r2 = sxy * sxy / (sxx * syy)
+        residuals = y - (slope[mol] * x + intercept[mol])
+        ss_residuals = per_molecule(residuals * residuals)
+
+        slope_zero = per_molecule(x * y) / per_molecule(x * x)
+        residuals_zero = y - slope_zero[mol] * x
+        r2_zero = 1 - per_molecule(residuals_zero * residuals_zero) / \
+            per_molecule(y * y)
+
+        # Only positive areas are checked, a missing peak reads as 0
+        areas = table.sample_areas()
+        estimated = (areas - intercept) / slope
+        negative = np.any((areas > 0) & (estimated < 0), axis=0)
+    fitted = points >= 2
+    # A degenerate fit (e.g. a single concentration) cannot be trusted either
+    negative |= fitted & ~(np.isfinite(slope) & np.isfinite(intercept))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zero_estimated = areas / slope_zero
+    concentrations = np.where(negative, zero_estimated, estimated)
+    concentrations = np.where(areas == 0, 0.0, concentrations)
+    concentrations[:, ~fitted] = np.nan
+    calibrations = Calibrations(table, standard_rows, points, slope,
+                                intercept, r2, residuals, ss_residuals,
+                                slope_zero, r2_zero, negative & fitted,
+                                concentrations)
+    if model is None:
+        calibrations.quality = fit_quality(table)
+    else:
+        calibrations.use_quality(fit_quality(table, CalibrationModel(*model)))
+    return calibrations
+
+
+NO_WEIGHTING = "none"
+INVERSE_X = "1/x"
+INVERSE_X2 = "1/x2"
+AUTO_WEIGHTING = "auto"
+WEIGHTINGS = (NO_WEIGHTING, INVERSE_X, INVERSE_X2)
+LINEAR = 1
+QUADRATIC = 2
+# Externally studentized residuals beyond this mark a standard as an outlier
+STUDENTIZED_LIMIT = 3.0
+# LOD and LOQ in residual standard deviations over the slope (ICH Q2)
+LOD_FACTOR = 3.3
+LOQ_FACTOR = 10.0
+# Largest relative error of a back-calculated standard in the linear range
+RANGE_TOLERANCE = 0.15
+
+WEIGHTING_LABELS = {NO_WEIGHTING: "sin ponderar", INVERSE_X: "ponderado 1/x",
+                    INVERSE_X2: "ponderado 1/x²"}
+DEGREE_LABELS = {LINEAR: "Lineal", QUADRATIC: "Cuadrático"}
+
+# weighting: one of WEIGHTINGS, or AUTO_WEIGHTING to pick, per molecule, the
+# one whose standards back-calculate with the smallest relative error.
+# reject_outliers: drop the worst standard of each curve when its
+# studentized residual is beyond STUDENTIZED_LIMIT, and fit again.
+CalibrationModel = namedtuple("CalibrationModel",
+                              ["weighting", "degree", "reject_outliers"])
+CalibrationModel.__new__.__defaults__ = (NO_WEIGHTING, LINEAR, False)
+
+
+def padded_standards(table):
+    """
+    :param table: PeakTable
+    :return: Tuple (conc, area, valid) of (molecules x most standards)
+             arrays. Each row holds the standards of one molecule in the
+             order of PeakTable.standards, padded with NaN where valid is
+             False.
+    """
+    n_molecules = len(table.molecule_names)
+    rows = np.flatnonzero(table.kind == STANDARD)
+    mol, x, y = table.molecule[rows], table.conc[rows], table.area[rows]
+    order = np.lexsort((rows, x, mol))
+    mol, x, y = mol[order], x[order], y[order]
+    counts = np.bincount(mol, minlength=n_molecules)
+    # At least one column, so that reductions over standards are defined
+    width = max(1, int(counts.max()) if n_molecules else 1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    position = np.arange(len(mol)) - starts[mol] if n_molecules else mol
+    conc = np.full((n_molecules, width), np.nan)
+    area = np.full((n_molecules, width), np.nan)
+    valid = np.zeros((n_molecules, width), dtype=bool)
+    conc[mol, position] = x
+    area[mol, position] = y
+    valid[mol, position] = True
+    return conc, area, valid
+
+
+def inverse(coefficients, areas):
+    """
+    Concentrations giving areas on y = c0 + c1 x + c2 x², through the root
+    that reduces to (y - c0) / c1 when c2 is 0
+
+    :param coefficients: (..., 3) array of c0, c1, c2, broadcast against
+                         areas
+    """
+    c0, c1, c2 = coefficients[..., 0], coefficients[..., 1], \
+        coefficients[..., 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        signal = areas - c0
+        return 2 * signal / (c1 + np.sqrt(c1 * c1 + 4 * c2 * signal))
+
+
+def _weights(conc, valid, weighting):
+    """
+    Standards of zero concentration get no weight under 1/x and 1/x²
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if weighting == INVERSE_X:
+            weights = 1 / np.abs(conc)
+        elif weighting == INVERSE_X2:
+            weights = 1 / (conc * conc)
+        elif weighting == NO_WEIGHTING:
+            weights = np.ones_like(conc)
+        else:
+            raise ValueError(f"Unknown weighting {weighting!r}")
+    return np.where(valid & np.isfinite(weights), weights, 0.0)
+
+
+def _weighted_fit(conc, area, weights, degree):
+    """
+    Weighted least squares of every row at once, through the normal
+    equations of each row solved as one stack, with leave-one-out
+    diagnostics from the hat matrix instead of refitting
+
+    :return: Dict of arrays, see QualityFit
+    """
+    terms = degree + 1
+    used = weights > 0
+    n = used.sum(axis=1)
+    x = np.where(used, conc, 0.0)
+    y = np.where(used, area, 0.0)
+    # Concentrations scaled to [-1, 1] per curve keep the system well
+    # conditioned for quadratic fits
+    scale = np.abs(x).max(axis=1)
+    scale[scale == 0] = 1.0
+    design = (x / scale[:, None])[..., None] ** np.arange(terms)
+    normal = np.einsum("mkp,mk,mkq->mpq", design, weights, design)
+    rhs = np.einsum("mkp,mk,mk->mp", design, weights, y)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # Rows that cannot be solved get an identity system and NaN results
+        solvable = (n >= terms) & (np.abs(np.linalg.det(normal)) > 1e-12 *
+                                   np.abs(normal).max(axis=(1, 2)) ** terms)
+        normal[~solvable] = np.eye(terms)
+        inverted = np.linalg.inv(normal)
+        scaled = np.einsum("mpq,mq->mp", inverted, rhs)
+        scaled[~solvable] = np.nan
+        coefficients = np.zeros((len(conc), 3))
+        coefficients[:, :terms] = scaled / scale[:, None] ** np.arange(terms)
+
+        fitted = np.einsum("mkp,mp->mk", design, scaled)
+        residuals = np.where(used, y - fitted, np.nan)
+        leverage = np.einsum("mkp,mpq,mkq->mk", design, inverted,
+                             design) * weights
+        weighted = np.sqrt(weights) * np.where(used, residuals, 0.0)
+        dof = n - terms
+        ss = (weighted * weighted).sum(axis=1)
+        w_total = weights.sum(axis=1)
+        y_mean = (weights * y).sum(axis=1) / w_total
+        spread = (weights * (y - y_mean[:, None]) ** 2).sum(axis=1)
+        # Rounding noise of exact fits must not read as large residuals
+        floor = (1e-9 * spread / np.maximum(n, 1))[:, None]
+        variance = ss / dof
+        internal = weighted / np.sqrt(np.maximum(variance[:, None], floor) *
+                                      (1 - leverage))
+        cooks = internal * internal * leverage / (terms * (1 - leverage))
+        loo_variance = (ss[:, None] - weighted * weighted / (1 - leverage)) \
+            / (dof[:, None] - 1)
+        studentized = weighted / np.sqrt(np.maximum(loo_variance, floor) *
+                                         (1 - leverage))
+        r2 = 1 - ss / spread
+        # Unweighted, in area units, for LOD and LOQ
+        residual_sd = np.sqrt(np.nansum(np.where(used, residuals, 0.0) ** 2,
+                                        axis=1) / dof)
+        back = inverse(coefficients[:, None, :], area)
+        relative_error = np.where(np.isfinite(conc) & (conc != 0),
+                                  (back - conc) / conc, np.nan)
+    missing = ~used
+    for values in (cooks, studentized):
+        values[missing] = np.nan
+    # Leaving one point out of a curve without spare points leaves no
+    # variance to studentize with
+    studentized[dof <= 1] = np.nan
+    bad = ~solvable | (dof <= 0)
+    r2[bad] = np.nan
+    residual_sd[bad] = np.nan
+    return {"coefficients": coefficients, "used": used, "points": n,
+            "residuals": residuals, "leverage": np.where(used, leverage,
+                                                         np.nan),
+            "studentized": studentized, "cooks": cooks, "r2": r2,
+            "residual_sd": residual_sd, "relative_error": relative_error,
+            "solvable": solvable}
+
+
+def _fit_model(conc, area, valid, weighting, degree, reject_outliers):
+    weights = _weights(conc, valid, weighting)
+    fit = _weighted_fit(conc, area, weights, degree)
+    rejected = np.zeros_like(valid)
+    if reject_outliers and conc.size:
+        magnitude = np.nan_to_num(np.abs(fit["studentized"]))
+        worst = np.argmax(magnitude, axis=1)
+        rows = np.arange(len(conc))
+        # Enough standards must remain to judge the curve again
+        drop = (magnitude[rows, worst] > STUDENTIZED_LIMIT) & \
+            (fit["points"] - 1 >= degree + 3)
+        rejected[rows[drop], worst[drop]] = True
+        if drop.any():
+            fit = _weighted_fit(conc, area, np.where(rejected, 0.0, weights),
+                                degree)
+    fit["rejected"] = rejected
+    return fit
+
+
+class QualityFit:
+    """
+    Calibration curves of every molecule of a PeakTable under a
+    CalibrationModel, with their diagnostics. Per molecule arrays:
+        weighting:      weighting used (the chosen one with AUTO_WEIGHTING)
+        coefficients:   (molecules x 3) c0, c1, c2 of y = c0 + c1 x + c2 x²
+        points:         standards used in the fit
+        fitted:         whether the curve could be fitted
+        r2:             weighted coefficient of determination
+        residual_sd:    standard deviation of the area residuals
+        lod, loq:       LOD_FACTOR and LOQ_FACTOR residual_sd over c1
+        range_low, range_high: concentrations of the lowest and highest
+                        standards above the LOQ that back-calculate within
+                        RANGE_TOLERANCE
+    and per standard arrays of (molecules x most standards), aligned with
+    padded_standards: conc, area, valid, used, rejected (outliers left out
+    of the fit), residuals, relative_error (of the back-calculated
+    concentration), studentized (externally, leave-one-out) and cooks
+    (Cook's distance). concentrations is a (samples x molecules) matrix
+    aligned with table.sample_areas().
+    """
+
+    def __init__(self, table, model, weighting, degree, fit, conc, area,
+                 valid):
+        self.table = table
+        self.model = model
+        self.weighting = weighting
+        self.degree = degree
+        self.conc = conc
+        self.area = area
+        self.valid = valid
+        self.coefficients = fit["coefficients"]
+        self.used = fit["used"]
+        self.rejected = fit["rejected"]
+        self.points = fit["points"]
+        self.fitted = fit["solvable"] & (self.points >= degree + 1)
+        self.r2 = fit["r2"]
+        self.residual_sd = fit["residual_sd"]
+        self.residuals = fit["residuals"]
+        self.relative_error = fit["relative_error"]
+        self.studentized = fit["studentized"]
+        self.cooks = fit["cooks"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = self.coefficients[:, 1]
+            self.lod = LOD_FACTOR * self.residual_sd / slope
+            self.loq = LOQ_FACTOR * self.residual_sd / slope
+            in_range = self.used & (np.abs(self.relative_error) <=
+                                    RANGE_TOLERANCE) & \
+                (conc >= np.where(np.isnan(self.loq), np.inf,
+                                  self.loq)[:, None])
+        low = np.where(in_range, conc, np.inf).min(axis=1)
+        high = np.where(in_range, conc, -np.inf).max(axis=1)
+        self.range_low = np.where(np.isfinite(low), low, np.nan)
+        self.range_high = np.where(np.isfinite(high), high, np.nan)
+
+        areas = table.sample_areas()
+        estimated = inverse(self.coefficients[None, :, :], areas)
+        with np.errstate(invalid="ignore"):
+            self.negative = np.any((areas > 0) & (estimated < 0), axis=0)
+        estimated = np.where(areas == 0, 0.0, estimated)
+        estimated[:, ~self.fitted] = np.nan
+        self.concentrations = estimated
+
+    def describe(self, molecule):
+        """
+        :return: Spanish description of the model of a molecule, e.g.
+                 "Lineal, ponderado 1/x, 1 outlier excluido"
+        """
+        parts = [DEGREE_LABELS[self.degree],
+                 WEIGHTING_LABELS[self.weighting[molecule]]]
+        rejected = int(self.rejected[molecule].sum())
+        if rejected:
+            parts.append(f"{rejected} outlier excluido")
+        return ", ".join(parts)
+
+    def outliers(self):
+        """
+        :return: (molecules x most standards) mask of the standards flagged
+                 by their studentized residual or a Cook's distance above
+                 4 / points, rejected or not
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.rejected | self.used & (
+                (np.abs(self.studentized) > STUDENTIZED_LIMIT) |
+                (self.cooks > 4 / self.points[:, None]))
+
+
+def fit_quality(table, model=CalibrationModel()):
+    """
+    Fits the calibration curve of every molecule of the table under model,
+    all molecules at once over padded_standards
+
+    :param table: PeakTable
+    :param model: CalibrationModel
+    :return: QualityFit
+    """
+    conc, area, valid = padded_standards(table)
+    n_molecules = len(conc)
+    if model.degree not in DEGREE_LABELS:
+        raise ValueError(f"Unsupported degree {model.degree!r}")
+    weightings = WEIGHTINGS if model.weighting == AUTO_WEIGHTING \
+        else (model.weighting,)
+    fits = [_fit_model(conc, area, valid, weighting, model.degree,
+                       model.reject_outliers) for weighting in weightings]
+    if len(fits) == 1:
+        fit = fits[0]
+        chosen = np.zeros(n_molecules, dtype=np.int64)
+    else:
+        # Mean absolute relative error of the standards used, per weighting
+        scores = []
+        for each in fits:
+            counted = each["used"] & np.isfinite(each["relative_error"])
+            total = np.where(counted, np.abs(each["relative_error"]),
+                             0.0).sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores.append(total / counted.sum(axis=1))
+        scores = np.stack(scores)
+        chosen = np.argmin(np.where(np.isfinite(scores), scores, np.inf),
+                           axis=0)
+        rows = np.arange(n_molecules)
+        fit = {key: np.stack([each[key] for each in fits])[chosen, rows]
+               for key in fits[0]}
+    return QualityFit(table, model, [weightings[i] for i in chosen],
+                      model.degree, fit, conc, area, valid)
@@ -0,0 +1,344 @@
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+from options import BACKENDS, CALIBRATION_WEIGHTINGS, DEFAULT_BACKEND, \
+    TABLE_FORMATS, available_formats
+from parse_cache import ParseCache
+from profiling import Stats, profile_call, write_report
+
+STATUS_MESSAGES = {
+    0: "procesado correcto",
+    1: "no tiene estándares",
+    2: "está en uso por otro programa",
+    3: "error desconocido",
+    4: "cancelado",
+}
+
+
+def expand_inputs(inputs, recursive=False):
+    """
+    Expands files, directories and glob patterns into a list of PDF paths
+
+    :param inputs: Iterable of paths, directories or glob patterns
+    :param recursive: Whether to look for PDFs inside subdirectories too
+    :return: List of normalized PDF paths, without duplicates and in the
+             order they were first found
+    """
+    found = []
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.pdf") if recursive else \
+                os.path.join(item, "*.pdf")
+            candidates = sorted(glob.glob(pattern, recursive=recursive))
+        elif glob.has_magic(item):
+            candidates = sorted(glob.glob(item, recursive=True))
+        else:
+            candidates = [item]
+        for path in candidates:
+            path = os.path.normpath(path)
+            if path in seen or not os.path.isfile(path):
+                continue
+            if os.path.splitext(path)[1].lower() != ".pdf":
+                continue
+            seen.add(path)
+            found.append(path)
+    return found
+
+
+def convert_file(path, output_path, report_od=False, page_workers=1,
+                 cache=None, constant_memory=False, backend=DEFAULT_BACKEND,
+                 formats=("xlsx",), model=None, history=None):
+    """
+    Runs dict_to_xlsx on a single file, usually inside a worker process
+
+    :return: Tuple (path, status code, elapsed seconds, Stats.as_dict() with
+             the time spent in every stage)
+    """
+    # Imported on first use, so --help and argument errors do not wait for
+    # pdfminer, NumPy and xlsxwriter
+    from dict_to_xl import dict_to_xlsx
+    start = time.perf_counter()
+    save_path = output_path or os.path.dirname(path)
+    stats = Stats()
+    try:
+        res = dict_to_xlsx(path, save_path, report_od=report_od,
+                           page_workers=page_workers, cache=cache,
+                           constant_memory=constant_memory, stats=stats,
+                           backend=backend, formats=formats, model=model,
+                           history=history)
+    except PermissionError:
+        res = 2
+    except Exception:
+        res = 3
+    return path, res, time.perf_counter() - start, stats.as_dict()
+
+
+def profile_paths(pstats_path, paths):
+    """
+    :return: One profile path per PDF: pstats_path itself for a single PDF,
+             otherwise pstats_path with the name of each PDF appended, e.g.
+             perfil-secuencia.pstats, numbered when two PDFs share a name
+    """
+    if len(paths) == 1:
+        return [pstats_path]
+    root, extension = os.path.splitext(pstats_path)
+    profiles = []
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        profile, n = f"{root}-{name}{extension}", 1
+        while profile in profiles:
+            n += 1
+            profile = f"{root}-{name} ({n}){extension}"
+        profiles.append(profile)
+    return profiles
+
+
+def _print_result(path, res, elapsed, out):
+    print(f"{res}\t{elapsed:8.2f} s\t{path}\t"
+          f"{STATUS_MESSAGES.get(res, STATUS_MESSAGES[3])}", file=out)
+
+
+def run_batch(paths, output_path=None, workers=None, report_od=False,
+              page_workers=1, cache=None, constant_memory=False,
+              out=sys.stdout, reports=None, backend=DEFAULT_BACKEND,
+              formats=("xlsx",), model=None, history=None):
+    """
+    Converts every path in a process pool, printing each result as it arrives
+
+    :param paths: List of PDF paths
+    :param output_path: Folder for the .xlsx files. None writes each one
+                        next to its PDF
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param report_od: Whether to include OD and biomass-based yield columns
+    :param page_workers: When greater than one, files are converted one
+                         after the other and the pages of each file are
+                         split across this many processes instead
+    :param cache: Optional parse_cache.ParseCache shared by all workers
+    :param constant_memory: Stream the .xlsx rows to disk while writing
+    :param out: Stream where per-file status lines and the summary go
+    :param reports: Optional dict, filled with {path: Stats.as_dict()}
+    :param backend: Text extraction backend, see pdf_to_dict.EXTRACTORS
+    :param formats: Output formats of every file, see dict_to_xlsx
+    :param model: Optional (weighting, degree, reject_outliers) of the
+                  calibration curves, see dict_to_xlsx
+    :param history: Optional history database where every run is recorded
+    :return: Dict {path: status code}
+    """
+    results = {}
+    reports = {} if reports is None else reports
+    start = time.perf_counter()
+    if workers == 1 or page_workers is not None and page_workers > 1:
+        # Worker processes cannot start pools of their own, so large files
+        # are parallelized by page from the main process instead.
+        for path in paths:
+            path, res, elapsed, reports[path] = convert_file(
+                path, output_path, report_od, page_workers, cache,
+                constant_memory, backend, formats, model, history)
+            results[path] = res
+            _print_result(path, res, elapsed, out)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(convert_file, path, output_path,
+                                   report_od, 1, cache, constant_memory,
+                                   backend, formats, model, history)
+                       for path in paths]
+            for future in concurrent.futures.as_completed(futures):
+                path, res, elapsed, reports[path] = future.result()
+                results[path] = res
+                _print_result(path, res, elapsed, out)
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for res in results.values() if res == 0)
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    print(f"{len(results)} archivos, {ok} correctos, "
+          f"{len(results) - ok} con error en {elapsed:.2f} s "
+          f"({rate:.2f} archivos/s)", file=out)
+    return results
+
+
+def run_merge(paths, xlsx_path, workers=None, cache=None,
+              constant_memory=False, out=sys.stdout, backend=DEFAULT_BACKEND):
+    """
+    Merges every path into one consolidated workbook, see merge_xl.merge_pdfs
+
+    :return: Dict {path: status code}
+    """
+    from merge_xl import merge_pdfs
+    start = time.perf_counter()
+    results, res = merge_pdfs(paths, xlsx_path, workers, cache,
+                              constant_memory, backend)
+    elapsed = time.perf_counter() - start
+    for path, file_res in results.items():
+        print(f"{file_res}\t{path}\t"
+              f"{STATUS_MESSAGES.get(file_res, STATUS_MESSAGES[3])}", file=out)
+    print(f"{res}\t{xlsx_path}\t"
+          f"{STATUS_MESSAGES.get(res, STATUS_MESSAGES[3])}", file=out)
+    ok = sum(1 for file_res in results.values() if file_res == 0)
+    print(f"{len(results)} archivos, {ok} correctos, consolidados en "
+          f"{elapsed:.2f} s", file=out)
+    results[xlsx_path] = res
+    return results
+
+
+def output_formats(value):
+    """
+    argparse type of --format, a comma separated list of formats
+    """
+    formats = [name.strip().lower() for name in value.split(",")
+               if name.strip()]
+    unknown = [name for name in formats
+               if name != "xlsx" and name not in TABLE_FORMATS]
+    if not formats or unknown:
+        raise argparse.ArgumentTypeError(
+            f"formato desconocido {', '.join(unknown) or value!r}, "
+            f"se aceptan xlsx, {', '.join(TABLE_FORMATS)}")
+    # Repeated formats would only overwrite the same file
+    return tuple(dict.fromkeys(formats))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Convierte reportes PDF de HPLC a Excel sin interfaz "
+                    "gráfica")
+    parser.add_argument("inputs", nargs="+",
+                        help="Archivos PDF, carpetas o patrones glob")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Carpeta de destino (por defecto, la carpeta de "
+                             "cada PDF)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Número de procesos (por defecto, uno por CPU)")
+    parser.add_argument("-p", "--page-workers", type=int, default=1,
+                        help="Procesos por archivo para leer sus páginas en "
+                             "paralelo; los archivos se procesan de a uno "
+                             "(útil para reportes muy grandes)")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Buscar PDFs también en subcarpetas")
+    parser.add_argument("--od", action="store_true",
+                        help="Agregar columnas de rendimiento (OD y mg/g)")
+    parser.add_argument("-m", "--merge", default=None, metavar="XLSX",
+                        help="Consolidar todos los PDFs en un solo Excel; "
+                             "al repetirlo sólo se leen los PDFs nuevos o "
+                             "modificados")
+    parser.add_argument("--constant-memory", action="store_true",
+                        help="Escribir el Excel fila por fila, con memoria "
+                             "constante (para secuencias muy grandes)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        default=DEFAULT_BACKEND,
+                        help="Extracción de texto: pdfminer (referencia) o "
+                             "fast (más rápida, arma las líneas desde los "
+                             "operadores de texto)")
+    parser.add_argument("-f", "--format", type=output_formats,
+                        default=("xlsx",), metavar="FORMATOS",
+                        help="Formatos a escribir separados por coma: xlsx "
+                             "(por defecto), csv, parquet o arrow. Los tres "
+                             "últimos guardan una tabla larga con una fila "
+                             "por pico; parquet y arrow requieren pyarrow. "
+                             "El PDF se lee una sola vez")
+    parser.add_argument("--weighting", choices=CALIBRATION_WEIGHTINGS,
+                        default=None,
+                        help="Ponderación de las curvas de calibrado: none, "
+                             "1/x, 1/x2 o auto (la de menor error relativo "
+                             "de los estándares, por molécula). Sin ésta ni "
+                             "--quadratic ni --reject-outliers se usa la "
+                             "recta de mínimos cuadrados de siempre")
+    parser.add_argument("--quadratic", action="store_true",
+                        help="Ajustar curvas cuadráticas en vez de rectas")
+    parser.add_argument("--reject-outliers", action="store_true",
+                        help="Excluir del ajuste el estándar con mayor "
+                             "residuo studentizado si supera 3, cuando "
+                             "quedan suficientes estándares")
+    parser.add_argument("--history", default=None, metavar="SQLITE",
+                        help="Guardar también cada corrida en esta base de "
+                             "datos de historial (ver history.py)")
+    parser.add_argument("--stats", default=None, metavar="JSON",
+                        help="Guarda el tiempo de cada etapa y página de "
+                             "cada archivo en este archivo JSON")
+    parser.add_argument("--profile", default=None, metavar="PSTATS",
+                        help="Convierte los archivos uno por uno en este "
+                             "proceso bajo cProfile y guarda el perfil de "
+                             "cada uno en este archivo; con varios PDFs, en "
+                             "PSTATS-<nombre del PDF> (ver python -m "
+                             "pstats)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Volver a leer los PDFs aunque estén en caché")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Carpeta del caché de lectura")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        print("--workers debe ser al menos 1", file=sys.stderr)
+        return 2
+    if args.page_workers < 1:
+        print("--page-workers debe ser al menos 1", file=sys.stderr)
+        return 2
+    if args.output and not os.path.isdir(args.output):
+        print(f"La carpeta {args.output} no existe", file=sys.stderr)
+        return 2
+    missing = [name for name in args.format
+                if name != "xlsx" and name not in available_formats()]
+    if missing:
+        print(f"Para escribir {', '.join(missing)} hay que instalar "
+              f"pyarrow", file=sys.stderr)
+        return 2
+    if args.merge and args.format != ("xlsx",):
+        print("--merge sólo escribe el Excel consolidado, no acepta --format",
+              file=sys.stderr)
+        return 2
+    paths = expand_inputs(args.inputs, recursive=args.recursive)
+    if not paths:
+        print("No se encontraron archivos PDF", file=sys.stderr)
+        return 1
+    if args.merge and (args.weighting or args.quadratic or
+                       args.reject_outliers):
+        print("--merge usa siempre la recta de mínimos cuadrados",
+              file=sys.stderr)
+        return 2
+    if args.merge and args.history:
+        print("--merge no guarda historial, use history.py add",
+              file=sys.stderr)
+        return 2
+    model = None
+    if args.weighting or args.quadratic or args.reject_outliers:
+        # Plain tuple of calibration.CalibrationModel, so parsing the
+        # arguments does not import NumPy
+        model = (args.weighting or CALIBRATION_WEIGHTINGS[0],
+                 2 if args.quadratic else 1, args.reject_outliers)
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    if args.merge:
+        results = run_merge(paths, args.merge, args.workers, cache,
+                            args.constant_memory, backend=args.backend)
+        return 0 if all(res == 0 for res in results.values()) else 1
+    reports = {}
+    if args.profile:
+        # cProfile only sees the current process, so nothing is sent to
+        # worker processes while profiling, and each file gets its own
+        # profile so that its hot spots are not mixed with the others'
+        results = {}
+        for path, pstats_path in zip(paths, profile_paths(args.profile,
+                                                          paths)):
+            path, res, elapsed, reports[path] = profile_call(
+                pstats_path, convert_file, path, args.output, args.od,
+                args.page_workers, cache, args.constant_memory, args.backend,
+                args.format, model, args.history)
+            results[path] = res
+            _print_result(path, res, elapsed, sys.stdout)
+            print(f"\tperfil en {pstats_path}")
+    else:
+        results = run_batch(paths, args.output, args.workers, args.od,
+                            args.page_workers, cache, args.constant_memory,
+                            reports=reports, backend=args.backend,
+                            formats=args.format, model=model,
+                            history=args.history)
+    if args.stats:
+        write_report(reports, args.stats)
+    return 0 if all(res == 0 for res in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
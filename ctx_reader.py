@@ -0,0 +1,379 @@
+"""
+Reader of the raw chromatograms (.ctx) exported by the HPLC software: text
+files with one point per line, fields separated by ";" and decimal commas,
+the time first and one column per detector channel after it, below a header
+line with their names.
+
+Files are parsed in chunks straight into NumPy arrays, and converted once to
+a binary .npy cache that later reads memory-map instead of parsing again:
+
+    trace = load_ctx("ctx/B_car2.ctx")
+    trace.time, trace.signal()   # arrays, one value per point
+    traces = load_folder("ctx/", workers=4)
+"""
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import warnings
+import numpy as np
+
+# Bytes of text parsed at a time
+CHUNK_BYTES = 8 * 1024 * 1024
+CTX_EXTENSION = ".ctx"
+CACHE_VERSION = 1
+
+
+def default_cache_dir():
+    """
+    Folder of the binary caches, next to the one of parse_cache.
+    HPLC_CTX_CACHE_DIR overrides it.
+    """
+    if os.environ.get("HPLC_CTX_CACHE_DIR"):
+        return os.environ["HPLC_CTX_CACHE_DIR"]
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get(
+        "XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "DIQB-UC-HPLC", "ctx")
+
+
+class Trace:
+    """
+    Channels of one .ctx file sharing its time axis. data is a (columns x
+    points) array, so every channel is contiguous; it may be a read-only
+    memory map of the binary cache.
+    """
+
+    def __init__(self, name, columns, data):
+        self.name = name
+        self.columns = list(columns)
+        self.data = data
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __repr__(self):
+        return (f"<Trace {self.name}: {len(self)} puntos, "
+                f"{', '.join(self.channels)}>")
+
+    @property
+    def time(self):
+        return self.data[0]
+
+    @property
+    def channels(self):
+        return self.columns[1:]
+
+    def signal(self, channel=None):
+        """
+        :param channel: Channel name or index among channels, the first
+                        one by default
+        :return: Array with the signal of the channel
+        """
+        if channel is None:
+            channel = 0
+        elif not isinstance(channel, (int, np.integer)):
+            channel = self.channels.index(channel)
+        return self.data[channel + 1]
+
+    @property
+    def duration(self):
+        return float(self.time[-1] - self.time[0]) if len(self) else 0.0
+
+    @property
+    def sampling_interval(self):
+        """
+        :return: Median time between consecutive points
+        """
+        if len(self) < 2:
+            return float("nan")
+        return float(np.median(np.diff(self.time)))
+
+    def window(self, start=None, stop=None):
+        """
+        :return: Trace with the points whose time is in [start, stop),
+                 sharing memory with this one
+        """
+        first = 0 if start is None else np.searchsorted(self.time, start)
+        last = len(self) if stop is None else np.searchsorted(self.time,
+                                                              stop)
+        return Trace(self.name, self.columns, self.data[:, first:last])
+
+
+def _scan(path):
+    """
+    Reads the header of a .ctx file and bounds its number of points
+
+    :return: Tuple (columns, byte offset of the first point, its line
+             number, upper bound of the number of points)
+    """
+    header = []
+    first_line = 0
+    with open(path, "rb") as ctx:
+        while True:
+            offset = ctx.tell()
+            line = ctx.readline()
+            first_line += 1
+            if not line:
+                break
+            try:
+                text = line.decode("utf-8").strip()
+            except UnicodeDecodeError:  # Windows exports
+                text = line.decode("cp1252", "replace").strip()
+            if not text:
+                continue
+            fields = text.split(";")
+            try:
+                [float(field.replace(",", ".")) for field in fields]
+            except ValueError:
+                header.append(fields)
+                continue
+            break
+        data_start = offset
+        width = len(fields) if line else 0
+        # The first point plus a last line without a newline
+        lines = 2
+        for block in iter(lambda: ctx.read(CHUNK_BYTES), b""):
+            lines += block.count(b"\n")
+    if header and len(header[-1]) == width:
+        columns = [name.strip() for name in header[-1]]
+    else:
+        columns = ["Tiempo"] + [f"Canal {i}" for i in range(1, width)]
+    return columns, data_start, first_line, lines
+
+
+def _parse_lines(text, width, path, first_line):
+    """
+    Slow path of _parse_chunk, line by line. Empty fields are NaN and blank
+    lines are skipped.
+    """
+    rows = []
+    for number, line in enumerate(text.split("\n"), first_line):
+        line = line.strip()
+        if not line:
+            continue
+        fields = line.split(";")
+        if len(fields) != width:
+            raise ValueError(f"{path}:{number}: se esperaban {width} "
+                             f"columnas y hay {len(fields)}")
+        try:
+            rows.append([float(field.replace(",", ".")) if field.strip()
+                         else np.nan for field in fields])
+        except ValueError:
+            raise ValueError(f"{path}:{number}: valor no numérico en "
+                             f"{line!r}") from None
+    return np.array(rows, dtype=np.float64).reshape(-1, width)
+
+
+def _parse_chunk(text, width, path, first_line):
+    """
+    :param text: Whole lines of points
+    :return: (points x width) array
+    """
+    lines = text.count("\n") + (0 if text.endswith("\n") else 1)
+    with warnings.catch_warnings():
+        # Old NumPy versions only warn when the text stops parsing
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            values = np.fromstring(text.replace(",", ".").replace(";", " "),
+                                   dtype=np.float64, sep=" ")
+        except (ValueError, DeprecationWarning):
+            values = None
+    if values is None or values.size != lines * width:
+        # Blank lines, empty fields or bad values
+        return _parse_lines(text, width, path, first_line)
+    return values.reshape(lines, width)
+
+
+def _iter_chunks(path, data_start, first_line, width,
+                 chunk_bytes=CHUNK_BYTES):
+    """
+    :return: Generator of (points x width) arrays, in file order
+    """
+    with open(path, "rb") as ctx:
+        ctx.seek(data_start)
+        rest = b""
+        for block in iter(lambda: ctx.read(chunk_bytes), b""):
+            block = rest + block
+            end = block.rfind(b"\n") + 1
+            if not end:
+                rest = block
+                continue
+            rest = block[end:]
+            text = block[:end].decode("latin-1")
+            yield _parse_chunk(text, width, path, first_line)
+            first_line += text.count("\n")
+        if rest.strip():
+            yield _parse_chunk(rest.decode("latin-1"), width, path,
+                               first_line)
+
+
+def _fill(out, path, data_start, first_line, width,
+          chunk_bytes=CHUNK_BYTES):
+    """
+    Parses the points of path into the columns of out
+
+    :return: Number of points written
+    """
+    points = 0
+    for chunk in _iter_chunks(path, data_start, first_line, width,
+                              chunk_bytes):
+        out[:, points:points + len(chunk)] = chunk.T
+        points += len(chunk)
+    return points
+
+
+def read_ctx(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Parses a .ctx file into memory, a chunk at a time
+
+    :return: Trace
+    """
+    columns, data_start, first_line, bound = _scan(path)
+    data = np.empty((len(columns), bound), dtype=np.float64)
+    points = _fill(data, path, data_start, first_line, len(columns),
+                   chunk_bytes)
+    return Trace(os.path.basename(path), columns, data[:, :points])
+
+
+def cache_paths(path, cache_dir=None):
+    """
+    :return: Tuple (.npy path, .json path) of the binary cache of path,
+             named after its absolute path
+    """
+    key = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()
+    base = os.path.join(cache_dir or default_cache_dir(), key)
+    return base + ".npy", base + ".json"
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"version": CACHE_VERSION, "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+
+
+def convert_ctx(path, cache_dir=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Parses path straight into its binary cache, without holding the points
+    in memory, unless the cache is already up to date
+
+    :return: Tuple (.npy path, .json path)
+    """
+    npy_path, meta_path = cache_paths(path, cache_dir)
+    stamp = _source_stamp(path)
+    try:
+        with open(meta_path, encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if all(meta.get(key) == value for key, value in stamp.items()) and \
+                os.path.exists(npy_path):
+            return npy_path, meta_path
+    except (OSError, ValueError):
+        pass
+
+    columns, data_start, first_line, bound = _scan(path)
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    # Written under temporary names so that readers never map half a file
+    fd, tmp_npy = tempfile.mkstemp(dir=os.path.dirname(npy_path),
+                                   suffix=".npy.tmp")
+    os.close(fd)
+    try:
+        out = np.lib.format.open_memmap(tmp_npy, mode="w+",
+                                        dtype=np.float64,
+                                        shape=(len(columns), bound))
+        points = _fill(out, path, data_start, first_line, len(columns),
+                       chunk_bytes)
+        out.flush()
+        del out
+        os.replace(tmp_npy, npy_path)
+    except BaseException:
+        if os.path.exists(tmp_npy):
+            os.remove(tmp_npy)
+        raise
+    meta = dict(stamp, columns=columns, points=points,
+                source=os.path.abspath(path))
+    fd, tmp_meta = tempfile.mkstemp(dir=os.path.dirname(meta_path),
+                                    suffix=".json.tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_meta, meta_path)
+    return npy_path, meta_path
+
+
+def _open_cache(path, npy_path, meta_path):
+    with open(meta_path, encoding="utf-8") as meta_file:
+        meta = json.load(meta_file)
+    data = np.load(npy_path, mmap_mode="r")
+    return Trace(os.path.basename(path), meta["columns"],
+                 data[:, :meta["points"]])
+
+
+def load_ctx(path, cache=True, cache_dir=None):
+    """
+    :param cache: Memory-map the binary cache of path, converting the file
+                  first if it changed since. Otherwise the file is parsed
+                  into memory.
+    :return: Trace
+    """
+    if not cache:
+        return read_ctx(path)
+    return _open_cache(path, *convert_ctx(path, cache_dir))
+
+
+def load_folder(folder, workers=None, cache=True, cache_dir=None,
+                recursive=False):
+    """
+    Loads every .ctx file of a folder, parsing them in a process pool. With
+    cache, worker processes write the binary caches and this process only
+    maps them, so no points are copied between processes. Files that cannot
+    be read are reported on stderr and left out.
+
+    :return: Dict {path: Trace}, sorted by path
+    """
+    pattern = os.path.join(folder, "**", "*" + CTX_EXTENSION) if recursive \
+        else os.path.join(folder, "*" + CTX_EXTENSION)
+    paths = sorted(glob.glob(pattern, recursive=recursive))
+    traces = {}
+    if workers == 1 or len(paths) < 2:
+        for path in paths:
+            try:
+                traces[path] = load_ctx(path, cache, cache_dir)
+            except (OSError, ValueError) as error:
+                print(error, file=sys.stderr)
+        return traces
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(convert_ctx, path, cache_dir) if cache else
+                   pool.submit(read_ctx, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                traces[path] = _open_cache(path, *future.result()) \
+                    if cache else future.result()
+            except (OSError, ValueError) as error:
+                print(error, file=sys.stderr)
+    return traces
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Lee cromatogramas .ctx y muestra un resumen")
+    parser.add_argument("paths", nargs="+", help="Archivos .ctx o carpetas")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Procesos para leer carpetas")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Leer el texto sin usar el caché binario")
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        if os.path.isdir(path):
+            traces = load_folder(path, args.workers, not args.no_cache)
+        else:
+            traces = {path: load_ctx(path, not args.no_cache)}
+        for trace in traces.values():
+            print(f"{trace.name}: {len(trace)} puntos en "
+                  f"{trace.duration:.2f}, canales {', '.join(trace.channels)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
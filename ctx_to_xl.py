@@ -1,6 +1,217 @@
+import argparse
+import glob
+import math
+import os
+import sys
+import numpy as np
 import xlsxwriter
-import pandas
+from ctx_reader import load_ctx, CTX_EXTENSION
 
 FILEPATH = "ctx/B_car2.ctx"
-df = pandas.read_csv(FILEPATH, sep=";", decimal=",")
-print(df)
\ No newline at end of file
+# Points per channel written to the chart, enough for a smooth line at any
+# window size while keeping the workbook small
+CHART_POINTS = 4000
+MINMAX = "minmax"
+LTTB = "lttb"
+
+
+def minmax_indices(values, max_points=CHART_POINTS):
+    """
+    Splits values into max_points / 2 buckets and keeps the minimum and
+    maximum of each, so that no peak or dip is lost
+
+    :return: Sorted indices of the points kept, first and last included
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, max_points // 2)
+    size = -(-n // buckets)
+    # Pad the last bucket with its own last value
+    padded = np.concatenate((values, np.full(buckets * size - n, values[-1])))
+    matrix = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    kept = np.concatenate(([0, n - 1],
+                           offsets + np.argmin(matrix, axis=1),
+                           offsets + np.argmax(matrix, axis=1)))
+    return np.unique(np.minimum(kept, n - 1))
+
+
+def lttb_indices(x, y, max_points=CHART_POINTS):
+    """
+    Largest-Triangle-Three-Buckets: keeps, from each of max_points - 2
+    buckets, the point forming the largest triangle with the point kept from
+    the previous bucket and the average of the next one. Bucket averages are
+    computed at once from cumulative sums; each bucket then needs a single
+    vectorized area computation.
+
+    :return: Sorted indices of the points kept, first and last included
+    """
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    buckets = max_points - 2
+    edges = (np.arange(buckets + 1) * (n - 2) // buckets + 1).astype(np.int64)
+    sum_x = np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y, dtype=np.float64)))
+    counts = edges[1:] - edges[:-1]
+    mean_x = (sum_x[edges[1:]] - sum_x[edges[:-1]]) / counts
+    mean_y = (sum_y[edges[1:]] - sum_y[edges[:-1]]) / counts
+    # The bucket after the last one is the last point
+    next_x = np.append(mean_x[1:], x[n - 1])
+    next_y = np.append(mean_y[1:], y[n - 1])
+
+    kept = np.empty(buckets + 2, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(buckets):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        ax, ay = x[previous], y[previous]
+        area = np.abs((ax - next_x[bucket]) * (y[lo:hi] - ay) -
+                      (ax - x[lo:hi]) * (next_y[bucket] - ay))
+        previous = lo + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+DOWNSAMPLERS = {MINMAX: lambda x, y, points: minmax_indices(y, points),
+                LTTB: lttb_indices}
+
+
+def chart_indices(trace, max_points=CHART_POINTS, method=MINMAX):
+    """
+    :return: Sorted indices of the points of trace written to the chart,
+             the union of those kept for each channel
+    """
+    downsample = DOWNSAMPLERS[method]
+    kept = [downsample(trace.time, trace.signal(channel), max_points)
+            for channel in range(len(trace.channels))]
+    return np.unique(np.concatenate(kept)) if kept else np.arange(0)
+
+
+def sidecar_path(xlsx_path):
+    """
+    :return: Path of the .npy file with every point of the chromatogram of
+             xlsx_path
+    """
+    return os.path.splitext(xlsx_path)[0] + ".npy"
+
+
+def write_chromatogram(trace, xlsx_path, max_points=CHART_POINTS,
+                       method=MINMAX, sidecar=True):
+    """
+    Writes a data sheet with the downsampled points of every channel and a
+    chart sheet plotting them. With sidecar, every point is saved next to
+    the workbook as a (columns x points) .npy array, in the order of the
+    columns of the data sheet.
+
+    :return:    0: File saved successfully
+                2: File is locked
+    """
+    index = chart_indices(trace, max_points, method)
+    try:
+        workbook = xlsxwriter.Workbook(xlsx_path, {"constant_memory": True})
+    except PermissionError:
+        return 2
+    bold = workbook.add_format({"bold": True})
+    data_name = "Datos"
+    worksheet = workbook.add_worksheet(data_name)
+    worksheet.set_column(0, len(trace.columns) - 1, 14)
+    for col, name in enumerate(trace.columns):
+        worksheet.write(0, col, name, bold)
+    last_row = len(index)
+    if sidecar:
+        note = (f"{last_row} de {len(trace)} puntos, todos en "
+                f"{os.path.basename(sidecar_path(xlsx_path))}")
+    else:
+        note = f"{last_row} de {len(trace)} puntos"
+    # Rows must be written in order in constant memory mode
+    worksheet.write(0, len(trace.columns) + 1, note)
+    columns = [trace.time[index]] + [trace.signal(channel)[index] for
+                                     channel in range(len(trace.channels))]
+    for row, values in enumerate(zip(*(column.tolist() for column in
+                                       columns)), 1):
+        for col, value in enumerate(values):
+            if math.isfinite(value):
+                worksheet.write_number(row, col, value)
+
+    chart = workbook.add_chart({"type": "scatter", "subtype": "straight"})
+    for col, channel in enumerate(trace.channels, 1):
+        chart.add_series({
+            "name": channel,
+            "categories": [data_name, 1, 0, last_row, 0],
+            "values": [data_name, 1, col, last_row, col],
+            "line": {"width": 1},
+        })
+    chart.set_title({"name": os.path.splitext(trace.name)[0]})
+    chart.set_x_axis({"name": trace.columns[0]})
+    chart.set_y_axis({"name": "Señal"})
+    if len(trace.channels) < 2:
+        chart.set_legend({"none": True})
+    chartsheet = workbook.add_chartsheet("Cromatograma")
+    chartsheet.set_chart(chart)
+    chartsheet.activate()
+
+    try:
+        if sidecar:
+            np.save(sidecar_path(xlsx_path), np.asarray(trace.data))
+        workbook.close()
+    except PermissionError:
+        return 2
+    return 0
+
+
+def ctx_to_xlsx(path, save_path, max_points=CHART_POINTS, method=MINMAX,
+                sidecar=True, cache=True):
+    """
+    :param path: Path to the .ctx file
+    :param save_path: Folder where the .xlsx (and .npy) files are written
+    :param cache: Load the trace through the binary cache of ctx_reader
+    :return: Status code as in dict_to_xlsx
+    """
+    filename = os.path.splitext(os.path.basename(path))[0]
+    try:
+        trace = load_ctx(path, cache)
+    except PermissionError:
+        return 2
+    except (OSError, ValueError):
+        return 3
+    return write_chromatogram(
+        trace, os.path.join(save_path, f"Cromatograma {filename}.xlsx"),
+        max_points, method, sidecar)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Exporta cromatogramas .ctx a Excel con un gráfico")
+    parser.add_argument("paths", nargs="*", default=[FILEPATH],
+                        help="Archivos .ctx o carpetas")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Carpeta de destino (por defecto, la de cada "
+                             "archivo)")
+    parser.add_argument("-n", "--points", type=int, default=CHART_POINTS,
+                        help="Puntos por canal en el gráfico")
+    parser.add_argument("--method", choices=sorted(DOWNSAMPLERS),
+                        default=MINMAX,
+                        help="Reducción de puntos: minmax (mínimo y máximo "
+                             "por tramo) o lttb")
+    parser.add_argument("--no-sidecar", action="store_true",
+                        help="No guardar todos los puntos en un .npy")
+    args = parser.parse_args(argv)
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths += sorted(glob.glob(os.path.join(path, "*" + CTX_EXTENSION)))
+        else:
+            paths.append(path)
+    failed = 0
+    for path in paths:
+        res = ctx_to_xlsx(path, args.output or os.path.dirname(path) or ".",
+                          args.points, args.method, not args.no_sidecar)
+        failed += res != 0
+        print(f"{res}\t{path}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,46 +1,81 @@
 import numpy as np
 import xlsxwriter
-from pdf_to_dict import read_pdf
+from pdf_to_dict import read_pdf, DEFAULT_BACKEND, ParseCancelled
+from peak_table import PeakTable
+from calibration import fit_calibrations, NO_WEIGHTING, QUADRATIC
+from history import record_run
+from profiling import NO_STATS
+from writers import WRITERS, tidy_columns
 import os.path
 import re
 
+# Columns D to G next to every standard, column H flags outliers
+STANDARD_DIAGNOSTICS = ("Residuo", "Err. rel.", "Res. stud.", "Cook", "Outlier")
 
-def linear_fit(x_vals, y_vals):
-    x = np.array(x_vals)
-    y = np.array(y_vals)
-    return np.polyfit(x, y, 1)
 
+def sanitize_sheet_name(name):
+    # Excel worksheets cannot contain []:*?/\ in their names
+    return re.sub(r"[:\\\[\]*?/]+", "", name)
 
-def any_negative_concentration(np_fit, areas):
-    m, n = np_fit
-    return any(map(lambda y: (y - n) / m < 0, areas))  # y = mx + n
 
-
-def linear_fit_zero_n(x_vals, y_vals):
-    x = np.array(x_vals)
-    y = np.array(y_vals)
-    x = x[:, np.newaxis]
-    return np.linalg.lstsq(x, y)[0]
+def cached_value(value):
+    """
+    Value stored next to a formula as its last computed result. Excel cannot
+    read NaN or infinite numbers, those are left as 0.
+    """
+    return float(value) if np.isfinite(value) else 0
 
 
-def dict_to_xlsx(arch, save_path, sgn_progress=None, report_od=False):
+def dict_to_xlsx(arch, save_path, sgn_progress=None, report_od=False,
+                 page_workers=1, cache=None, constant_memory=False,
+                 stats=None, backend=DEFAULT_BACKEND, cancel_event=None,
+                 formats=("xlsx",), model=None, history=None):
     """
     :param arch: Path to PDF to be read
     :param save_path: Path for .xlsx file ti be written to
     :param sgn_progress: pyqtSignal for reporting progress to GUI
     :param report_od: Whether to include OD and biomass-based yield calculations
+    :param page_workers: Processes used to parse the pages of this PDF
+    :param cache: Optional parse_cache.ParseCache, skips parsing PDFs that
+                  were already read
+    :param constant_memory: Stream rows to disk while writing the .xlsx
+    :param stats: Optional profiling.Stats, filled with the time of every
+                  stage and page of this file
+    :param backend: Text extraction backend of read_pdf
+    :param cancel_event: Optional threading.Event, stops reading the PDF at
+                         the next page once set, or before writing the next
+                         output file
+    :param formats: Files to write, "xlsx" and any of writers.WRITERS, all
+                    of them from a single read of the PDF
+    :param model: Optional (weighting, degree, reject_outliers) of
+                  calibration.CalibrationModel. Without it the curves are
+                  the classic least squares lines.
+    :param history: Optional path of a history.RunHistory database where
+                    the run is recorded too
     :return:    0: File processed and saved successfully
                 1: [DEPRECATED] File lacks standard areas for
                    molecule concentration
                 2: File is locked
                 3: Error in processing
+                4: Cancelled through cancel_event
     """
     base = os.path.basename(arch)
     filename = os.path.splitext(base)[0]
+    stats = stats or NO_STATS
     try:
-        result, molecule_names = read_pdf(arch, sgn_progress)
+        with stats.stage("read_pdf"):
+            if cache is not None:
+                result, molecule_names = cache.read_pdf(
+                    arch, sgn_progress, workers=page_workers, stats=stats,
+                    backend=backend, cancel_event=cancel_event)
+            else:
+                result, molecule_names = read_pdf(
+                    arch, sgn_progress, workers=page_workers, stats=stats,
+                    backend=backend, cancel_event=cancel_event)
     except PermissionError:
         return 2
+    except ParseCancelled:
+        return 4
     # if not result.get("standards"):
     #     return 1
     # try:
@@ -48,60 +83,157 @@ def dict_to_xlsx(arch, save_path, sgn_progress=None, report_od=False):
     # except ValueError:
     #     return 1
     if all(i in result for i in ("standards", "samples", "int_standards")):
-        samples = result["samples"]
-        standards = result["standards"]
-        int_standards = result["int_standards"]
-        try:
-            workbook = xlsxwriter.Workbook(
-                os.path.join(save_path, f'Resultados {filename}.xlsx'))
-        except PermissionError:
-            return 2
+        with stats.stage("table"):
+            table = PeakTable.from_processed(result, molecule_names)
+        output = os.path.join(save_path, f'Resultados {filename}')
+        with stats.stage("fit"):
+            calibrations = fit_calibrations(table, model)
+        columns = None
+        res = 0
+        for output_format in formats:
+            # Parsing already stopped at the pages, but a conversion
+            # cancelled after that should not write every output either
+            if cancel_event is not None and cancel_event.is_set():
+                return 4
+            if output_format == "xlsx":
+                format_res = write_workbook(
+                    table, output + ".xlsx", report_od=report_od,
+                    constant_memory=constant_memory, stats=stats,
+                    calibrations=calibrations)
+            else:
+                if columns is None:
+                    with stats.stage("tidy"):
+                        columns = tidy_columns(table, calibrations, filename)
+                extension, writer, _ = WRITERS[output_format]
+                with stats.stage(output_format):
+                    format_res = writer(columns, output + extension)
+            # Report the first failure, but still try the other formats
+            res = res or format_res
+        if history is not None:
+            with stats.stage("history"):
+                res = res or record_run(history, arch, table, calibrations)
+        return res
+    return 3
+
+
+def _calibration_chart(workbook, molecule, last_row, zero_intercept,
+                       model=None):
+    """
+    Scatter of the standards in B5:C{last_row+1} with their trendline
+
+    :param model: CalibrationModel of the sheet, if any. Excel trendlines
+                  are neither weighted nor leave outliers out, so they only
+                  show their equation when they match the model.
+    """
+    trendline = {
+        'type': 'linear',
+        'display_equation': True,
+        'display_r_squared': True
+    }
+    if zero_intercept:
+        trendline['intercept'] = 0
+    if model is not None:
+        if model.degree == QUADRATIC:
+            trendline.update(type='polynomial', order=2)
+        if model.weighting != NO_WEIGHTING or model.reject_outliers:
+            del trendline['display_equation'], trendline['display_r_squared']
+    scatter = workbook.add_chart(
+        {"type": "scatter"})
+    scatter.set_title(
+        {"name": f"Curva de calibrado {molecule}"})
+    scatter.add_series({
+        'categories': f"'{molecule}'!$B$5:$B${last_row+1}",
+        'values': f"'{molecule}'!$C$5:$C${last_row+1}",
+        'trendline': trendline,
+    })
+    scatter.set_legend({'position': 'none'})
+
+    scatter.set_x_axis({'name': 'Conc. [unid]'})
+    scatter.set_y_axis({'name': 'Área'})
+    return scatter
+
+
+def write_workbook(table, xlsx_path, report_od=False, constant_memory=False,
+                   stats=None, calibrations=None):
+    """
+    Writes one sheet per molecule, with its calibration curve and sample
+    concentrations, plus an internal standard sheet if there are any
+
+    :param table: PeakTable with the peaks of one PDF
+    :param xlsx_path: Path of the .xlsx file to be written
+    :param report_od: Whether to include OD and biomass-based yield calculations
+    :param constant_memory: Flush every row to disk as soon as the next one
+                            starts, instead of keeping all cells in memory
+                            until the workbook is closed. Every sheet is
+                            written strictly row by row to allow it.
+    :param stats: Optional profiling.Stats recording the fit, sheets, charts
+                  and close stages
+    :param calibrations: calibration.Calibrations of the table, fitted here
+                         if not given
+    :return:    0: File saved successfully
+                2: File is locked
+    """
+    stats = stats or NO_STATS
+    try:
+        workbook = xlsxwriter.Workbook(
+            xlsx_path, {"constant_memory": constant_memory})
+    except PermissionError:
+        return 2
+
+    # Styles
+    exp = workbook.add_format()
+    exp.set_font_script(1)
+    center = workbook.add_format()
+    center.set_align("center")
+    center.set_align("vcenter")
+    center_ = workbook.add_format()
+    center_.set_align("center")
+    center_.set_align("vcenter")
+    center_.set_border(1)
+    right = workbook.add_format()
+    right.set_align("right")
+    decimals3 = workbook.add_format()
+    decimals3.set_num_format("0.000")
+    decimals3.set_align("center")
+    decimals3.set_align("vcenter")
+    decimals3.set_border(1)
+    light_blue = workbook.add_format()
+    light_blue.set_bg_color("#CCCCFF")
+    light_blue.set_align("center")
+    light_blue.set_align("vcenter")
+    light_blue.set_border(1)
+    red = workbook.add_format()
+    red.set_bg_color("#FFAAAA")
+    red.set_align("center")
+    red.set_align("vcenter")
+    percent = workbook.add_format({"num_format": "0.0%", "align": "center",
+                                   "valign": "vcenter", "border": 1})
+    decimals2 = workbook.add_format({"num_format": "0.00", "align": "center",
+                                     "valign": "vcenter", "border": 1})
 
-        # Styles
-        exp = workbook.add_format()
-        exp.set_font_script(1)
-        center = workbook.add_format()
-        center.set_align("center")
-        center.set_align("vcenter")
-        center_ = workbook.add_format()
-        center_.set_align("center")
-        center_.set_align("vcenter")
-        center_.set_border(1)
-        right = workbook.add_format()
-        right.set_align("right")
-        decimals3 = workbook.add_format()
-        decimals3.set_num_format("0.000")
-        decimals3.set_align("center")
-        decimals3.set_align("vcenter")
-        decimals3.set_border(1)
-        light_blue = workbook.add_format()
-        light_blue.set_bg_color("#CCCCFF")
-        light_blue.set_align("center")
-        light_blue.set_align("vcenter")
-        light_blue.set_border(1)
-        red = workbook.add_format()
-        red.set_bg_color("#FFAAAA")
-        red.set_align("center")
-        red.set_align("vcenter")
+    with stats.stage("fit"):
+        samples = table.sample_list()
+        sample_areas = table.sample_areas()
+        if calibrations is None:
+            calibrations = fit_calibrations(table)
 
-        for molecule in molecule_names:
-            # Excel worksheets cannot contain []:*?/\ in their names
-            sanitized_molecule = re.sub(r"[:\\\[\]*?/]+", "", molecule)
-            worksheet = workbook.add_worksheet(sanitized_molecule)
+    with stats.stage("sheets"):
+        for m_idx, molecule in enumerate(table.molecule_names):
+            worksheet = workbook.add_worksheet(sanitize_sheet_name(molecule))
             worksheet.set_column(0, 0, 3)
             worksheet.set_row(0, 9)
+            areas = sample_areas[:, m_idx]
+            x_vals, y_vals = table.standards(m_idx)
 
             # If there are no standards or less than the two points
             # needed for the fit, do not report concentrations, only areas
-            if molecule not in standards or len(
-                    standards.get(molecule, {}).keys()) < 2:
+            if len(x_vals) < 2:
                 worksheet.merge_range('B2:F2',
                                       "DATOS DE CALIBRADO NO ENCONTRADOS",
                                       cell_format=red)
                 worksheet.write('B4', "Muestra", center_)
                 worksheet.write('C4', "Área", center_)
-                for row, smpl in enumerate(samples.keys(), 4):
-                    area = samples[smpl].get(molecule, 0)
+                for row, (smpl, area) in enumerate(zip(samples, areas), 4):
                     worksheet.write(row, 1, smpl, center_)
                     worksheet.write_number(row, 2, area, center_)
 
@@ -113,61 +245,81 @@ def dict_to_xlsx(arch, save_path, sgn_progress=None, report_od=False):
                                       cell_format=center_)
                 worksheet.write('B4', "Conc.", center_)
                 worksheet.write('C4', "Área", center_)
-                increasing = sorted(list(standards[molecule].keys()))
+                # Diagnostics of every standard, next to it
+                quality = calibrations.quality
+                for col, title in enumerate(STANDARD_DIAGNOSTICS, 3):
+                    worksheet.write(3, col, title, center_)
+                outliers = quality.outliers()[m_idx]
+                diagnostics = zip(quality.residuals[m_idx],
+                                  quality.relative_error[m_idx],
+                                  quality.studentized[m_idx],
+                                  quality.cooks[m_idx],
+                                  quality.rejected[m_idx], outliers)
                 r = 0
-                for r_, conc in enumerate(increasing, 4):
+                for r_, (conc, area, values) in enumerate(
+                        zip(x_vals, y_vals, diagnostics), 4):
                     r = r_
-                    area = standards[molecule][conc]
                     worksheet.write_number(r, 1, conc, center_)
                     worksheet.write_number(r, 2, area, center_)
+                    for col, (value, style) in enumerate(
+                            zip(values[:4], (decimals2, percent, decimals2,
+                                             decimals2)), 3):
+                        if np.isfinite(value):
+                            worksheet.write_number(r, col, value, style)
+                    rejected, outlier = values[4:]
+                    if rejected:
+                        worksheet.write(r, 7, "excluido", red)
+                    elif outlier:
+                        worksheet.write(r, 7, "revisar", red)
                 linear_fit_row = r + 3
 
                 worksheet.write(linear_fit_row - 1, 1, "m", center_)
                 worksheet.write(linear_fit_row - 1, 2, "n", center_)
 
-                # Filter only positive areas
-                sample_areas = filter(lambda x: x > 0,
-                                      [samples[spl_name][molecule] for spl_name
-                                       in samples if molecule in
-                                       samples[spl_name]])
-
-                scatter = workbook.add_chart(
-                    {"type": "scatter"})
-                scatter.set_title(
-                    {"name": f"Curva de calibrado {molecule}"})
-
-                # Check for non-negative concentrations
-                x_vals, y_vals = increasing, [standards[molecule][i] for i
-                                              in increasing]
-                try:
-                    with_intercept = linear_fit(x_vals, y_vals)
-                    neg_conc = any_negative_concentration(with_intercept,
-                                                          sample_areas)
-                    if neg_conc:
-                        print(f"Negative concentration detected for {molecule}",
-                              "Parameters ",
-                              f"m:{with_intercept[0]}, n:{with_intercept[1]}")
-
-                except np.linalg.linalg.LinAlgError:
-                    neg_conc = True
-                    print(x_vals, y_vals)
+                # Check for non-negative concentrations, the warning goes
+                # below the model
+                neg_conc = calibrations.negative[m_idx]
+                m, n = calibrations.parameters(m_idx)
+                quadratic = calibrations.model is not None and \
+                    calibrations.model.degree == QUADRATIC
+                if not np.isfinite(calibrations.slope[m_idx]):
+                    warning = "Ajuste no válido, los estándares no definen " \
+                              "una curva"
+                elif neg_conc and calibrations.model is None:
+                    warning = "Concentraciones negativas con ordenada, " \
+                              "se ajustó por el origen"
+                elif neg_conc:
+                    warning = "Hay muestras con concentración negativa"
+                else:
+                    warning = None
 
-                if neg_conc:
+                # Formulas carry their computed result too, so the values show
+                # up in viewers that do not recalculate
+                if calibrations.model is not None:
+                    # Weighted, quadratic or outlier-free fits have no
+                    # LINEST equivalent, their parameters are values
+                    worksheet.write_rich_string(linear_fit_row - 1, 3, "R",
+                                                exp, "2", center_)
+                    if quadratic:
+                        worksheet.write(linear_fit_row - 1, 4, "a", center_)
+                    worksheet.write_number(linear_fit_row, 1,
+                                           cached_value(m), center_)
+                    worksheet.write_number(linear_fit_row, 2,
+                                           cached_value(n), center_)
+                    worksheet.write_number(
+                        linear_fit_row, 3,
+                        cached_value(calibrations.r2[m_idx]), center_)
+                    if quadratic:
+                        worksheet.write_number(
+                            linear_fit_row, 4,
+                            cached_value(calibrations.curvature[m_idx]),
+                            center_)
+                elif neg_conc:
                     worksheet.write_array_formula(
                         linear_fit_row, 1, linear_fit_row, 2,
                         f"=LINEST(C5:C{r+1}, B5:B{r+1}, false, false)",
-                        cell_format=center_)
-
-                    scatter.add_series({
-                        'categories': f"'{molecule}'!$B$5:$B${r+1}",
-                        'values': f"'{molecule}'!$C$5:$C${r+1}",
-                        'trendline': {
-                            'type': 'linear',
-                            'intercept': 0,
-                            'display_equation': True,
-                            'display_r_squared': True
-                        },
-                    })
+                        center_, cached_value(m))
+                    worksheet.write_number(linear_fit_row, 2, n, center_)
                 else:
                     # No sample has negative estimated area
                     worksheet.write_rich_string(linear_fit_row - 1, 3, "R", exp,
@@ -175,29 +327,48 @@ def dict_to_xlsx(arch, save_path, sgn_progress=None, report_od=False):
                     worksheet.write_array_formula(
                         r + 3, 1, r + 3, 2,
                         f"=LINEST(C5:C{r+1}, B5:B{r+1}, true, false)",
-                        cell_format=center_)
+                        center_, cached_value(m))
+                    worksheet.write_number(r + 3, 2, cached_value(n), center_)
 
                     worksheet.write_formula(r + 3, 3,
                                             f"=(PEARSON("
                                             f"C5:C{r+1}, B5:B{r+1}))^2",
-                                            cell_format=center_)
-                    scatter.add_series({
-                        'categories': f"'{molecule}'!$B$5:$B${r+1}",
-                        'values': f"'{molecule}'!$C$5:$C${r+1}",
-                        'trendline': {
-                            'type': 'linear',
-                            'display_equation': True,
-                            'display_r_squared': True
-                        },
-                    })
+                                            center_,
+                                            cached_value(calibrations.r2[m_idx]))
 
-                scatter.set_legend({'position': 'none'})
+                with stats.stage("charts"):
+                    worksheet.insert_chart("J2", _calibration_chart(
+                        workbook, molecule, r,
+                        neg_conc and calibrations.model is None,
+                        calibrations.model))
 
-                scatter.set_x_axis({'name': 'Conc. [unid]'})
-                scatter.set_y_axis({'name': 'Área'})
-                worksheet.insert_chart("J2", scatter)
+                # Model and its limits, between the fit and the samples
+                if calibrations.model is None and neg_conc:
+                    # Diagnostics still belong to the line with intercept
+                    description = ("Lineal por el origen (conc. negativas); "
+                                   "diagnóstico de la recta con ordenada")
+                else:
+                    description = quality.describe(m_idx)
+                diagnostics_row = linear_fit_row + 2
+                worksheet.write(diagnostics_row, 1, "Modelo", center_)
+                worksheet.write(diagnostics_row, 2, description)
+                for row, pairs in enumerate((
+                        (("LOD", quality.lod[m_idx]),
+                         ("LOQ", quality.loq[m_idx])),
+                        (("Rango de trabajo" if quadratic else
+                          "Rango lineal", quality.range_low[m_idx]),
+                         ("hasta", quality.range_high[m_idx]))),
+                        diagnostics_row + 1):
+                    for col, (label, value) in zip((1, 3), pairs):
+                        worksheet.write(row, col, label, center_)
+                        if np.isfinite(value):
+                            worksheet.write_number(row, col + 1, value,
+                                                   decimals3)
+                if warning is not None:
+                    worksheet.write(diagnostics_row + 3, 1, "Aviso", red)
+                    worksheet.write(diagnostics_row + 3, 2, warning)
 
-                sample_area_row = linear_fit_row + 3
+                sample_area_row = diagnostics_row + 5
                 worksheet.write(sample_area_row - 1, 1, "Muestra", center_)
                 worksheet.write(sample_area_row - 1, 2, "Área", center_)
                 worksheet.write(sample_area_row - 1, 3, "Conc.", center_)
@@ -208,59 +379,76 @@ def dict_to_xlsx(arch, save_path, sgn_progress=None, report_od=False):
                                     center_)
                     worksheet.write(sample_area_row - 1, 7, "mg/g", center_)
 
-                for row, spl_name in enumerate(samples, sample_area_row):
-                    area = samples[spl_name].get(molecule, 0)
+                concentrations = calibrations.concentrations[:, m_idx]
+                for row, (spl_name, area, conc) in enumerate(
+                        zip(samples, areas, concentrations), sample_area_row):
                     worksheet.write(row, 1, spl_name, center_)
                     worksheet.write_number(row, 2, area, center_)
-                    worksheet.write_formula(
-                        row, 3,
-                        f"=IF(C{row+1}=0,0,"
-                        f"(C{row+1}-C{linear_fit_row+1})/B{linear_fit_row+1})",
-                        cell_format=decimals3)
+                    if calibrations.curvature[m_idx]:
+                        # Root of a x² + m x + n = area that is the straight
+                        # line's when a is 0
+                        fit = linear_fit_row + 1
+                        formula = (f"=IF(C{row+1}=0,0,2*(C{row+1}-C{fit})/"
+                                   f"(B{fit}+SQRT(B{fit}^2+4*E{fit}*"
+                                   f"(C{row+1}-C{fit}))))")
+                    else:
+                        formula = (f"=IF(C{row+1}=0,0,(C{row+1}-"
+                                   f"C{linear_fit_row+1})/B{linear_fit_row+1})")
+                    worksheet.write_formula(row, 3, formula, decimals3,
+                                            cached_value(conc))
                     if report_od:
+                        biomass = 0.4 * 20 * 1 / 1000
                         worksheet.write_number(row, 4, 20, light_blue)
                         worksheet.write_number(row, 5, 1, light_blue)
                         worksheet.write_formula(
-                            row, 6, f"=0.4*E{row+1}*F{row+1}/1000", center_)
+                            row, 6, f"=0.4*E{row+1}*F{row+1}/1000", center_,
+                            biomass)
                         worksheet.write_formula(
-                            row, 7, f"=D{row+1}/(G{row+1}*1000)", center_)
+                            row, 7, f"=D{row+1}/(G{row+1}*1000)", center_,
+                            cached_value(conc / (biomass * 1000)))
 
+        int_standards = table.int_standard_list()
         if int_standards:
             worksheet = workbook.add_worksheet("Estándar Interno")
             worksheet.set_column(0, 0, 3)
             worksheet.set_row(0, 9)
 
-            todas = {i_std_name for mol in int_standards.values() for i_std_name
-                     in mol.keys()}
-            todas_sort = sorted(list(todas))
+            int_standard_areas = table.int_standard_areas()
+            todas_sort = table.int_standard_molecules()
             # Adapt column to longer names
             worksheet.set_column(2, 1 + len(todas_sort), 12)
+            # Rows are written strictly top to bottom, as constant_memory needs
             worksheet.write("B2", "Muestra", center_)
-            for col, i_std_name in enumerate(todas_sort, 2):
-                worksheet.write(1, col, i_std_name, center_)
+            for col, m_idx in enumerate(todas_sort, 2):
+                worksheet.write(1, col, table.molecule_names[m_idx], center_)
+            for row, (sample_name, areas) in enumerate(
+                    zip(int_standards, int_standard_areas[:, todas_sort]), 2):
+                worksheet.write(row, 1, sample_name, center_)
+                for col, area in enumerate(areas, 2):
+                    worksheet.write_number(row, col, area, center_)
+            last_row = len(int_standards) + 1
+            for col, m_idx in enumerate(todas_sort, 2):
+                i_std_name = table.molecule_names[m_idx]
                 excel_column = chr(65 + col)
-                for row, sample_name in enumerate(int_standards.keys(), 2):
-                    worksheet.write(row, 1, sample_name, center_)
-                    worksheet.write_number(row, col,
-                                           int_standards[sample_name].get(
-                                               i_std_name, 0), center_)
-                scatter = workbook.add_chart(
-                    {"type": "scatter"})
-                scatter.set_title(
-                    {"name": f"Estándar Interno {i_std_name}"})
-                scatter.add_series({
-                    'categories': f"'Estándar Interno'!$B$3:$B${row+1}",
-                    'values': f"'Estándar Interno'!${excel_column}$3"
-                              f":${excel_column}${row+1}",
-                    'marker': {'type': 'circle'}})
-                scatter.set_x_axis({'name': 'Muestra'})
-                scatter.set_y_axis({'name': 'Área'})
-                scatter.set_legend({"none": True})
-                worksheet.insert_chart(f"J{2+10*(col-2)}", scatter)
+                with stats.stage("charts"):
+                    scatter = workbook.add_chart(
+                        {"type": "scatter"})
+                    scatter.set_title(
+                        {"name": f"Estándar Interno {i_std_name}"})
+                    scatter.add_series({
+                        'categories':
+                            f"'Estándar Interno'!$B$3:$B${last_row+1}",
+                        'values': f"'Estándar Interno'!${excel_column}$3"
+                                  f":${excel_column}${last_row+1}",
+                        'marker': {'type': 'circle'}})
+                    scatter.set_x_axis({'name': 'Muestra'})
+                    scatter.set_y_axis({'name': 'Área'})
+                    scatter.set_legend({"none": True})
+                    worksheet.insert_chart(f"J{2+10*(col-2)}", scatter)
 
-        try:
+    try:
+        with stats.stage("close"):
             workbook.close()
-        except PermissionError:
-            return 2
-        return 0
-    return 3
+    except PermissionError:
+        return 2
+    return 0
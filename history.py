@@ -0,0 +1,513 @@
+"""
+Optional SQLite store of every converted run, so that trends across months
+of results are a query instead of reopening hundreds of workbooks.
+
+Tables:
+    runs:             one row per PDF, with its name, source, content digest
+                      and run date (seconds since the epoch, the file's
+                      modification time unless given)
+    molecules:        every molecule name seen, shared by all runs
+    samples:          sample names of every run
+    areas:            one row per peak, like the rows of a PeakTable, with
+                      the concentration estimated for samples. The run date
+                      is repeated here and the table is stored in molecule
+                      and date order, so that the areas of a molecule in a
+                      date range are read from one contiguous range.
+    calibration_fits: the curve every workbook used, per run and molecule
+
+Each run is written in one transaction, and a PDF already recorded (same
+contents) replaces its previous run. Queries return NumPy arrays.
+
+    python history.py --db historial.sqlite add reportes/*.pdf
+    python history.py --db historial.sqlite areas Glucosa --days 90
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+from calibration import fit_calibrations
+from options import DEFAULT_BACKEND
+from parse_cache import file_digest
+from peak_table import PeakTable, SAMPLE, STANDARD, INT_STANDARD
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    source TEXT,
+    digest TEXT UNIQUE,
+    run_date REAL NOT NULL,
+    recorded REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS molecules (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS areas (
+    molecule_id INTEGER NOT NULL REFERENCES molecules(id),
+    run_date REAL NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    peak INTEGER NOT NULL,
+    sample_id INTEGER REFERENCES samples(id),
+    kind INTEGER NOT NULL,
+    area REAL NOT NULL,
+    concentration REAL,
+    PRIMARY KEY (molecule_id, run_date, run_id, peak)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS calibration_fits (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    molecule_id INTEGER NOT NULL REFERENCES molecules(id),
+    model TEXT,
+    points INTEGER NOT NULL,
+    slope REAL,
+    intercept REAL,
+    curvature REAL,
+    r2 REAL,
+    lod REAL,
+    loq REAL,
+    PRIMARY KEY (run_id, molecule_id)
+);
+CREATE INDEX IF NOT EXISTS runs_date ON runs(run_date);
+CREATE INDEX IF NOT EXISTS samples_name ON samples(name);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run_id);
+CREATE INDEX IF NOT EXISTS areas_sample ON areas(sample_id);
+CREATE INDEX IF NOT EXISTS areas_run ON areas(run_id);
+CREATE INDEX IF NOT EXISTS fits_molecule ON calibration_fits(molecule_id);
+"""
+# Seconds a writer waits for another process holding the database
+BUSY_TIMEOUT = 60.0
+# Rows turned into arrays at a time by the queries
+FETCH_ROWS = 65536
+# Most "?" SQLite accepts in a statement
+MAX_VARIABLES = 999
+KIND_NAMES = {SAMPLE: "samples", STANDARD: "standards",
+              INT_STANDARD: "int_standards"}
+DAY = 86400.0
+
+
+def default_history_path():
+    """
+    Database used when none is given. HPLC_HISTORY_DB overrides it,
+    otherwise it lives in the per-user data folder of the platform.
+    """
+    if os.environ.get("HPLC_HISTORY_DB"):
+        return os.environ["HPLC_HISTORY_DB"]
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get(
+        "XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local",
+                                         "share")
+    return os.path.join(base, "DIQB-UC-HPLC", "historial.sqlite")
+
+
+def _optional(values):
+    """
+    :return: List of floats of an array, None for NaN (stored as NULL)
+    """
+    return [None if value != value else value for value in values.tolist()]
+
+
+class RunHistory:
+    """
+    Connection to the history database, created with its tables on first
+    use. Usable as a context manager, which closes it.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_history_path()
+        folder = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(folder, exist_ok=True)
+        # Transactions are opened explicitly, see record
+        self.connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT,
+                                          isolation_level=None)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        # Readers do not block the single writer, and the writer only syncs
+        # at checkpoints
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _molecule_ids(self, names):
+        """
+        :return: Array of the ids of the molecule names, adding new ones
+        """
+        execute = self.connection.execute
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO molecules (name) VALUES (?)",
+            [(name,) for name in names])
+        ids = {}
+        for start in range(0, len(names), MAX_VARIABLES):
+            chunk = names[start:start + MAX_VARIABLES]
+            ids.update(execute(
+                f"SELECT name, id FROM molecules WHERE name IN "
+                f"({','.join('?' * len(chunk))})", chunk))
+        return np.array([ids[name] for name in names], dtype=np.int64)
+
+    def record(self, table, calibrations, name, source=None, digest=None,
+               run_date=None):
+        """
+        Adds a run in a single transaction, replacing the run of the same
+        digest if there was one
+
+        :param table: PeakTable of the run
+        :param calibrations: calibration.Calibrations the workbook used
+        :param name: Name of the run, usually the PDF file name
+        :param source: Path of the PDF
+        :param digest: parse_cache.file_digest of the PDF, identifies it
+        :param run_date: Seconds since the epoch, now when not given
+        :return: Id of the run
+        """
+        run_date = time.time() if run_date is None else float(run_date)
+        execute = self.connection.execute
+        # Takes the write lock up front, so that concurrent writers wait
+        # for it instead of failing halfway
+        execute("BEGIN IMMEDIATE")
+        try:
+            if digest is not None:
+                execute("DELETE FROM runs WHERE digest = ?", (digest,))
+            run_id = execute(
+                "INSERT INTO runs (name, source, digest, run_date, recorded)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (name, source, digest, run_date, time.time())).lastrowid
+            molecule_ids = self._molecule_ids(list(table.molecule_names))
+            sample_ids = [execute("INSERT INTO samples (run_id, name) "
+                                  "VALUES (?, ?)", (run_id, sample)).lastrowid
+                          for sample in table.sample_names]
+            # Standards have sample -1, which picks the trailing None
+            sample_ids = np.array(sample_ids + [None], dtype=object)
+
+            # Samples get the concentration of the workbook, standards
+            # keep theirs
+            position = np.full(len(table.sample_names), -1, dtype=np.int64)
+            position[table.sample_order] = np.arange(len(table.sample_order))
+            concentration = table.conc.copy()
+            samples = table.kind == SAMPLE
+            concentration[samples] = calibrations.concentrations[
+                position[table.sample[samples]], table.molecule[samples]]
+            # peak is the row of the PeakTable, unique within the run
+            self.connection.executemany(
+                "INSERT INTO areas (molecule_id, run_date, run_id, peak, "
+                "sample_id, kind, area, concentration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(molecule_ids[table.molecule].tolist(),
+                    [run_date] * len(table), [run_id] * len(table),
+                    range(len(table)), sample_ids[table.sample].tolist(),
+                    table.kind.tolist(), table.area.tolist(),
+                    _optional(concentration)))
+            self._record_fits(run_id, molecule_ids, calibrations)
+            execute("COMMIT")
+        except BaseException:
+            execute("ROLLBACK")
+            raise
+        return run_id
+
+    def _record_fits(self, run_id, molecule_ids, calibrations):
+        zero = calibrations.zero_intercept
+        fitted = calibrations.fitted
+        slope = np.where(zero, calibrations.slope_zero, calibrations.slope)
+        intercept = np.where(zero, 0.0, calibrations.intercept)
+        r2 = np.where(zero, calibrations.r2_zero, calibrations.r2)
+        quality = calibrations.quality
+        rows = []
+        for m in np.flatnonzero(fitted).tolist():
+            if zero[m]:
+                model = "Lineal por el origen"
+            else:
+                model = quality.describe(m)
+            rows.append((run_id, int(molecule_ids[m]), model,
+                         int(calibrations.points[m])) + tuple(_optional(
+                             np.array([slope[m], intercept[m],
+                                       calibrations.curvature[m], r2[m],
+                                       quality.lod[m], quality.loq[m]]))))
+        self.connection.executemany(
+            "INSERT INTO calibration_fits (run_id, molecule_id, model, "
+            "points, slope, intercept, curvature, r2, lod, loq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _fetch(self, query, parameters, numeric, text=()):
+        """
+        Runs query and turns its rows into columns, FETCH_ROWS at a time
+
+        :param numeric: Names of the first columns of the query, read as
+                        float64 with NULL as NaN
+        :param text: Names of the columns after those, read as objects
+        :return: Dict {column: array}
+        """
+        cursor = self.connection.execute(query, parameters)
+        chunks = {name: [] for name in numeric + text}
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            for name, values in zip(numeric, np.array(
+                    columns[:len(numeric)], dtype=np.float64)):
+                chunks[name].append(values)
+            for name, values in zip(text, columns[len(numeric):]):
+                array = np.empty(len(values), dtype=object)
+                array[:] = values
+                chunks[name].append(array)
+        return {name: np.concatenate(values) if values else
+                np.empty(0, dtype=np.float64 if name in numeric else object)
+                for name, values in chunks.items()}
+
+    @staticmethod
+    def _date_range(days, since, until):
+        """
+        :return: Tuple (since, until) in seconds since the epoch, days
+                 counting back from until or now
+        """
+        until = time.time() if until is None else until
+        if days is not None:
+            since = until - days * DAY
+        return -np.inf if since is None else since, until
+
+    def areas(self, molecule, days=None, since=None, until=None,
+              sample=None, kind=SAMPLE):
+        """
+        Areas of a molecule across runs, oldest first
+
+        :param molecule: Molecule name
+        :param days: Only the runs of the last days before until
+        :param since: Only runs on or after this time (seconds since the
+                      epoch), ignored with days
+        :param until: Only runs up to this time, now by default
+        :param sample: Sample name, or a GLOB pattern like "Muestra 1*"
+        :param kind: SAMPLE, STANDARD or INT_STANDARD rows
+        :return: Dict of arrays: date (datetime64[s]), area, concentration
+                 (NaN when unknown), run (run ids) and sample (names, None
+                 for standards)
+        """
+        since, until = self._date_range(days, since, until)
+        conditions = ["a.molecule_id = (SELECT id FROM molecules WHERE "
+                      "name = ?)", "a.run_date BETWEEN ? AND ?",
+                      "a.kind = ?"]
+        parameters = [molecule, since, until, kind]
+        if sample is not None:
+            conditions.append("s.name GLOB ?")
+            parameters.append(sample)
+        # Primary key order is already date order
+        query = ("SELECT a.run_date, a.area, a.concentration, a.run_id, "
+                 "s.name FROM areas a LEFT JOIN samples s ON "
+                 "s.id = a.sample_id WHERE " + " AND ".join(conditions) +
+                 " ORDER BY a.run_date, a.run_id, a.peak")
+        columns = self._fetch(query, parameters,
+                              ("date", "area", "concentration", "run"),
+                              ("sample",))
+        columns["date"] = columns["date"].astype("datetime64[s]")
+        columns["run"] = columns["run"].astype(np.int64)
+        return columns
+
+    def fits(self, molecule, days=None, since=None, until=None):
+        """
+        Calibration curves of a molecule across runs, oldest first
+
+        :return: Dict of arrays: date, run, points, slope, intercept,
+                 curvature, r2, lod and loq, and model, the description
+                 of every curve
+        """
+        since, until = self._date_range(days, since, until)
+        columns = self._fetch(
+            "SELECT r.run_date, r.id, f.points, f.slope, f.intercept, "
+            "f.curvature, f.r2, f.lod, f.loq, f.model "
+            "FROM calibration_fits f JOIN runs r ON r.id = f.run_id "
+            "WHERE f.molecule_id = (SELECT id FROM molecules WHERE name = ?) "
+            "AND r.run_date BETWEEN ? AND ? ORDER BY r.run_date, r.id",
+            (molecule, since, until),
+            ("date", "run", "points", "slope", "intercept", "curvature", "r2",
+             "lod", "loq"), ("model",))
+        columns["date"] = columns["date"].astype("datetime64[s]")
+        columns["run"] = columns["run"].astype(np.int64)
+        columns["points"] = columns["points"].astype(np.int64)
+        return columns
+
+    def runs(self, days=None, since=None, until=None):
+        """
+        :return: List of (id, name, run date as datetime64[s], source,
+                 number of areas) tuples, oldest first
+        """
+        since, until = self._date_range(days, since, until)
+        return [(run_id, name, np.datetime64(int(run_date), "s"), source,
+                 areas) for run_id, name, run_date, source, areas in
+                self.connection.execute(
+                    "SELECT r.id, r.name, r.run_date, r.source, "
+                    "(SELECT COUNT(*) FROM areas a WHERE a.run_id = r.id) "
+                    "FROM runs r WHERE r.run_date BETWEEN ? AND ? "
+                    "ORDER BY r.run_date, r.id", (since, until))]
+
+    def molecules(self):
+        """
+        :return: Sorted list of the molecule names recorded
+        """
+        return [name for name, in self.connection.execute(
+            "SELECT name FROM molecules ORDER BY name")]
+
+
+def record_run(db_path, path, table, calibrations, run_date=None):
+    """
+    Records the run of the PDF in path, named after the file and dated by
+    its modification time unless run_date is given
+
+    :param db_path: History database, see RunHistory
+    :return: 0 if recorded, 2 if the database stayed locked longer than
+             BUSY_TIMEOUT
+    """
+    if run_date is None:
+        run_date = os.path.getmtime(path)
+    try:
+        with RunHistory(db_path) as history:
+            history.record(table, calibrations,
+                           os.path.splitext(os.path.basename(path))[0],
+                           os.path.abspath(path), file_digest(path),
+                           run_date)
+    except sqlite3.OperationalError as error:
+        if "locked" in str(error):
+            return 2
+        raise
+    return 0
+
+
+def add_pdfs(db_path, paths, cache=None, backend=DEFAULT_BACKEND):
+    """
+    Reads and records PDFs without writing their workbooks
+
+    :return: Dict {path: status code}
+    """
+    # pdfminer is only needed to add files, not to query
+    from pdf_to_dict import read_pdf
+    results = {}
+    for path in paths:
+        try:
+            reader = cache.read_pdf if cache is not None else read_pdf
+            processed, molecule_names = reader(path, backend=backend)
+            if not all(key in processed for key in KIND_NAMES.values()):
+                results[path] = 3
+                continue
+            table = PeakTable.from_processed(processed, molecule_names)
+            results[path] = record_run(db_path, path, table,
+                                       fit_calibrations(table))
+        except PermissionError:
+            results[path] = 2
+        except Exception:
+            results[path] = 3
+    return results
+
+
+def _parse_date(text):
+    """
+    :return: Seconds since the epoch of a YYYY-MM-DD date, for argparse
+    """
+    try:
+        return time.mktime(time.strptime(text, "%Y-%m-%d"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida: {text} "
+                                         f"(se espera AAAA-MM-DD)")
+
+
+def _print_columns(columns, names, out):
+    print("\t".join(names), file=out)
+    for row in zip(*(columns[name].tolist() for name in names)):
+        print("\t".join("" if value is None or value != value else
+                        str(value) for value in row), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Historial de corridas en SQLite: agrega reportes y "
+                    "consulta áreas y curvas a lo largo del tiempo")
+    parser.add_argument("--db", default=None,
+                        help="Base de datos (por defecto, "
+                             f"{default_history_path()})")
+    commands = parser.add_subparsers(dest="command")
+    add = commands.add_parser("add", help="Lee PDFs y los agrega")
+    add.add_argument("paths", nargs="+")
+    add.add_argument("--no-cache", action="store_true",
+                     help="Volver a leer los PDFs aunque estén en caché")
+    for command, help_text in (("areas", "Áreas de una molécula"),
+                               ("fits", "Curvas de calibrado de una "
+                                        "molécula")):
+        query = commands.add_parser(command, help=help_text)
+        query.add_argument("molecule")
+        query.add_argument("--days", type=float, default=None,
+                           help="Sólo los últimos días")
+        query.add_argument("--since", type=_parse_date, default=None,
+                           metavar="AAAA-MM-DD")
+        query.add_argument("--until", type=_parse_date, default=None,
+                           metavar="AAAA-MM-DD")
+        if command == "areas":
+            query.add_argument("--sample", default=None,
+                               help="Nombre de muestra o patrón, por "
+                                    "ejemplo 'Muestra 1*'")
+            query.add_argument("--kind", choices=sorted(KIND_NAMES.values()),
+                               default=KIND_NAMES[SAMPLE])
+        query.add_argument("--summary", action="store_true",
+                           help="Sólo contar y resumir, sin listar filas")
+    runs = commands.add_parser("runs", help="Lista las corridas")
+    runs.add_argument("--days", type=float, default=None)
+    commands.add_parser("molecules", help="Lista las moléculas")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.command == "add":
+        cache = None
+        if not args.no_cache:
+            from parse_cache import ParseCache
+            cache = ParseCache()
+        results = add_pdfs(args.db, args.paths, cache)
+        for path, res in results.items():
+            print(f"{res}\t{path}")
+        return 0 if all(res == 0 for res in results.values()) else 1
+
+    with RunHistory(args.db) as history:
+        if args.command == "areas":
+            kind = {name: kind for kind, name in KIND_NAMES.items()}[args.kind]
+            columns = history.areas(args.molecule, args.days, args.since,
+                                    args.until, args.sample, kind)
+            names = ("date", "run", "sample", "area", "concentration")
+            values = columns["area"]
+        elif args.command == "fits":
+            columns = history.fits(args.molecule, args.days, args.since,
+                                   args.until)
+            names = ("date", "run", "model", "points", "slope", "intercept",
+                     "curvature", "r2", "lod", "loq")
+            values = columns["slope"]
+        elif args.command == "runs":
+            for run_id, name, run_date, source, areas in history.runs(
+                    args.days):
+                print(f"{run_id}\t{run_date}\t{areas}\t{name}\t{source}")
+            return 0
+        else:
+            print("\n".join(history.molecules()))
+            return 0
+    if args.summary:
+        if len(values):
+            print(f"{len(values)} filas, {columns['date'][0]} a "
+                  f"{columns['date'][-1]}; media {np.nanmean(values):.4g}, "
+                  f"desv. est. {np.nanstd(values):.4g}, "
+                  f"mín. {np.nanmin(values):.4g}, "
+                  f"máx. {np.nanmax(values):.4g}")
+        else:
+            print("0 filas")
+    else:
+        _print_columns(columns, names, sys.stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+# Status code tasks return when they stop at a check of their cancel_event,
+# as dict_to_xlsx does
+CANCELLED = 4
+
+
+class Job:
+    """
+    One task submitted to a JobManager. The task is called with a
+    cancel_event keyword argument, a threading.Event it should check
+    between units of work (read_pdf checks it between pages).
+    """
+
+    def __init__(self, name, task):
+        self.name = name
+        self.task = task
+        self.cancel_event = threading.Event()
+        self.future = concurrent.futures.Future()
+        self.started = None
+        self.finished = None
+
+    def _run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        self.started = time.perf_counter()
+        try:
+            result = self.task(cancel_event=self.cancel_event)
+        except BaseException as error:
+            self.finished = time.perf_counter()
+            self.future.set_exception(error)
+        else:
+            self.finished = time.perf_counter()
+            self.future.set_result(result)
+
+    @property
+    def elapsed(self):
+        """
+        :return: Seconds the task ran for, None if it never started
+        """
+        if self.started is None:
+            return None
+        return (self.finished or time.perf_counter()) - self.started
+
+    def cancel(self):
+        """
+        Drops the job if it did not start yet, otherwise asks the task to
+        stop at its next check of cancel_event
+        """
+        self.cancel_event.set()
+        self.future.cancel()
+
+    def cancel_requested(self):
+        return self.cancel_event.is_set()
+
+    def cancelled(self):
+        """
+        :return: True if the job stopped early: dropped before it started,
+                 or asked to cancel and then stopped by the task, which
+                 returned CANCELLED or raised CancelledError. A job that
+                 finished its work before noticing the request is not
+                 cancelled.
+        """
+        if self.future.cancelled():
+            return True
+        if not self.cancel_requested() or not self.future.done():
+            return False
+        error = self.future.exception()
+        if error is not None:
+            return isinstance(error, concurrent.futures.CancelledError)
+        return self.future.result() == CANCELLED
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """
+        Blocks until the task finishes and returns its result, raising
+        concurrent.futures.CancelledError if it never started
+        """
+        return self.future.result(timeout)
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+
+class Batch:
+    """
+    Group of jobs submitted together by JobManager.submit_batch. on_done is
+    called once with the batch when its last job finishes or is cancelled,
+    from the thread that finished it.
+    """
+
+    def __init__(self, jobs, on_done=None):
+        self.jobs = jobs
+        self.on_done = on_done
+        self.started = time.perf_counter()
+        self.finished = None
+        self._remaining = len(jobs)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        for job in jobs:
+            job.future.add_done_callback(self._job_done)
+        if not jobs:
+            self._finish()
+
+    def _job_done(self, future):
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            self._finish()
+
+    def _finish(self):
+        self.finished = time.perf_counter()
+        self._done.set()
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def cancel(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        :return: True if the batch finished within timeout
+        """
+        return self._done.wait(timeout)
+
+    def summary(self):
+        """
+        :return: Dict with the aggregate timings of the batch:
+                 "jobs", "cancelled" (jobs that stopped early, see
+                 Job.cancelled), "failed" (raised an exception other than
+                 a cancellation), "results" {name: result},
+                 "elapsed" wall seconds since submission, "busy" sum of the
+                 seconds every job ran and "slowest" (name, seconds)
+        """
+        results = {}
+        failed = 0
+        busy = 0.0
+        slowest = (None, 0.0)
+        for job in self.jobs:
+            if job.elapsed is not None:
+                busy += job.elapsed
+                if job.elapsed > slowest[1]:
+                    slowest = (job.name, job.elapsed)
+            if not job.done() or job.future.cancelled():
+                continue
+            if job.future.exception() is not None:
+                if not job.cancelled():
+                    failed += 1
+            else:
+                results[job.name] = job.future.result()
+        return {"jobs": len(self.jobs),
+                "cancelled": sum(1 for job in self.jobs if job.cancelled()),
+                "failed": failed,
+                "results": results,
+                "elapsed": (self.finished or time.perf_counter()) -
+                           self.started,
+                "busy": busy,
+                "slowest": slowest}
+
+    def __await__(self):
+        yield from asyncio.gather(
+            *(asyncio.wrap_future(job.future) for job in self.jobs),
+            return_exceptions=True).__await__()
+        return self.summary()
+
+
+class JobManager:
+    """
+    Runs tasks in a pool of at most max_workers threads, with cancellation
+    and completion tracking. Qt-free, so it serves the GUI, scripts and
+    asyncio code alike:
+
+        manager = JobManager(2)
+        batch = manager.submit_batch(
+            [(path, functools.partial(dict_to_xlsx, path, out))
+             for path in paths])
+        batch.wait()  # or "await batch" from a coroutine
+        print(batch.summary())
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.max_workers)
+        self._jobs = set()
+        self._lock = threading.Lock()
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.discard(job)
+
+    def submit(self, task, name=None):
+        """
+        :param task: Callable accepting a cancel_event keyword argument. Use
+                     functools.partial to bind the rest of its arguments.
+        :param name: Label of the job in batch summaries
+        :return: Job
+        """
+        job = Job(name, task)
+        with self._lock:
+            self._jobs.add(job)
+        job.future.add_done_callback(lambda _: self._forget(job))
+        self._executor.submit(job._run)
+        return job
+
+    def submit_batch(self, tasks, on_done=None):
+        """
+        :param tasks: Iterable of (name, task) tuples, see submit
+        :param on_done: Optional callable receiving the Batch once every job
+                        is finished
+        :return: Batch
+        """
+        return Batch([self.submit(task, name) for name, task in tasks],
+                     on_done)
+
+    def active(self):
+        """
+        :return: Number of jobs waiting or running
+        """
+        with self._lock:
+            return len(self._jobs)
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Stops accepting jobs. With cancel, pending jobs are dropped and
+        running ones asked to stop; with wait=False it returns right away,
+        leaving the running tasks to reach their next cancellation check.
+
+        The pool threads are not daemons: the interpreter still waits for
+        the running tasks when it exits. With cancel that is only until
+        their next check of cancel_event. Without it, they finish their
+        whole task.
+        """
+        if cancel:
+            self.cancel_all()
+        self._executor.shutdown(wait=wait)
@@ -1,11 +1,20 @@
-from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QThreadPool
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QTimer
 from PyQt5.QtGui import (QPalette, QStandardItem, QStandardItemModel, QColor,
                          QIcon, QLinearGradient, QKeySequence)
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, \
-    QFileDialog, QVBoxLayout, QHBoxLayout, QListView, QLabel, QDialog, QCheckBox
+    QFileDialog, QVBoxLayout, QHBoxLayout, QListView, QLabel, QDialog, \
+    QCheckBox, QShortcut
 import backend
+from profiling import summary
+from options import available_formats
 import sys
 
+# Output formats offered in the configuration dialog
+FORMAT_LABELS = {"xlsx": "Excel por molécula (.xlsx)",
+                 "csv": "Tabla larga CSV (.csv)",
+                 "parquet": "Tabla larga Parquet (.parquet)",
+                 "arrow": "Tabla larga Arrow (.arrow)"}
+
 
 class CustomStandardItem(QStandardItem):
     def __init__(self, path_str):
@@ -68,6 +77,8 @@ class Drop(QWidget):
         self.add_drag_n_drop_path_signal.connect(
             self.back.add_paths_drag_n_drop)
         self.export_all_signal.connect(self.back.export_pdf_to_excel)
+        self.cancel_shortcut = QShortcut(QKeySequence(Qt.Key_Escape), self)
+        self.cancel_shortcut.activated.connect(self.back.cancel_export)
 
         # List
         self.list = QListView(self)
@@ -93,6 +104,7 @@ class Drop(QWidget):
 
         # Config
         self.include_od = False
+        self.formats = ["xlsx"]
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasText():
@@ -145,7 +157,8 @@ class Drop(QWidget):
         path = QFileDialog.getExistingDirectory(self,
                                                 "Elegir carpeta para guardar "
                                                 "Excel's")
-        self.export_all_signal.emit((path,self.include_od))
+        self.export_all_signal.emit((path, self.include_od,
+                                     tuple(self.formats)))
 
     def open_config_dialog(self):
         dialog = QDialog(None, Qt.WindowCloseButtonHint)
@@ -155,6 +168,16 @@ class Drop(QWidget):
         check.setChecked(self.include_od)
         v_box = QVBoxLayout()
         v_box.addWidget(check)
+        available = available_formats()
+        format_checks = {}
+        for output_format, label in FORMAT_LABELS.items():
+            format_check = QCheckBox(label, dialog)
+            format_check.setChecked(output_format in self.formats)
+            if output_format != "xlsx" and output_format not in available:
+                format_check.setEnabled(False)
+                format_check.setToolTip("Requiere instalar pyarrow")
+            v_box.addWidget(format_check)
+            format_checks[output_format] = format_check
         cancel = QPushButton("Cancelar", dialog)
         cancel.setShortcut(QKeySequence(Qt.Key_Escape))
         accept = QPushButton("Aceptar", dialog)
@@ -166,7 +189,7 @@ class Drop(QWidget):
         h_box.addWidget(accept)
         v_box.addStretch(1)
         v_box.addLayout(h_box)
-        dialog.setFixedSize(300, 100)
+        dialog.setFixedSize(300, 100 + 25 * len(format_checks))
         dialog.setLayout(v_box)
         cancel.clicked.connect(dialog.reject)
         accept.clicked.connect(dialog.accept)
@@ -174,6 +197,10 @@ class Drop(QWidget):
 
         def apply_changes(state):
             self.include_od = state
+            formats = [output_format for output_format, format_check in
+                       format_checks.items() if format_check.isChecked()]
+            # At least one file has to be written
+            self.formats = formats or ["xlsx"]
 
         dialog.exec_()
 
@@ -219,6 +246,32 @@ class Drop(QWidget):
                         text = text[:17] + "..." if len(text) > 21 else text
                         text += "  error desconocido"
                         item.setText(text)
+                    if res == 4:
+                        item.setBackground(QColor("#ddd"))
+                        item.setToolTip(
+                            f"El procesado de {file_name} fue cancelado")
+                        text = item.file_name
+                        text = text[:25] + "..." if len(text) > 28 else text
+                        text += "  cancelado"
+                        item.setText(text)
+                break
+            pos += 1
+
+    @pyqtSlot(dict)
+    def export_finished(self, totals):
+        ok = sum(1 for res in totals["results"].values() if res == 0)
+        self.setWindowTitle(f"HPLC a Excel - {ok} de {totals['jobs']} "
+                            f"en {totals['elapsed']:.1f} s")
+
+    @pyqtSlot(tuple)
+    def show_stats(self, args):
+        file_name, stats = args
+        model = self.list.model()
+        pos = 0
+        while pos < model.rowCount():
+            item = model.item(pos)
+            if item.file_name == file_name:
+                item.setToolTip(f"{item.toolTip()}\n\n{summary(stats)}")
                 break
             pos += 1
 
@@ -240,7 +293,9 @@ class Drop(QWidget):
             pos += 1
 
     def closeEvent(self, event):
-        QThreadPool.globalInstance().waitForDone()
+        # Running files stop at their next page instead of blocking the
+        # window until they are done
+        self.back.shutdown()
         print("Bye")
         event.accept()
 
@@ -257,4 +312,6 @@ if __name__ == '__main__':
     app.setWindowIcon(QIcon("ui/Logo.png"))
     window = Drop()
     window.show()
+    # Once the event loop has drawn the window
+    QTimer.singleShot(0, backend.preload)
     sys.exit(app.exec_())
@@ -0,0 +1,304 @@
+import concurrent.futures
+import errno
+import os
+import pickle
+import tempfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+import xlsxwriter
+from calibration import fit_calibrations
+from dict_to_xl import sanitize_sheet_name, cached_value
+from parse_cache import file_digest
+from pdf_to_dict import read_pdf, DEFAULT_BACKEND
+from peak_table import PeakTable
+
+STATE_EXTENSION = ".runs"
+
+
+def state_path(xlsx_path):
+    """
+    :return: Path of the file next to the consolidated workbook that keeps
+             the parsed results of every run already merged into it
+    """
+    return os.path.splitext(xlsx_path)[0] + STATE_EXTENSION
+
+
+def load_runs(xlsx_path):
+    """
+    :return: OrderedDict {run_id: run}, where every run is a dict with the
+             "source" path, its "digest" and the "processed" and
+             "molecule_names" read_pdf returned. A truncated or corrupt
+             runs file counts as missing, so every PDF is read again and
+             the file is rewritten.
+    """
+    path = state_path(xlsx_path)
+    try:
+        with open(path, "rb") as state:
+            return pickle.loads(zlib.decompress(state.read()))
+    except FileNotFoundError:
+        return OrderedDict()
+    except (zlib.error, pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError, IndexError, ValueError) as error:
+        print(f"No se pudo leer {path} ({error!r}), se leerán de nuevo "
+              f"todos los PDFs")
+        return OrderedDict()
+
+
+def save_runs(xlsx_path, runs):
+    """
+    :return:    0: Runs saved
+                2: The file or its folder is locked or read-only
+                3: Any other error writing it
+    """
+    path = state_path(xlsx_path)
+    data = zlib.compress(pickle.dumps(runs, protocol=pickle.HIGHEST_PROTOCOL))
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                        suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except OSError as error:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return 2 if isinstance(error, PermissionError) or \
+            error.errno == errno.EROFS else 3
+    return 0
+
+
+def _run_id(path, runs):
+    """
+    Runs are named after their PDF. A different PDF with an already used
+    name gets a numeric suffix, the same PDF keeps its run.
+    """
+    source = os.path.abspath(path)
+    base = os.path.splitext(os.path.basename(path))[0]
+    run_id, n = base, 1
+    while run_id in runs and runs[run_id]["source"] != source:
+        n += 1
+        run_id = f"{base} ({n})"
+    return run_id
+
+
+def _parse(path, cache=None, backend=DEFAULT_BACKEND):
+    """
+    Worker side of merge_pdfs
+
+    :return: Tuple (status, digest, read_pdf result)
+    """
+    try:
+        digest = file_digest(path)
+        reader = cache.read_pdf if cache is not None else read_pdf
+        return 0, digest, reader(path, backend=backend)
+    except PermissionError:
+        return 2, None, None
+    except Exception:
+        return 3, None, None
+
+
+def merge_pdfs(paths, xlsx_path, workers=None, cache=None,
+               constant_memory=False, backend=DEFAULT_BACKEND):
+    """
+    Parses PDFs in parallel and merges them into one consolidated workbook.
+    Parsed runs are kept next to the workbook, so only PDFs that are new or
+    changed since the last merge are read again.
+
+    :param paths: PDFs to be added to the consolidated workbook
+    :param xlsx_path: Path of the consolidated .xlsx
+    :param workers: Number of worker processes
+    :param cache: Optional parse_cache.ParseCache
+    :param constant_memory: Stream rows to disk while writing the .xlsx
+    :param backend: Text extraction backend of read_pdf
+    :return: Tuple (dict {path: status code as in dict_to_xlsx}, status of
+             the consolidated workbook, or of the runs kept next to it when
+             only those could not be saved)
+    """
+    runs = load_runs(xlsx_path)
+    results = {}
+    state_res = 0
+    pending = []
+    for path in paths:
+        run = runs.get(_run_id(path, runs))
+        try:
+            unchanged = run is not None and run["digest"] == file_digest(path)
+        except PermissionError:
+            results[path] = 2
+            continue
+        if unchanged:
+            results[path] = 0
+        else:
+            pending.append(path)
+
+    if pending:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_parse, path, cache, backend)
+                       for path in pending]
+            for path, future in zip(pending, futures):
+                try:
+                    res, digest, parsed = future.result()
+                except BrokenProcessPool:
+                    # A worker died, with it every parse still running
+                    res = 3
+                results[path] = res
+                if res != 0:
+                    continue
+                processed, molecule_names = parsed
+                runs[_run_id(path, runs)] = {
+                    "source": os.path.abspath(path),
+                    "digest": digest,
+                    "processed": processed,
+                    "molecule_names": molecule_names}
+        state_res = save_runs(xlsx_path, runs)
+    # Without the runs file the workbook is still written, the next merge
+    # just reads every PDF again
+    return results, write_consolidated(runs, xlsx_path,
+                                       constant_memory) or state_res
+
+
+def write_consolidated(runs, xlsx_path, constant_memory=False):
+    """
+    Writes one sheet per molecule with the samples of every run, each next to
+    the calibration of its own run, plus a summary and an internal standard
+    sheet
+
+    :param runs: OrderedDict as returned by load_runs
+    :return:    0: File saved successfully
+                2: File is locked
+    """
+    tables = OrderedDict()
+    fits = {}
+    for run_id, run in runs.items():
+        table = PeakTable.from_processed(run["processed"],
+                                         run["molecule_names"])
+        tables[run_id] = table
+        fits[run_id] = fit_calibrations(table)
+    molecules = sorted({name for table in tables.values() for name in
+                        table.molecule_names if not
+                        name.lower().endswith("_is")})
+
+    try:
+        workbook = xlsxwriter.Workbook(
+            xlsx_path, {"constant_memory": constant_memory})
+    except PermissionError:
+        return 2
+    center_ = workbook.add_format()
+    center_.set_align("center")
+    center_.set_align("vcenter")
+    center_.set_border(1)
+    decimals3 = workbook.add_format()
+    decimals3.set_num_format("0.000")
+    decimals3.set_align("center")
+    decimals3.set_align("vcenter")
+    decimals3.set_border(1)
+
+    worksheet = workbook.add_worksheet("Resumen")
+    worksheet.set_column(0, 0, 3)
+    worksheet.set_column(1, 2, 30)
+    for col, title in enumerate(("Corrida", "Archivo", "Muestras",
+                                 "Moléculas"), 1):
+        worksheet.write(1, col, title, center_)
+    for row, (run_id, table) in enumerate(tables.items(), 2):
+        worksheet.write(row, 1, run_id, center_)
+        worksheet.write(row, 2, os.path.basename(runs[run_id]["source"]),
+                        center_)
+        worksheet.write_number(row, 3, len(table.sample_order), center_)
+        worksheet.write_number(row, 4, len(table.molecule_names), center_)
+
+    for molecule in molecules:
+        worksheet = workbook.add_worksheet(sanitize_sheet_name(molecule))
+        worksheet.set_column(0, 0, 3)
+        worksheet.set_column(1, 2, 18)
+        worksheet.set_column(7, 7, 18)
+
+        # Calibration block of every run, to the right of the samples
+        calibration_rows = []
+        for run_id, table in tables.items():
+            m_idx = table.molecule_index.get(molecule)
+            if m_idx is None or not fits[run_id].fitted[m_idx]:
+                continue
+            fit = fits[run_id]
+            m, n = fit.parameters(m_idx)
+            r2 = fit.r2_zero[m_idx] if fit.zero_intercept[m_idx] else \
+                fit.r2[m_idx]
+            calibration_rows.append((run_id, m, n, r2,
+                                     fit.points[m_idx],
+                                     "Sin intercepto" if
+                                     fit.zero_intercept[m_idx] else
+                                     "Con intercepto"))
+        calibration_row_of = {run_id: row for row, (run_id, *_) in
+                              enumerate(calibration_rows, 2)}
+
+        sample_rows = []
+        for run_id, table in tables.items():
+            m_idx = table.molecule_index.get(molecule)
+            if m_idx is None:
+                continue
+            areas = table.sample_areas()[:, m_idx]
+            concentrations = fits[run_id].concentrations[:, m_idx]
+            for sample_name, area, conc in zip(table.sample_list(), areas,
+                                               concentrations):
+                sample_rows.append((run_id, sample_name, area, conc))
+
+        for col, title in enumerate(("Corrida", "Muestra", "Área",
+                                     "Conc."), 1):
+            worksheet.write(1, col, title, center_)
+        for col, title in enumerate(("Corrida", "m", "n", "R²",
+                                     "Estándares", "Ajuste"), 7):
+            worksheet.write(1, col, title, center_)
+        # Both blocks are written row by row, as constant_memory needs
+        for row in range(2, 2 + max(len(sample_rows),
+                                    len(calibration_rows))):
+            if row - 2 < len(sample_rows):
+                run_id, sample_name, area, conc = sample_rows[row - 2]
+                worksheet.write(row, 1, run_id, center_)
+                worksheet.write(row, 2, sample_name, center_)
+                worksheet.write_number(row, 3, area, center_)
+                cal_row = calibration_row_of.get(run_id)
+                if cal_row is not None:
+                    worksheet.write_formula(
+                        row, 4,
+                        f"=IF(D{row+1}=0,0,"
+                        f"(D{row+1}-$J${cal_row+1})/$I${cal_row+1})",
+                        decimals3, cached_value(conc))
+            if row - 2 < len(calibration_rows):
+                run_id, m, n, r2, points, model = calibration_rows[row - 2]
+                worksheet.write(row, 7, run_id, center_)
+                worksheet.write_number(row, 8, cached_value(m), center_)
+                worksheet.write_number(row, 9, cached_value(n), center_)
+                worksheet.write_number(row, 10, cached_value(r2), decimals3)
+                worksheet.write_number(row, 11, points, center_)
+                worksheet.write(row, 12, model, center_)
+
+    int_standard_rows = []
+    for run_id, table in tables.items():
+        int_standard_areas = table.int_standard_areas()
+        molecules_is = table.int_standard_molecules()
+        for sample_name, areas in zip(table.int_standard_list(),
+                                      int_standard_areas[:, molecules_is]):
+            for m_idx, area in zip(molecules_is, areas):
+                int_standard_rows.append(
+                    (run_id, sample_name, table.molecule_names[m_idx], area))
+    if int_standard_rows:
+        worksheet = workbook.add_worksheet("Estándar Interno")
+        worksheet.set_column(0, 0, 3)
+        worksheet.set_column(1, 3, 18)
+        for col, title in enumerate(("Corrida", "Muestra", "Estándar",
+                                     "Área"), 1):
+            worksheet.write(1, col, title, center_)
+        for row, (run_id, sample_name, name, area) in enumerate(
+                int_standard_rows, 2):
+            worksheet.write(row, 1, run_id, center_)
+            worksheet.write(row, 2, sample_name, center_)
+            worksheet.write(row, 3, name, center_)
+            worksheet.write_number(row, 4, area, center_)
+
+    try:
+        workbook.close()
+    except PermissionError:
+        return 2
+    return 0
@@ -0,0 +1,26 @@
+"""
+Choices offered by the command line tools and the GUI, kept apart from the
+modules implementing them so that parsing arguments or drawing the window
+does not import pdfminer, NumPy or xlsxwriter. Those load on the first
+conversion.
+"""
+import importlib.util
+
+# Keys of pdf_to_dict.EXTRACTORS
+BACKENDS = ("pdfminer", "fast")
+DEFAULT_BACKEND = "pdfminer"
+
+# calibration.WEIGHTINGS and calibration.AUTO_WEIGHTING
+CALIBRATION_WEIGHTINGS = ("none", "1/x", "1/x2", "auto")
+
+# Formats of writers.WRITERS, with the module each one needs besides the
+# standard library and numpy
+TABLE_FORMATS = {"csv": None, "parquet": "pyarrow", "arrow": "pyarrow"}
+
+
+def available_formats():
+    """
+    :return: List of the TABLE_FORMATS whose dependencies are installed
+    """
+    return [name for name, module in TABLE_FORMATS.items()
+            if module is None or importlib.util.find_spec(module)]
@@ -0,0 +1,248 @@
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import zlib
+from options import BACKENDS, DEFAULT_BACKEND
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_EXTENSION = ".pkz"
+# Prefix of the entries holding per-page results, see ParseCache.get_pages
+PAGES_PREFIX = "pages-"
+
+
+def default_cache_dir():
+    """
+    Folder used when no cache_dir is given. HPLC_CACHE_DIR overrides it,
+    otherwise it lives in the per-user cache folder of the platform.
+    """
+    if os.environ.get("HPLC_CACHE_DIR"):
+        return os.environ["HPLC_CACHE_DIR"]
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get(
+        "XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "DIQB-UC-HPLC", "parse")
+
+
+def file_digest(path, block_size=1 << 20):
+    """
+    :return: Hex SHA-256 of the contents of the file in path
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_content:
+        for block in iter(lambda: file_content.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    On-disk cache of read_pdf results keyed by file content and parser
+    version. Entries are compressed pickles; once the folder grows past
+    max_bytes the least recently used ones are deleted.
+
+    It also keeps the PageScan of every page read, keyed by page
+    fingerprint, so that a file missing from the cache only has its new or
+    changed pages extracted. Those are grouped in one entry per sequence,
+    named after the fingerprint of its first page, which stays the same
+    when the instrument exports the sequence again with more injections.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def key(self, path, backend=DEFAULT_BACKEND):
+        # pdf_to_dict loads pdfminer, which the cache commands do not need
+        from pdf_to_dict import PARSER_VERSION
+        key = f"{file_digest(path)}-v{PARSER_VERSION}"
+        # Backends may disagree on odd layouts, keep their results apart
+        return key if backend == DEFAULT_BACKEND else f"{key}-{backend}"
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_EXTENSION)
+
+    def get(self, key):
+        """
+        :return: Cached (processed, molecule_names) tuple or None
+        """
+        entry = self._entry_path(key)
+        try:
+            with open(entry, "rb") as cached:
+                value = pickle.loads(zlib.decompress(cached.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            # Truncated or otherwise unreadable entry, drop it
+            self._remove(entry)
+            return None
+        try:
+            # Access time drives the LRU eviction
+            os.utime(entry)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        data = zlib.compress(
+            pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never
+        # see half-written entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            self._remove(tmp_path)
+            return
+        self.evict()
+
+    def get_pages(self, fingerprints):
+        """
+        :param fingerprints: pdf_to_dict.page_fingerprint of every page of a
+                             file, in order
+        :return: Dict {fingerprint: PageScan} with the pages already known
+        """
+        if not fingerprints:
+            return {}
+        scans = self.get(PAGES_PREFIX + fingerprints[0]) or {}
+        wanted = set(fingerprints)
+        return {fingerprint: scan for fingerprint, scan in scans.items()
+                if fingerprint in wanted}
+
+    def put_pages(self, scans):
+        """
+        :param scans: Dict {fingerprint: PageScan} of every page of a file,
+                      in page order. Replaces the entry of its sequence, so
+                      pages gone from the latest version are dropped.
+        """
+        if scans:
+            self.put(PAGES_PREFIX + next(iter(scans)), scans)
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(ENTRY_EXTENSION):
+                continue
+            entry = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return entries
+
+    @staticmethod
+    def _remove(entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in
+        max_bytes
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(entry)
+            total -= size
+
+    def invalidate(self, path):
+        """
+        Forgets the cached result of the file in path, for every parser
+        version, and the per-page results of its sequence for every backend,
+        so that the next read parses every page again
+        """
+        prefix = file_digest(path) + "-v"
+        for _, _, entry in self._entries():
+            if os.path.basename(entry).startswith(prefix):
+                self._remove(entry)
+        # pdf_to_dict loads pdfminer, which only this needs
+        from pdf_to_dict import page_fingerprints
+        for backend in BACKENDS:
+            try:
+                fingerprints = page_fingerprints(path, backend)
+            except Exception:
+                # Not a readable PDF, so it cannot have pages cached
+                break
+            if fingerprints:
+                self._remove(self._entry_path(PAGES_PREFIX +
+                                              fingerprints[0]))
+
+    def clear(self):
+        for _, _, entry in self._entries():
+            self._remove(entry)
+
+    def stats(self):
+        """
+        :return: Tuple (number of entries, total bytes)
+        """
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def read_pdf(self, path, report_progress_sgn=None, workers=1, stats=None,
+                 backend=DEFAULT_BACKEND, cancel_event=None):
+        """
+        Same as pdf_to_dict.read_pdf, but returns the cached result when the
+        file was already parsed with the current parser version and backend,
+        and otherwise reuses the cached results of its pages
+        """
+        from pdf_to_dict import read_pdf
+        key = self.key(path, backend)
+        cached = self.get(key)
+        if cached is not None:
+            if stats:
+                stats.count("cache_hits")
+            if report_progress_sgn:
+                report_progress_sgn.emit(1.0)
+            return cached
+        result = read_pdf(path, report_progress_sgn, workers=workers,
+                          stats=stats, backend=backend,
+                          cancel_event=cancel_event, page_store=self)
+        self.put(key, result)
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Administra el caché de lectura de PDFs")
+    parser.add_argument("--dir", default=None,
+                        help="Carpeta del caché (por defecto, "
+                             f"{default_cache_dir()})")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("stats", help="Muestra el tamaño del caché")
+    commands.add_parser("clear", help="Borra todo el caché")
+    invalidate = commands.add_parser(
+        "invalidate", help="Borra del caché los archivos indicados y sus "
+                           "páginas, para volver a leerlos completos")
+    invalidate.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    cache = ParseCache(args.dir)
+    if args.command == "clear":
+        cache.clear()
+    elif args.command == "invalidate":
+        for path in args.paths:
+            try:
+                cache.invalidate(path)
+            except OSError as error:
+                print(f"{path}: {error}", file=sys.stderr)
+    entries, size = cache.stats()
+    print(f"{cache.cache_dir}: {entries} archivos, {size / 2 ** 20:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+PDF loading for read_pdf: documents are read through a memory map and keep
+a bounded cache of the objects they decode, and pdfminer fonts are shared
+across files whose font resources are identical, as happens with every
+report printed from the same instrument template. Each thread keeps an
+ExtractionContext, so the resource manager and the extractors are built
+once and reused for every file it reads.
+"""
+import collections
+import contextlib
+import hashlib
+import mmap
+import threading
+from pdfminer.cmapdb import CMapDB
+from pdfminer.pdfparser import PDFParser, PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdftypes import PDFStream, PDFObjRef
+from pdfminer.psparser import PSLiteral
+
+# Decoded objects kept per document. Resource and font dictionaries are
+# looked up on every page, page content streams only once.
+MAX_OBJECTS = 4096
+# Fonts kept across files
+MAX_FONTS = 64
+# CMaps loaded by name (CID fonts) kept across files
+MAX_CMAPS = 16
+# Nesting followed when fingerprinting a font, deeper specs are not shared
+MAX_FINGERPRINT_DEPTH = 8
+
+
+class BoundedCache(collections.OrderedDict):
+    """
+    Dict dropping its least recently used entries past max_entries. None
+    means no bound.
+    """
+
+    def __init__(self, max_entries):
+        super().__init__()
+        self.max_entries = max_entries
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if self.max_entries is not None and len(self) > self.max_entries:
+            self.popitem(last=False)
+
+
+class CachingDocument(PDFDocument):
+    """
+    PDFDocument whose cache of decoded objects is bounded, so that it can
+    stay enabled on long sequences
+    """
+
+    def __init__(self, max_objects=MAX_OBJECTS):
+        super().__init__(caching=True)
+        self._cached_objs = BoundedCache(max_objects)
+        self._parsed_objs = BoundedCache(max_objects)
+
+    def _parse_everything(self):
+        # Last resort for broken xref tables: every object is read at once
+        # and can only be found in the cache afterwards
+        self._cached_objs.max_entries = None
+        super()._parse_everything()
+
+
+class FontCache:
+    """
+    Thread-safe LRU of pdfminer fonts keyed by the fingerprint of their
+    resolved font dictionary
+    """
+
+    def __init__(self, max_fonts=MAX_FONTS):
+        self.max_fonts = max_fonts
+        self.hits = 0
+        self.misses = 0
+        self._fonts = BoundedCache(max_fonts)
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        with self._lock:
+            font = self._fonts.get(fingerprint)
+            if font is None:
+                self.misses += 1
+            else:
+                # get() skips __getitem__, refresh the entry by hand
+                self._fonts.move_to_end(fingerprint)
+                self.hits += 1
+            return font
+
+    def put(self, fingerprint, font):
+        with self._lock:
+            self._fonts[fingerprint] = font
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self.hits = self.misses = 0
+
+
+FONT_CACHE = FontCache()
+# pdfminer keeps every CMap it loads by name for the life of the process
+CMapDB._cmap_cache = BoundedCache(MAX_CMAPS)
+CMapDB._umap_cache = BoundedCache(MAX_CMAPS)
+
+
+def _canonical(obj, depth=0):
+    """
+    :return: Hashable representation of obj with its references resolved,
+             raising RecursionError past MAX_FINGERPRINT_DEPTH
+    """
+    if depth > MAX_FINGERPRINT_DEPTH:
+        raise RecursionError("font spec too deep to fingerprint")
+    if isinstance(obj, PDFObjRef):
+        obj = obj.resolve()
+    if isinstance(obj, PDFStream):
+        return ("stream", _canonical(obj.attrs, depth + 1),
+                hashlib.sha1(obj.get_data()).digest())
+    if isinstance(obj, dict):
+        return tuple(sorted((key, _canonical(value, depth + 1))
+                            for key, value in obj.items()))
+    if isinstance(obj, list):
+        return tuple(_canonical(value, depth + 1) for value in obj)
+    if isinstance(obj, PSLiteral):
+        return ("/", obj.name)
+    return obj
+
+
+def font_fingerprint(spec):
+    """
+    :param spec: Font dictionary as given to PDFResourceManager.get_font
+    :return: Digest identifying the font across documents, or None if it
+             cannot be computed
+    """
+    try:
+        canonical = _canonical(spec)
+    except (RecursionError, TypeError):
+        return None
+    return hashlib.sha1(repr(canonical).encode("utf-8", "replace")).digest()
+
+
+class SharedFontResourceManager(PDFResourceManager):
+    """
+    PDFResourceManager that, besides its own per-document cache by object
+    id, takes fonts from font_cache when another document already built the
+    same one
+    """
+
+    def __init__(self, font_cache=FONT_CACHE):
+        super().__init__(caching=True)
+        self.font_cache = font_cache
+
+    def begin_document(self):
+        """
+        Forgets the fonts cached by object id, which only identify them
+        within one document. font_cache is kept.
+        """
+        self._cached_fonts.clear()
+
+    def get_font(self, objid, spec):
+        if objid and objid in self._cached_fonts:
+            return self._cached_fonts[objid]
+        fingerprint = font_fingerprint(spec) if self.font_cache else None
+        font = self.font_cache.get(fingerprint) if fingerprint else None
+        if font is None:
+            font = super().get_font(objid, spec)
+            if fingerprint:
+                self.font_cache.put(fingerprint, font)
+        elif objid:
+            self._cached_fonts[objid] = font
+        return font
+
+
+@contextlib.contextmanager
+def open_pdf(path, max_objects=MAX_OBJECTS):
+    """
+    Opens the pdf in path through a memory map
+
+    :return: Context manager giving an initialized CachingDocument
+    """
+    with open(path, "rb") as file_content:
+        try:
+            data = mmap.mmap(file_content.fileno(), 0,
+                             access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file, let pdfminer complain about it
+            data = None
+        try:
+            # https://stackoverflow.com/a/45103154
+            parser = PDFParser(data if data is not None else file_content)
+            doc = CachingDocument(max_objects)
+            parser.set_document(doc)
+            doc.set_parser(parser)
+            doc.initialize('')
+            yield doc
+        finally:
+            if data is not None:
+                data.close()
+
+
+class ExtractionContext:
+    """
+    Text extraction state kept across files: a resource manager sharing
+    fonts through font_cache, and one extractor per backend with its
+    converter, interpreter and text buffer. Only the fonts cached by object
+    id are reset between documents.
+
+    A context reads one document at a time and is not thread-safe,
+    current_context gives every thread its own.
+    """
+
+    def __init__(self, font_cache=FONT_CACHE):
+        self.rsrcmgr = SharedFontResourceManager(font_cache)
+        self.documents = 0
+        self.busy = False
+        self._extractors = {}
+
+    def extractor(self, factory):
+        """
+        :param factory: Extractor class taking a resource manager, as the
+                        values of pdf_to_dict.EXTRACTORS
+        :return: The extractor of this context built by factory
+        """
+        extractor = self._extractors.get(factory)
+        if extractor is None:
+            extractor = self._extractors[factory] = factory(self.rsrcmgr)
+        return extractor
+
+    @contextlib.contextmanager
+    def open(self, path, max_objects=MAX_OBJECTS):
+        """
+        Same as open_pdf, preparing the context for a new document
+        """
+        if self.busy:
+            raise RuntimeError("ExtractionContext is already reading a PDF")
+        self.busy = True
+        try:
+            self.rsrcmgr.begin_document()
+            self.documents += 1
+            with open_pdf(path, max_objects) as doc:
+                yield doc
+        finally:
+            self.busy = False
+
+
+_local = threading.local()
+
+
+def current_context(context=None):
+    """
+    :param context: ExtractionContext to use instead of the one of this
+                    thread
+    :return: context, or the ExtractionContext of this thread. When that
+             one is still reading another document, as when the generators
+             of two files are consumed in turns, a new one is returned.
+    """
+    if context is None:
+        context = getattr(_local, "context", None)
+        if context is None:
+            context = _local.context = ExtractionContext()
+    if context.busy:
+        return ExtractionContext(context.rsrcmgr.font_cache)
+    return context
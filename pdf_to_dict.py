@@ -1,9 +1,24 @@
-from pdfminer.pdfparser import PDFParser, PDFDocument
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter, resolve1
+from pdfminer.pdfinterp import PDFPageInterpreter, resolve1
+from pdfminer.pdftypes import stream_value
 from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
+from pdfminer.pdfdevice import PDFTextDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from collections import namedtuple
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
 import re
 import io
+import time
+from options import DEFAULT_BACKEND
+from profiling import NO_STATS
+from pdf_io import open_pdf, current_context, SharedFontResourceManager
+
+# Bump whenever a change in this module alters what read_pdf returns, so
+# results cached by parse_cache are not reused across parser versions.
+PARSER_VERSION = 2
 
 # RegEx compiles
 F = re.MULTILINE | re.IGNORECASE
@@ -15,80 +30,397 @@ INNER_DET = re.compile(r"^\d+\s(\w*(?:\s\w*)*)\s( |\d|,)+", F)
 VERTICAL_TEXT = re.compile(r"\s((?!0)(\S\s+)+)0 (\d+ +)+", F)
 STD_SAMPLE_NAME = re.compile(r"(?:Sample Name|Nombre de la muestra):\s*St", F)
 STD_VIAL_TYPE = re.compile(r"(Vial Type|Tipo):\s*std", F)
+# Space separated fields of a line of the peak table
+TABLE_FIELD = re.compile(r"[^ ]+")
+
+# Layout thresholds, relative to the character size. Shared by both text
+# extraction backends so that they split lines and words alike.
+CHAR_MARGIN = 200
+WORD_MARGIN = 2
+LINE_OVERLAP = 0.5
+LINE_MARGIN = 0.5
 
 
-def read_pdf(path, report_progress_sgn=None):
+class ParseCancelled(Exception):
+    """
+    Raised by read_pdf when its cancel_event is set before the last page
     """
-    Reads the pdf file given in path and reports progress if a signal is given
 
-    :return: Dict with format
-    {"samples":
-        {"sample_name_1":
-            {"molecule_1": area_m1, "molecule_2": area_m2}
-        }
-     "standards":
-        {"molecule_1":
-            {concentration_1: area_1, concentration_2: area_2}
-        }
-     "int_standards":
-        {"sample_name_1":
-            {"molecule_1": area_m1}
-         "sample_name_2":
-            {"molecule_1": area_m1}
-        }
-    }
+
+class PdfminerExtractor:
+    """
+    Reference extraction backend: pdfminer's TextConverter, which runs the
+    full layout analysis over every character of the page
+
+    :param rsrcmgr: pdfminer resource manager, by default one sharing fonts
+                    across files through pdf_io.FONT_CACHE
     """
-    # https://stackoverflow.com/a/45103154
-    with open(path, "rb") as file_content:
-        parser = PDFParser(file_content)
-        doc = PDFDocument(caching=False)
-        parser.set_document(doc)
-        doc.set_parser(parser)
-        doc.initialize('')
-        rsrcmgr = PDFResourceManager()
+
+    def __init__(self, rsrcmgr=None):
+        rsrcmgr = rsrcmgr or SharedFontResourceManager()
         laparams = LAParams()
-        laparams.char_margin = 200  # 200  Seems important for \n separation
-        laparams.word_margin = 2  # 2 Seems to break for >4
+        laparams.char_margin = CHAR_MARGIN  # Seems important for \n separation
+        laparams.word_margin = WORD_MARGIN  # Seems to break for >4
         # device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-        retstr = io.StringIO()
-        device = TextConverter(rsrcmgr, retstr, laparams=laparams)
-        interpreter = PDFPageInterpreter(rsrcmgr, device)
-        sample_names_set = set()
-        molecule_names_set = set()
-        sample_types = {}
-        last_sample_name = None
-        processed = {"samples": {},
-                     "standards": {},
-                     "int_standards": {}}
-
-        tot_pages = resolve1(doc.catalog["Pages"])["Count"]
-        # Process each page contained in the document.
-        for n, page in enumerate(doc.get_pages(), 1):
-            # Report a float progress between 0 and 1 to the thread.
-            # It then delegates another signal for the GUI and updates this
-            # file's progress bar.
-            if report_progress_sgn:
-                report_progress_sgn.emit(n / tot_pages)
-            interpreter.process_page(page)
-            text = retstr.getvalue()
-            is_standard = False
-            sample_name = None
-
-            if BLANK.search(text):
-                retstr.truncate(0)
-                retstr.seek(0)
+        self.retstr = io.StringIO()
+        device = TextConverter(rsrcmgr, self.retstr, laparams=laparams)
+        self.interpreter = PDFPageInterpreter(rsrcmgr, device)
+
+    def page_text(self, page):
+        self.interpreter.process_page(page)
+        text = self.retstr.getvalue()
+        self.retstr.truncate(0)
+        self.retstr.seek(0)
+        return text
+
+
+class _BaselineDevice(PDFTextDevice):
+    """
+    pdfminer device receiving the strings of the text-showing operators
+    (Tj, TJ, ' and ") already positioned by the interpreter. Characters are
+    joined into lines by baseline as they arrive, applying the same rules
+    as pdfminer's layout analysis but without building its LTChar, plane
+    and text box objects.
+
+    Only horizontal writing is supported, the text of vertical fonts is
+    dropped.
+    """
+
+    def __init__(self, rsrcmgr):
+        super().__init__(rsrcmgr)
+        self.begin_page(None, None)
+
+    def begin_page(self, page, ctm):
+        # Each line is [x0, y0, x1, y1, list of strings]
+        self.lines = []
+        self.figure_text = []
+        self._figures = 0
+        self._prev = None
+
+    def begin_figure(self, name, bbox, matrix):
+        self._figures += 1
+
+    def end_figure(self, name):
+        self._figures -= 1
+
+    def render_string_horizontal(self, seq, matrix, point, font, fontsize,
+                                 scaling, charspace, wordspace, rise,
+                                 dxscale):
+        (x, y) = point
+        (a, b, c, d, e, f) = matrix
+        bottom = font.get_descent() * fontsize + rise
+        top = bottom + font.get_height() * fontsize
+        # Upright text, the usual case, keeps the same vertical bounds for
+        # every character of the string
+        upright = b == 0 and c == 0 and a > 0 and d > 0
+        if upright:
+            y0, y1 = d * (y + bottom) + f, d * (y + top) + f
+        needcharspace = False
+        for obj in seq:
+            if isinstance(obj, (int, float)):
+                x -= obj * dxscale
+                needcharspace = True
                 continue
+            for cid in font.decode(obj):
+                if needcharspace:
+                    x += charspace
+                try:
+                    text = font.to_unichr(cid)
+                except PDFUnicodeNotDefined:
+                    text = f"(cid:{cid})"
+                adv = font.char_width(cid) * fontsize * scaling
+                if upright:
+                    x0 = a * x + e
+                    self._add_char(text, x0, y0, x0 + a * adv, y1)
+                else:
+                    # Glyph box, computed as LTChar does
+                    ox, oy = x * a + y * c + e, x * b + y * d + f
+                    gx0, gy0 = c * bottom + ox, d * bottom + oy
+                    gx1, gy1 = a * adv + c * top + ox, b * adv + d * top + oy
+                    self._add_char(text, min(gx0, gx1), min(gy0, gy1),
+                                   max(gx0, gx1), max(gy0, gy1))
+                x += adv
+                if cid == 32 and wordspace:
+                    x += wordspace
+                needcharspace = True
+        return (x, y)
 
-            if STD_SAMPLE_NAME.search(text) or STD_VIAL_TYPE.search(text):
-                is_standard = True
+    def _add_char(self, text, x0, y0, x1, y1):
+        if self._figures:
+            # Text inside form XObjects is not laid out by TextConverter
+            # either, it is written as is after the text boxes
+            self.figure_text.append(text)
+            return
+        prev = self._prev
+        self._prev = (text, x0, y0, x1, y1)
+        if prev is not None:
+            p_text, p_x0, p_y0, p_x1, p_y1 = prev
+            if p_y0 == y0 and p_y1 == y1:
+                same_line = y1 > y0
+            else:
+                overlap = (p_y1 if p_y1 < y1 else y1) - \
+                          (p_y0 if p_y0 > y0 else y0)
+                same_line = overlap >= 0 and overlap > LINE_OVERLAP * min(
+                    p_y1 - p_y0, y1 - y0)
+            if same_line and max(0, x0 - p_x1, p_x0 - x1) < \
+                    CHAR_MARGIN * max(p_x1 - p_x0, x1 - x0):
+                line = self.lines[-1]
+                if p_x1 < x0 - WORD_MARGIN * (x1 - x0) and \
+                        p_text != " " and text != " ":
+                    line[4].append(" ")
+                line[4].append(text)
+                if x0 < line[0]:
+                    line[0] = x0
+                if x1 > line[2]:
+                    line[2] = x1
+                if y0 < line[1]:
+                    line[1] = y0
+                if y1 > line[3]:
+                    line[3] = y1
+                return
+        self.lines.append([x0, y0, x1, y1, [text]])
+
+    def page_text(self):
+        """
+        :return: Text of the page in TextConverter's format: lines from top
+                 to bottom, an empty line between vertically separated
+                 blocks and a form feed at the end
+        """
+        texts = []
+        empties = []
+        for x0, y0, x1, y1, parts in self.lines:
+            text = "".join(parts)
+            if text.strip():
+                texts.append((-y1, x0, y0, x1, text))
+            else:
+                empties.append(text + "\n")
+        texts.sort(key=lambda line: line[:2])
+        out = []
+        prev = None
+        for top, x0, y0, x1, text in texts:
+            if prev is not None:
+                p_x0, p_y0, p_x1, p_height = prev
+                # Lines further apart than LINE_MARGIN times their height,
+                # or not overlapping horizontally, start a new text box
+                if p_y0 + top > LINE_MARGIN * max(p_height, -top - y0) or \
+                        x1 < p_x0 or p_x1 < x0:
+                    out.append("\n")
+            out.append(text + "\n")
+            prev = (x0, y0, x1, -top - y0)
+        if out:
+            out.append("\n")
+        out.extend(self.figure_text)
+        out.extend(empties)
+        out.append("\f")
+        return "".join(out)
+
+
+class FastExtractor:
+    """
+    Lightweight extraction backend. The content stream is still interpreted
+    by pdfminer, but the text-showing operators are turned into lines by
+    their baseline directly, skipping the layout analysis that dominates
+    the time of PdfminerExtractor.
+
+    :param rsrcmgr: pdfminer resource manager, as in PdfminerExtractor
+    """
+
+    def __init__(self, rsrcmgr=None):
+        rsrcmgr = rsrcmgr or SharedFontResourceManager()
+        self.device = _BaselineDevice(rsrcmgr)
+        self.interpreter = PDFPageInterpreter(rsrcmgr, self.device)
+
+    def page_text(self, page):
+        self.interpreter.process_page(page)
+        return self.device.page_text()
+
+
+# Text extraction backends accepted by read_pdf
+# Keys listed in options.BACKENDS too
+EXTRACTORS = {"pdfminer": PdfminerExtractor, "fast": FastExtractor}
+
+
+def _extract_page_range(path, start, stop, backend=DEFAULT_BACKEND,
+                        only=None):
+    """
+    Extracts the text of pages [start, stop) (0-based) of the pdf in path.
+    Runs inside worker processes when read_pdf parses pages in parallel.
+
+    :param only: Optional set of 0-based page numbers, the pages of the
+                 range outside it are skipped
+    :return: List with (text, wall time, cpu time) of each page, in order
+    """
+    texts = []
+    # Worker processes keep their context across the ranges they read
+    context = current_context()
+    with context.open(path) as doc:
+        extractor = context.extractor(EXTRACTORS[backend])
+        for n, page in enumerate(doc.get_pages()):
+            if n < start or (only is not None and n not in only):
+                continue
+            if n >= stop:
+                break
+            wall, cpu = time.perf_counter(), time.process_time()
+            text = extractor.page_text(page)
+            texts.append((text, time.perf_counter() - wall,
+                          time.process_time() - cpu))
+    return texts
+
+
+def _page_ranges(tot_pages, workers):
+    """
+    Splits tot_pages into contiguous ranges, a few per worker so that slow
+    pages do not leave the other processes idle at the end.
+    """
+    chunks = min(tot_pages, workers * 4)
+    size, extra = divmod(tot_pages, chunks)
+    ranges = []
+    start = 0
+    for i in range(chunks):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def page_fingerprint(page, backend=DEFAULT_BACKEND):
+    """
+    :param page: pdfminer PDFPage
+    :return: Hex digest of the content streams and geometry of the page,
+             the parser version and the backend. Reports printed from the
+             same template share their fonts, so the content stream is
+             enough to tell whether the page reads the same.
+    """
+    digest = hashlib.sha1(f"{PARSER_VERSION}-{backend}".encode())
+    digest.update(repr((page.mediabox, page.rotate)).encode())
+    for content in page.contents:
+        stream = stream_value(content)
+        # Hash the stored bytes, which spares decompressing the stream
+        raw = stream.get_rawdata()
+        digest.update(raw if raw is not None else stream.get_data())
+    return digest.hexdigest()
+
+
+def page_fingerprints(path, backend=DEFAULT_BACKEND):
+    """
+    :return: List with the page_fingerprint of every page of the pdf in path
+    """
+    with open_pdf(path) as doc:
+        return [page_fingerprint(page, backend) for page in doc.get_pages()]
+
+
+# Stages of read_pdf. Each one is a generator consuming the previous one, so
+# callers can start using peaks while later pages are still being read.
+#
+#   iter_page_texts -> scan_carried -> classify_scans -> iter_peak_rows
+#   -> collect_peaks
+#
+# scan_page only looks at its own page, so its PageScans can be stored by
+# page_fingerprint and reused when the same page shows up again, which is
+# what read_pdf does with a page_store. The text of an unnamed page is
+# carried over into the next one, as the original parser never cleared it,
+# so the page after one is scanned again with that text in front
+# (scan_carried). classify_scans holds the state that depends on the
+# previous pages and is cheap to replay.
+
+# skip is None for pages with peaks, or BLANK_PAGE / UNNAMED_PAGE. rows are
+# the table_rows of the page, empty for skipped pages.
+PageScan = namedtuple("PageScan", ["skip", "sample_name", "is_standard",
+                                   "rows"])
+Page = namedtuple("Page", ["number", "sample_name", "is_standard", "rows"])
+PeakRecord = namedtuple("PeakRecord",
+                        ["kind", "sample_name", "molecule", "conc", "area"])
+
+# PeakRecord kinds. Rows whose area or concentration cannot be read are
+# yielded as REJECTED, since their molecule name still counts as found.
+STANDARD = "standard"
+INT_STANDARD = "int_standard"
+SAMPLE = "sample"
+REJECTED = "rejected"
+
+# PageScan skip reasons
+BLANK_PAGE = "blank"
+UNNAMED_PAGE = "unnamed"
+
+
+def scan_page(text):
+    """
+    Reads everything read_pdf needs from the text of a single page: whether
+    it is skipped, its sample name as printed, whether it is marked as a
+    standard and the rows of its peak table
+
+    :return: PageScan
+    """
+    if BLANK.search(text):
+        return PageScan(BLANK_PAGE, None, False, [])
+
+    is_standard = False
+    if STD_SAMPLE_NAME.search(text) or STD_VIAL_TYPE.search(text):
+        is_standard = True
+
+    sample_name = None
+    found_sample_name = SAMPLE_NAME.findall(text)
+    if len(found_sample_name) > 0:
+        if found_sample_name[0] != "":
+            sample_name = found_sample_name[0]
+
+    if sample_name is None:
+        # Probably an almost empty page
+        return PageScan(UNNAMED_PAGE, None, is_standard, [])
+    return PageScan(None, sample_name, is_standard, list(table_rows(text)))
+
+
+def scan_carried(text, carried=None):
+    """
+    scan_page of text preceded by the text carried over from the unnamed
+    pages right before it. Blank and named pages clear it, so a table on an
+    unnamed page is read as the table of the next sample.
+
+    :param carried: Text of the previous unnamed pages, or None
+    :return: Tuple (PageScan, text to carry over to the next page or None)
+    """
+    if carried is not None:
+        text = carried + text
+    scan = scan_page(text)
+    return scan, text if scan.skip == UNNAMED_PAGE else None
 
-            found_sample_name = SAMPLE_NAME.findall(text)
-            if len(found_sample_name) > 0:
-                if found_sample_name[0] != "":
-                    sample_name = found_sample_name[0]
 
-            if sample_name is None:
-                continue  # Probably an almost empty page
+def scan_pages(texts, stats=NO_STATS):
+    """
+    :param texts: Iterable with the text of each page, in order
+    :param stats: profiling.Stats collecting the "scan" stage time
+    :return: Generator of PageScan, see scan_carried
+    """
+    carried = None
+    for text in texts:
+        with stats.stage("scan"):
+            scan, carried = scan_carried(text, carried)
+        yield scan
+
+
+def classify_scans(scans, stats=NO_STATS):
+    """
+    Skips blank and unnamed pages and resolves the sample name of the rest,
+    keeping track of repeated sample names and multi-page standards
+
+    :param scans: Iterable with the PageScan of each page, in order
+    :param stats: profiling.Stats collecting the "classify" stage time and
+                  the blank and unnamed page counters
+    :return: Generator of Page
+    """
+    sample_names_set = set()
+    sample_types = {}
+    last_sample_name = None
+    for number, scan in enumerate(scans, 1):
+        with stats.stage("classify"):
+            if scan.skip == BLANK_PAGE:
+                stats.count("blank_pages")
+                continue
+            if scan.skip == UNNAMED_PAGE:
+                stats.count("unnamed_pages")
+                continue
+            sample_name = scan.sample_name
+            is_standard = scan.is_standard
             if sample_name == "":
                 sample_name = "Sin nombre"
 
@@ -112,98 +444,396 @@ def read_pdf(path, report_progress_sgn=None):
             elif sample_types[sample_name] == "standard":
                 is_standard = True
 
-            # vert = VERTICAL_TEXT.findall(text)
-            # if vert:
-            #     if vert[0]:
-            #         print(
-            #         vert[0][0][::-1].replace("\n\n", " ").replace("\n", ""))
-            data_section = False
-            started_saving_data = False
-            col_names = None
-            for line in text.split("\n"):
-                if all(i in line for i in ("Area", "Name")):
-                    col_names = [i for i in line.split(" ") if not i.isdigit()]
-                    data_section = True
+        yield Page(number, sample_name, is_standard, scan.rows)
+
+
+def classify_pages(texts, stats=NO_STATS):
+    """
+    classify_scans straight from the text of each page
+
+    :return: Generator of Page
+    """
+    return classify_scans(scan_pages(texts, stats), stats)
+
+
+class TableLayout:
+    """
+    Where the name, area and concentration of a peak table row are found,
+    computed once per header line. Rows as wide as the header are read
+    column by column. Wider rows have spaces in their name: the columns to
+    the left of "Name" are read from the start of the row, the ones to its
+    right from the end, and the name is whatever is left in between.
+
+    Columns are looked up the way a dict built from the row would, so a
+    repeated column takes its last value, and without a "Conc" column the
+    concentration is the value of the column added last.
+    """
+
+    def __init__(self, col_names):
+        self.col_names = col_names
+        self.width = len(col_names)
+
+        # Rows as wide as the header, {column: index}
+        columns = {name: i for i, name in enumerate(col_names)}
+        self.has_fields = "Name" in columns and "Area" in columns
+        if self.has_fields:
+            self.name = columns["Name"]
+            self.area = columns["Area"]
+            self.conc = columns.get("Conc", columns[list(columns)[-1]])
+
+        # Wider rows, {column: index} with negative indexes to the right of
+        # "Name" and None for the name joined from the middle of the row
+        self.name_start = None
+        if "Name" not in columns:
+            return
+        self.name_start = col_names.index("Name")
+        self.name_end = self.width - self.name_start - 1
+        columns = {}
+        for i, name in enumerate(col_names):
+            if i != self.name_start:
+                columns[name] = i if i < self.name_start else i - self.width
+        columns["Name"] = None
+        self.wide_area = columns.get("Area")
+        self.wide_conc = columns.get("Conc", columns[list(columns)[-1]])
+
+    def row(self, vals):
+        """
+        :param vals: Fields of a row with at least width of them
+        :return: (name, area, conc) tuple, or None if the header lacks the
+                 "Name" or "Area" column
+        """
+        if len(vals) == self.width:
+            if not self.has_fields:
+                return None
+            return vals[self.name], vals[self.area], vals[self.conc]
+        if self.name_start is None:
+            # Same error as looking the column up in the header
+            self.col_names.index("Name")
+        if self.wide_area is None:
+            return None
+        name = " ".join(vals[self.name_start:len(vals) - self.name_end])
+        conc = name if self.wide_conc is None else vals[self.wide_conc]
+        return name, vals[self.wide_area], conc
+
+
+@functools.lru_cache(maxsize=64)
+def table_layout(col_names):
+    """
+    :param col_names: Tuple with the columns of a header line
+    :return: TableLayout, shared by every table with the same header
+    """
+    return TableLayout(list(col_names))
+
+
+def table_rows(text):
+    """
+    Reads the peak table of a page, located below the line with the "Area"
+    and "Name" column headers
+
+    :return: Generator of (name, area, conc) tuples of strings, where conc is
+             the "Conc" column or, if there is none, the last one
+    """
+    # vert = VERTICAL_TEXT.findall(text)
+    # if vert:
+    #     if vert[0]:
+    #         print(
+    #         vert[0][0][::-1].replace("\n\n", " ").replace("\n", ""))
+    layout = None
+    started_saving_data = False
+    for line in text.split("\n"):
+        if "Area" in line and "Name" in line:
+            # Runs of spaces give empty column names, which still take a
+            # field of the row
+            layout = table_layout(
+                tuple(i for i in line.split(" ") if not i.isdigit()))
+            continue
+        if layout is None:
+            continue
+        if line == "" and started_saving_data:
+            break
+        vals = TABLE_FIELD.findall(line.strip())
+        # If already started saving data
+        # and this line is blank, break to save cycles
+        if len(vals) < 3 and started_saving_data:
+            break
+        # Not a full row, not enough data available
+        if len(vals) < layout.width:
+            continue
+        started_saving_data = True
+        row = layout.row(vals)
+        if row is not None:
+            yield row
+
+
+def iter_peak_rows(pages, stats=NO_STATS):
+    """
+    :param pages: Iterable of Page, as given by classify_pages
+    :param stats: profiling.Stats collecting the rejected row counters
+    :return: Generator of PeakRecord, one per row of every peak table
+    """
+    for page in pages:
+        for name, area, conc in page.rows:
+            try:
+                area = float(area.replace(",", "."))
+            except ValueError:
+                stats.count("rejected_area")
+                yield PeakRecord(REJECTED, page.sample_name, name, None, None)
+                continue
+
+            # Standard molecule
+            if page.is_standard:
+                try:
+                    conc = float(conc.replace(",", "."))
+                except ValueError:
+                    stats.count("rejected_conc")
+                    yield PeakRecord(REJECTED, page.sample_name, name, None,
+                                     None)
                     continue
-                if data_section:
-                    if line == "" and started_saving_data:
-                        break
-
-                    line = re.sub(' +', ' ', line).strip()
-                    vals = [i for i in line.split(" ") if i != ""]
-                    # If already started saving data
-                    # and this line is blank, break to save cycles
-                    if len(vals) < 3 and started_saving_data:
-                        break
-                    # Not a full row, not enough data available
-                    if len(vals) < len(col_names):
-                        continue
-                    if len(vals) > len(col_names):
-                        # Account for a longer-than-expected Name field
-                        # with spaces (which are the delimiters)
-                        started_saving_data = True
-                        col_names_ = col_names[:]
-                        positive_name_col_idx = col_names_.index("Name")
-                        reverse_name_col_idx = positive_name_col_idx - len(
-                            col_names_) + 1
-                        line_dict = {}
-                        # Add elements from the left of the Name column
-                        for positive_idx in range(positive_name_col_idx):
-                            col_name, value = col_names_.pop(0), vals.pop(0)
-                            line_dict[col_name] = value
-                        # Add elements by reverse indexing to the right of Name
-                        for negative_idx in range(reverse_name_col_idx, 0):
-                            col_name = col_names_.pop(negative_idx)
-                            value = vals.pop(negative_idx)
-                            line_dict[col_name] = value
-                        # The only values left should be the Name with spaces
-                        if len(vals) > 0 and len(col_names_) > 0:
-                            line_dict["Name"] = " ".join(vals)
-                    else:
-                        started_saving_data = True
-                        line_dict = {k: v for k, v in zip(col_names, vals)}
-                    # By now, line_dict should be filled with the sought values
-                    if "Name" in line_dict and "Area" in line_dict:
-                        name, area = line_dict["Name"], line_dict["Area"]
-                        molecule_names_set.add(name)
-                        try:
-                            area = float(area.replace(",", "."))
-                        except ValueError:
-                            continue
-
-                        # Standard molecule
-                        if is_standard:
-                            conc = line_dict.get("Conc")
-                            if conc is None:
-                                # Fallback: use the last column blindly
-                                conc = list(line_dict.values())[-1]
-                            try:
-                                conc = float(conc.replace(",", "."))
-                            except ValueError:
-                                continue
-                            if name in processed["standards"]:
-                                processed["standards"][name][conc] = area
-                            else:
-                                processed["standards"][name] = {conc: area}
-                        # Assume Internal Standard
-                        elif line_dict["Name"].lower().endswith("_is"):
-                            if sample_name in processed["int_standards"]:
-                                processed["int_standards"][sample_name][
-                                    name] = area
-                            else:
-                                processed["int_standards"][sample_name] = {
-                                    name: area}
-                        # Otherwise it is a sample
-                        else:
-                            if sample_name in processed["samples"]:
-                                processed["samples"][sample_name][name] = area
-                            else:
-                                processed["samples"][sample_name] = {name: area}
-
-            retstr.truncate(0)
-            retstr.seek(0)
+                yield PeakRecord(STANDARD, page.sample_name, name, conc, area)
+            # Assume Internal Standard
+            elif name.lower().endswith("_is"):
+                yield PeakRecord(INT_STANDARD, page.sample_name, name, None,
+                                 area)
+            # Otherwise it is a sample
+            else:
+                yield PeakRecord(SAMPLE, page.sample_name, name, None, area)
+
+
+def collect_peaks(records):
+    """
+    Accumulates PeakRecords into the dicts returned by read_pdf
+
+    :return: Tuple (processed, sorted molecule names)
+    """
+    molecule_names_set = set()
+    processed = {"samples": {},
+                 "standards": {},
+                 "int_standards": {}}
+    for kind, sample_name, name, conc, area in records:
+        molecule_names_set.add(name)
+        if kind == STANDARD:
+            if name in processed["standards"]:
+                processed["standards"][name][conc] = area
+            else:
+                processed["standards"][name] = {conc: area}
+        elif kind == INT_STANDARD:
+            if sample_name in processed["int_standards"]:
+                processed["int_standards"][sample_name][name] = area
+            else:
+                processed["int_standards"][sample_name] = {name: area}
+        elif kind == SAMPLE:
+            if sample_name in processed["samples"]:
+                processed["samples"][sample_name][name] = area
+            else:
+                processed["samples"][sample_name] = {name: area}
     # print(processed)
-    # print(sample_types)
     # print(molecule_names_set)
-    # return tot_pages
     return processed, sorted(list(molecule_names_set))
+
+
+def iter_page_texts(path, report_progress_sgn=None, workers=1,
+                    stats=NO_STATS, backend=DEFAULT_BACKEND,
+                    cancel_event=None, only=None, context=None):
+    """
+    Extracts the text of every page of the pdf in path, reporting progress
+    if a signal is given
+
+    :param workers: Number of processes used to extract the text. With more
+                    than one, pages are split across a process pool and
+                    still yielded in order.
+    :param stats: profiling.Stats collecting the time of every page
+    :param backend: Key of EXTRACTORS used to turn each page into text
+    :param cancel_event: Optional threading.Event checked before every page
+                         (every range of pages with workers), raising
+                         ParseCancelled once it is set
+    :param only: Optional list of 0-based page numbers, in order. Only
+                 those pages are extracted, and progress counts them alone.
+    :param context: pdf_io.ExtractionContext, by default the one of the
+                    current thread, reused across the files it reads
+    :return: Generator of page texts
+    """
+    if backend not in EXTRACTORS:
+        raise ValueError(f"Unknown extraction backend {backend!r}")
+    context = current_context(context)
+    with contextlib.ExitStack() as opened:
+        with stats.stage("open"):
+            doc = opened.enter_context(context.open(path))
+            tot_pages = resolve1(doc.catalog["Pages"])["Count"]
+        selected = list(range(tot_pages)) if only is None else list(only)
+        if workers is not None and workers > 1 and len(selected) > 1:
+            ranges = _page_ranges(len(selected), workers)
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(_extract_page_range, path,
+                                       selected[start], selected[stop - 1] + 1,
+                                       backend,
+                                       None if only is None else
+                                       set(selected[start:stop]))
+                           for start, stop in ranges]
+                for (start, stop), future in zip(ranges, futures):
+                    if cancel_event is not None and cancel_event.is_set():
+                        for pending in futures:
+                            pending.cancel()
+                        raise ParseCancelled(path)
+                    for n, (text, wall, cpu) in zip(selected[start:stop],
+                                                    future.result()):
+                        stats.page(n + 1, wall, cpu)
+                        yield text
+                    if report_progress_sgn:
+                        report_progress_sgn.emit(stop / len(selected))
+            return
+
+        extractor = context.extractor(EXTRACTORS[backend])
+        wanted = None if only is None else set(selected)
+        done = 0
+        # Process each page contained in the document.
+        for n, page in enumerate(doc.get_pages(), 1):
+            if wanted is not None and n - 1 not in wanted:
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                raise ParseCancelled(path)
+            done += 1
+            # Report a float progress between 0 and 1 to the thread.
+            # It then delegates another signal for the GUI and updates this
+            # file's progress bar.
+            if report_progress_sgn:
+                report_progress_sgn.emit(done / len(selected))
+            wall, cpu = time.perf_counter(), time.process_time()
+            text = extractor.page_text(page)
+            stats.page(n, time.perf_counter() - wall,
+                       time.process_time() - cpu)
+            yield text
+
+
+def iter_page_scans(path, report_progress_sgn=None, workers=1,
+                    stats=NO_STATS, backend=DEFAULT_BACKEND,
+                    cancel_event=None, page_store=None, context=None):
+    """
+    PageScan of every page of the pdf in path. With a page_store, pages
+    whose fingerprint it already knows are not extracted again, and the
+    scans of the rest are added to it once the last page is read. The store
+    keeps the scan of each page on its own: unnamed pages and the pages
+    after them are still extracted, to scan them with the carried text.
+
+    :param page_store: Optional object with get_pages(fingerprints),
+                       returning a dict {fingerprint: PageScan} with the
+                       ones it has, and put_pages(scans), taking a dict
+                       {fingerprint: PageScan} of every page of the file,
+                       in page order.
+                       parse_cache.ParseCache is one.
+    :return: Generator of PageScan
+    """
+    if page_store is None:
+        yield from scan_pages(
+            iter_page_texts(path, report_progress_sgn, workers, stats,
+                            backend, cancel_event, context=context),
+            stats)
+        return
+    if backend not in EXTRACTORS:
+        raise ValueError(f"Unknown extraction backend {backend!r}")
+    with stats.stage("fingerprint"):
+        fingerprints = page_fingerprints(path, backend)
+        known = page_store.get_pages(fingerprints)
+    # Only the first of the pages repeated within a file is extracted, the
+    # others reuse its scan below, so texts has one entry per new page.
+    # Known unnamed pages and the pages after them need their text as well.
+    missing = []
+    first_seen = set(known)
+    after_unnamed = False
+    for n, fingerprint in enumerate(fingerprints):
+        unnamed = fingerprint in known and \
+            known[fingerprint].skip == UNNAMED_PAGE
+        if fingerprint not in first_seen or unnamed or after_unnamed:
+            first_seen.add(fingerprint)
+            missing.append(n)
+        after_unnamed = unnamed
+    stats.count("reused_pages", len(fingerprints) - len(missing))
+    texts = iter_page_texts(path, report_progress_sgn, workers, stats,
+                            backend, cancel_event, only=missing,
+                            context=context)
+    extracted = set(missing)
+    scans = {}
+    carried = None
+    for n, fingerprint in enumerate(fingerprints):
+        text = next(texts) if n in extracted else None
+        scan = known.get(fingerprint)
+        if scan is None:
+            scan = scans.get(fingerprint)
+        if scan is None:
+            with stats.stage("scan"):
+                scan = scan_page(text)
+        scans[fingerprint] = scan
+        if carried is not None or scan.skip == UNNAMED_PAGE:
+            if text is None:
+                # Found unnamed only now, next to a page already known
+                stats.count("reused_pages", -1)
+                text = next(iter_page_texts(path, None, 1, stats, backend,
+                                            cancel_event, only=[n]))
+            with stats.stage("scan"):
+                scan, carried = scan_carried(text, carried)
+        yield scan
+    page_store.put_pages(scans)
+    if not missing and report_progress_sgn:
+        report_progress_sgn.emit(1.0)
+
+
+def iter_peaks(path, report_progress_sgn=None, workers=1, stats=None,
+               backend=DEFAULT_BACKEND, cancel_event=None, page_store=None,
+               context=None):
+    """
+    Streaming version of read_pdf
+
+    :return: Generator of PeakRecord, yielded as pages are read
+    """
+    stats = stats or NO_STATS
+    pages = classify_scans(
+        iter_page_scans(path, report_progress_sgn, workers, stats, backend,
+                        cancel_event, page_store, context),
+        stats)
+    return iter_peak_rows(pages, stats)
+
+
+def read_pdf(path, report_progress_sgn=None, workers=1, stats=None,
+             backend=DEFAULT_BACKEND, cancel_event=None, page_store=None,
+             context=None):
+    """
+    Reads the pdf file given in path and reports progress if a signal is given
+
+    :param workers: Number of processes used to extract the text of the
+                    pages. With more than one, pages are split across a
+                    process pool and merged in order afterwards, producing
+                    exactly the same result as the sequential path.
+    :param stats: Optional profiling.Stats recording time per stage and per
+                  page, and counters of skipped pages and rejected rows
+    :param backend: Text extraction backend, "pdfminer" (the reference,
+                    with pdfminer's full layout analysis) or "fast" (lines
+                    rebuilt from the baselines of the text operators)
+    :param cancel_event: Optional threading.Event, checked between pages.
+                         Once set, ParseCancelled is raised.
+    :param page_store: Optional store of per-page results, see
+                       iter_page_scans. When a sequence is exported again
+                       with more injections, only its new or changed pages
+                       are extracted.
+    :param context: Optional pdf_io.ExtractionContext. By default every
+                    thread (and worker process) keeps one, so a batch does
+                    not rebuild the resource manager and extractors for
+                    each file.
+    :return: Dict with format
+    {"samples":
+        {"sample_name_1":
+            {"molecule_1": area_m1, "molecule_2": area_m2}
+        }
+     "standards":
+        {"molecule_1":
+            {concentration_1: area_1, concentration_2: area_2}
+        }
+     "int_standards":
+        {"sample_name_1":
+            {"molecule_1": area_m1}
+         "sample_name_2":
+            {"molecule_1": area_m1}
+        }
+    }
+    """
+    return collect_peaks(iter_peaks(path, report_progress_sgn, workers,
+                                    stats, backend, cancel_event, page_store,
+                                    context))
@@ -0,0 +1,182 @@
+import numpy as np
+
+# Values of PeakTable.kind
+SAMPLE = 0
+STANDARD = 1
+INT_STANDARD = 2
+
+
+class PeakTable:
+    """
+    Columnar version of the dicts returned by read_pdf. Every peak is a row
+    of the parallel arrays:
+        kind:     SAMPLE, STANDARD or INT_STANDARD
+        sample:   index into sample_names (-1 for standards)
+        molecule: index into molecule_names
+        conc:     standard concentration (NaN for the other kinds)
+        area:     peak area
+    Rows keep the order of the original dicts, so to_processed gives back
+    exactly what read_pdf returned.
+    """
+
+    def __init__(self, kind, sample, molecule, conc, area, sample_names,
+                 molecule_names, sample_order, int_standard_order):
+        self.kind = kind
+        self.sample = sample
+        self.molecule = molecule
+        self.conc = conc
+        self.area = area
+        self.sample_names = sample_names
+        self.molecule_names = molecule_names
+        # Sample indices in the order of processed["samples"] and
+        # processed["int_standards"]
+        self.sample_order = sample_order
+        self.int_standard_order = int_standard_order
+        self.molecule_index = {name: i for i, name in
+                               enumerate(molecule_names)}
+        # Rows grouped by molecule, keeping their relative order, so that
+        # every per-molecule query is a slice instead of a full scan
+        self._by_molecule = np.argsort(molecule, kind="mergesort")
+        self._bounds = np.searchsorted(molecule[self._by_molecule],
+                                       np.arange(len(molecule_names) + 1))
+        self._sample_areas = None
+        self._int_standard_areas = None
+
+    @classmethod
+    def from_processed(cls, processed, molecule_names):
+        """
+        :param processed: First element of the tuple returned by read_pdf
+        :param molecule_names: Second element of the tuple returned by
+                               read_pdf
+        """
+        molecule_names = list(molecule_names)
+        molecule_index = {name: i for i, name in enumerate(molecule_names)}
+        sample_names = []
+        sample_index = {}
+
+        def sample_id(name):
+            if name not in sample_index:
+                sample_index[name] = len(sample_names)
+                sample_names.append(name)
+            return sample_index[name]
+
+        kind, sample, molecule, conc, area = [], [], [], [], []
+        for name, points in processed["standards"].items():
+            for concentration, value in points.items():
+                kind.append(STANDARD)
+                sample.append(-1)
+                molecule.append(molecule_index[name])
+                conc.append(concentration)
+                area.append(value)
+        for row_kind, key in ((SAMPLE, "samples"),
+                              (INT_STANDARD, "int_standards")):
+            for sample_name, peaks in processed[key].items():
+                s = sample_id(sample_name)
+                for name, value in peaks.items():
+                    kind.append(row_kind)
+                    sample.append(s)
+                    molecule.append(molecule_index[name])
+                    conc.append(np.nan)
+                    area.append(value)
+        return cls(np.array(kind, dtype=np.int8),
+                   np.array(sample, dtype=np.int32),
+                   np.array(molecule, dtype=np.int32),
+                   np.array(conc, dtype=np.float64),
+                   np.array(area, dtype=np.float64),
+                   sample_names, molecule_names,
+                   np.array([sample_index[name] for name in
+                             processed["samples"]], dtype=np.int32),
+                   np.array([sample_index[name] for name in
+                             processed["int_standards"]], dtype=np.int32))
+
+    def __len__(self):
+        return len(self.area)
+
+    def rows(self, molecule):
+        """
+        :param molecule: Molecule name or index
+        :return: Indices of the rows of that molecule, in table order
+        """
+        if not isinstance(molecule, (int, np.integer)):
+            molecule = self.molecule_index[molecule]
+        return self._by_molecule[self._bounds[molecule]:
+                                 self._bounds[molecule + 1]]
+
+    def standards(self, molecule):
+        """
+        :return: Tuple (conc, area) of arrays with the calibration points of
+                 the molecule, sorted by increasing concentration
+        """
+        rows = self.rows(molecule)
+        rows = rows[self.kind[rows] == STANDARD]
+        conc, area = self.conc[rows], self.area[rows]
+        increasing = np.argsort(conc, kind="mergesort")
+        return conc[increasing], area[increasing]
+
+    def _dense(self, row_kind, order):
+        position = np.full(len(self.sample_names), -1, dtype=np.int64)
+        position[order] = np.arange(len(order))
+        matrix = np.zeros((len(order), len(self.molecule_names)))
+        rows = self.kind == row_kind
+        matrix[position[self.sample[rows]], self.molecule[rows]] = \
+            self.area[rows]
+        return matrix
+
+    def sample_areas(self):
+        """
+        :return: Matrix (samples x molecules) of areas, with 0 where the
+                 sample has no peak for that molecule. Rows follow
+                 sample_order.
+        """
+        if self._sample_areas is None:
+            self._sample_areas = self._dense(SAMPLE, self.sample_order)
+        return self._sample_areas
+
+    def int_standard_areas(self):
+        """
+        :return: Matrix (samples x molecules) of internal standard areas,
+                 rows following int_standard_order
+        """
+        if self._int_standard_areas is None:
+            self._int_standard_areas = self._dense(INT_STANDARD,
+                                                   self.int_standard_order)
+        return self._int_standard_areas
+
+    def sample_list(self):
+        return [self.sample_names[i] for i in self.sample_order]
+
+    def int_standard_list(self):
+        return [self.sample_names[i] for i in self.int_standard_order]
+
+    def int_standard_molecules(self):
+        """
+        :return: Sorted indices of the molecules found as internal standards
+        """
+        return np.unique(self.molecule[self.kind == INT_STANDARD])
+
+    def to_processed(self):
+        """
+        Compatibility accessor
+
+        :return: The (processed, molecule_names) tuple read_pdf returns
+        """
+        processed = {"samples": {},
+                     "standards": {},
+                     "int_standards": {}}
+        for name in self.sample_list():
+            processed["samples"][name] = {}
+        for name in self.int_standard_list():
+            processed["int_standards"][name] = {}
+        for kind, sample, molecule, conc, area in zip(
+                self.kind.tolist(), self.sample.tolist(),
+                self.molecule.tolist(), self.conc.tolist(),
+                self.area.tolist()):
+            name = self.molecule_names[molecule]
+            if kind == STANDARD:
+                processed["standards"].setdefault(name, {})[conc] = area
+            elif kind == SAMPLE:
+                processed["samples"][self.sample_names[sample]][name] = area
+            else:
+                processed["int_standards"][self.sample_names[sample]][
+                    name] = area
+        return processed, list(self.molecule_names)
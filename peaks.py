@@ -0,0 +1,249 @@
+"""
+Peak areas computed from the raw chromatograms of ctx_reader, as a check on
+the peak tables read_pdf scrapes from the reports. Every step works on whole
+arrays: a baseline interpolated between block minima, local maxima of the
+smoothed signal above the noise, and integration between the points where
+each peak returns to the baseline through cumulative sums, so one pass over
+the trace serves any number of peaks.
+
+    windows = {"Glucosa": (8.1, 8.9), "Ribitol_IS": (12.0, 12.6)}
+    processed, molecule_names = traces_to_processed(
+        {"Muestra 1": load_ctx("m1.ctx")},
+        [(load_ctx("std1.ctx"), {"Glucosa": 1.0})], windows)
+"""
+from collections import namedtuple
+import numpy as np
+
+# Minutes of signal per block of the baseline, longer than the widest peak
+BASELINE_WINDOW = 1.0
+# Points of the moving average used to find apexes and peak bounds
+SMOOTH_POINTS = 15
+# Apexes below this many noise deviations above the baseline are ignored
+MIN_HEIGHT_NOISE = 10.0
+# A peak ends where its smoothed signal drops below this many deviations
+BOUND_NOISE = 3.0
+
+TRAPEZOID = "trapezoid"
+SIMPSON = "simpson"
+
+# Parallel arrays, one element per peak, sorted by apex
+Peaks = namedtuple("Peaks", ["apex", "left", "right", "time", "height",
+                             "area"])
+
+
+def moving_average(values, points):
+    """
+    Centered moving average through a cumulative sum, shrinking the window
+    at both ends of the array
+    """
+    points = max(1, int(points))
+    if points == 1 or len(values) == 0:
+        return np.asarray(values, dtype=np.float64)
+    n = len(values)
+    total = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    half = points // 2
+    if points > n:
+        index = np.arange(n)
+    else:
+        # Full windows by slicing, only the edges need their own bounds
+        averaged = np.empty(n)
+        averaged[half:n - points + half + 1] = \
+            (total[points:] - total[:n - points + 1]) / points
+        index = np.concatenate((np.arange(half),
+                                np.arange(n - points + half + 1, n)))
+    lo = np.maximum(index - half, 0)
+    hi = np.minimum(index + points - half, n)
+    if points > n:
+        return (total[hi] - total[lo]) / (hi - lo)
+    averaged[index] = (total[hi] - total[lo]) / (hi - lo)
+    return averaged
+
+
+def noise_level(signal):
+    """
+    :return: Standard deviation of the noise of signal, estimated from the
+             median absolute difference between neighbours so that peaks
+             and baseline drift do not count
+    """
+    if len(signal) < 2:
+        return 0.0
+    # MAD to sigma, and the difference of two samples doubles the variance
+    return float(1.4826 * np.median(np.abs(np.diff(signal))) / np.sqrt(2))
+
+
+def baseline(time, signal, window=BASELINE_WINDOW,
+             smooth_points=SMOOTH_POINTS):
+    """
+    Baseline under the peaks: the minimum of the smoothed signal in every
+    block of window minutes, linearly interpolated between blocks
+
+    :return: Array like signal
+    """
+    n = len(signal)
+    if n == 0:
+        return np.zeros(0)
+    interval = (time[-1] - time[0]) / (n - 1) if n > 1 else 1.0
+    block = int(max(2, min(n, round(window / interval)))) if interval > 0 \
+        else n
+    smoothed = moving_average(signal, smooth_points)
+    blocks = -(-n // block)
+    # Pad the last block with its own edge so every block has block points
+    padded = np.concatenate((smoothed,
+                             np.full(blocks * block - n, smoothed[-1])))
+    minima = padded.reshape(blocks, block)
+    position = np.argmin(minima, axis=1)
+    index = np.minimum(np.arange(blocks) * block + position, n - 1)
+    return np.interp(time, time[index], minima[np.arange(blocks), position])
+
+
+def integrate(time, values, left, right, method=TRAPEZOID):
+    """
+    Integral of values over time between every pair of indices left[i] and
+    right[i] (both included), computed from cumulative sums
+
+    :param method: TRAPEZOID, or SIMPSON, which uses the mean spacing of
+                   each interval and closes an odd number of intervals with
+                   a trapezoid
+    :return: Array of areas
+    """
+    left = np.asarray(left, dtype=np.int64)
+    right = np.asarray(right, dtype=np.int64)
+    if method == TRAPEZOID:
+        slices = (values[1:] + values[:-1]) * np.diff(time) / 2
+        total = np.concatenate(([0.0], np.cumsum(slices)))
+        return total[right] - total[left]
+    if method != SIMPSON:
+        raise ValueError(f"Unknown integration method {method!r}")
+    odd = (right - left) % 2
+    stop = right - odd
+    parity = np.arange(len(values)) % 2
+    even_sums = np.concatenate(([0.0], np.cumsum(np.where(parity == 0,
+                                                          values, 0.0))))
+    odd_sums = np.concatenate(([0.0], np.cumsum(np.where(parity == 1,
+                                                         values, 0.0))))
+    # Interior points [left + 1, stop), weighted 4 at odd offsets from left
+    inner_even = even_sums[np.maximum(stop, left + 1)] - even_sums[left + 1]
+    inner_odd = odd_sums[np.maximum(stop, left + 1)] - odd_sums[left + 1]
+    left_even = left % 2 == 0
+    fours = np.where(left_even, inner_odd, inner_even)
+    twos = np.where(left_even, inner_even, inner_odd)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spacing = np.where(stop > left,
+                           (time[stop] - time[left]) / (stop - left), 0.0)
+    areas = np.where(stop > left, spacing / 3 * (
+        values[left] + 4 * fours + 2 * twos + values[stop]), 0.0)
+    tail = (values[stop] + values[right]) * (time[right] - time[stop]) / 2
+    return areas + np.where(odd == 1, tail, 0.0)
+
+
+def find_peaks(time, signal, min_height=None, method=TRAPEZOID,
+               baseline_window=BASELINE_WINDOW, smooth_points=SMOOTH_POINTS):
+    """
+    Finds and integrates the peaks of a baseline corrected signal
+
+    :param min_height: Smallest apex height above the baseline, by default
+                       MIN_HEIGHT_NOISE times the noise level
+    :param method: Integration method, see integrate
+    :return: Peaks. Apexes sharing the same bounds (shoulders, or peaks
+             that do not return to the baseline between them) count as one,
+             the highest.
+    """
+    time = np.asarray(time, dtype=np.float64)
+    corrected = np.asarray(signal, dtype=np.float64) - baseline(
+        time, signal, baseline_window, smooth_points)
+    noise = noise_level(corrected)
+    smoothed = moving_average(corrected, smooth_points)
+    if min_height is None:
+        min_height = MIN_HEIGHT_NOISE * noise
+    middle = smoothed[1:-1]
+    apex = np.flatnonzero((middle > smoothed[:-2]) &
+                          (middle >= smoothed[2:]) &
+                          (middle > min_height)) + 1
+    # Bounds: last point at the baseline before the apex, first one after
+    at_baseline = np.flatnonzero(smoothed < BOUND_NOISE * noise)
+    after = np.searchsorted(at_baseline, apex)
+    if len(at_baseline):
+        left = np.where(after > 0, at_baseline[np.maximum(after - 1, 0)], 0)
+        right = np.where(after < len(at_baseline),
+                         at_baseline[np.minimum(after,
+                                                len(at_baseline) - 1)],
+                         len(time) - 1)
+    else:
+        left = np.zeros(len(apex), dtype=np.int64)
+        right = np.full(len(apex), len(time) - 1, dtype=np.int64)
+
+    # One apex per pair of bounds, the highest
+    height = smoothed[apex]
+    order = np.lexsort((-height, left))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = left[order][1:] != left[order][:-1]
+    keep = np.sort(order[first])
+    apex, left, right = apex[keep], left[keep], right[keep]
+    return Peaks(apex, left, right, time[apex], corrected[apex],
+                 integrate(time, corrected, left, right, method))
+
+
+def window_areas(peaks, windows):
+    """
+    :param peaks: Peaks of one trace
+    :param windows: Dict {molecule: (start, stop)} of retention times
+    :return: Dict {molecule: area} of the highest peak whose apex falls in
+             each window, leaving out molecules without one
+    """
+    areas = {}
+    starts = np.searchsorted(peaks.time, [start for start, _ in
+                                          windows.values()])
+    stops = np.searchsorted(peaks.time, [stop for _, stop in
+                                         windows.values()])
+    for molecule, first, last in zip(windows, starts, stops):
+        if last > first:
+            best = first + int(np.argmax(peaks.height[first:last]))
+            areas[molecule] = float(peaks.area[best])
+    return areas
+
+
+def trace_areas(trace, windows, channel=None, **options):
+    """
+    :param trace: ctx_reader.Trace
+    :param options: Keyword arguments of find_peaks
+    :return: Dict {molecule: area}, see window_areas
+    """
+    return window_areas(find_peaks(trace.time, trace.signal(channel),
+                                   **options), windows)
+
+
+def traces_to_processed(samples, standards, windows, channel=None,
+                        **options):
+    """
+    Integrates sample and standard injections into the structure read_pdf
+    returns, so PeakTable.from_processed and dict_to_xl take them as they
+    are. Molecules ending in "_IS" of the samples go to int_standards, as in
+    the reports.
+
+    :param samples: Dict {sample name: Trace}
+    :param standards: Iterable of (Trace, {molecule: concentration}) pairs,
+                      one per calibration injection
+    :param windows: Dict {molecule: (start, stop)} of retention times
+    :param channel: Detector channel integrated, the first by default
+    :param options: Keyword arguments of find_peaks
+    :return: Tuple (processed, sorted molecule names), as read_pdf
+    """
+    processed = {"samples": {},
+                 "standards": {},
+                 "int_standards": {}}
+    molecule_names_set = set()
+    for trace, concentrations in standards:
+        areas = trace_areas(trace, windows, channel, **options)
+        for molecule, conc in concentrations.items():
+            if molecule in areas:
+                molecule_names_set.add(molecule)
+                processed["standards"].setdefault(molecule, {})[conc] = \
+                    areas[molecule]
+    for sample_name, trace in samples.items():
+        for molecule, area in trace_areas(trace, windows, channel,
+                                          **options).items():
+            molecule_names_set.add(molecule)
+            key = "int_standards" if molecule.lower().endswith("_is") \
+                else "samples"
+            processed[key].setdefault(sample_name, {})[molecule] = area
+    return processed, sorted(molecule_names_set)
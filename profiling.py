@@ -0,0 +1,132 @@
+import cProfile
+import json
+import time
+
+
+class _Timer:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add(self.name, time.perf_counter() - self.wall,
+                       time.process_time() - self.cpu)
+        return False
+
+
+class Stats:
+    """
+    Wall and CPU time per stage and per page, plus event counters, recorded
+    while a file goes through read_pdf and dict_to_xlsx
+    """
+
+    def __init__(self):
+        # name -> [wall, cpu, calls]
+        self.stages = {}
+        # [page number, wall, cpu] of the text extraction of every page
+        self.pages = []
+        self.counters = {}
+
+    def stage(self, name):
+        """
+        Context manager adding the time spent inside it to stage name
+        """
+        return _Timer(self, name)
+
+    def add(self, name, wall, cpu):
+        stage = self.stages.setdefault(name, [0.0, 0.0, 0])
+        stage[0] += wall
+        stage[1] += cpu
+        stage[2] += 1
+
+    def page(self, number, wall, cpu):
+        self.pages.append([number, wall, cpu])
+        self.add("extract", wall, cpu)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {"stages": {name: {"wall": wall, "cpu": cpu, "calls": calls}
+                           for name, (wall, cpu, calls) in
+                           self.stages.items()},
+                "pages": self.pages,
+                "counters": dict(self.counters)}
+
+    def __bool__(self):
+        return True
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullStats:
+    """
+    Stand-in used when no instrumentation was requested, so the
+    instrumented code does not need to check for it
+    """
+    _timer = _NullTimer()
+
+    def stage(self, name):
+        return self._timer
+
+    def add(self, name, wall, cpu):
+        pass
+
+    def page(self, number, wall, cpu):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def __bool__(self):
+        return False
+
+
+NO_STATS = NullStats()
+
+
+def summary(stats_dict):
+    """
+    :param stats_dict: Stats.as_dict() output
+    :return: Short multi-line text with the stages sorted by wall time and
+             the non-zero counters
+    """
+    stages = sorted(stats_dict["stages"].items(),
+                    key=lambda item: item[1]["wall"], reverse=True)
+    lines = [f"{name}: {timing['wall']:.2f} s ({timing['cpu']:.2f} s CPU)"
+             for name, timing in stages]
+    lines += [f"{name}: {value}" for name, value in
+              sorted(stats_dict["counters"].items()) if value]
+    return "\n".join(lines)
+
+
+def write_report(reports, path):
+    """
+    :param reports: Dict {file path: Stats.as_dict()}
+    """
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump(reports, out, indent=1)
+
+
+def profile_call(pstats_path, task, *args, **kwargs):
+    """
+    Runs task under cProfile and dumps the result to pstats_path
+
+    :return: Whatever task returns
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(task, *args, **kwargs)
+    finally:
+        profiler.dump_stats(pstats_path)
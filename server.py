@@ -0,0 +1,485 @@
+"""
+Local HTTP service converting HPLC reports for the lab PCs, so only one
+computer needs pdfminer installed. Worker processes are started and import
+pdfminer before the first request, so a conversion costs only its own time.
+
+    python server.py --port 8765 -j 4
+
+    curl --data-binary @reporte.pdf -o "Resultados reporte.xlsx" \\
+        "http://localhost:8765/convert?name=reporte.pdf"
+    curl --data-binary @reporte.pdf \\
+        "http://localhost:8765/convert?format=json&backend=fast"
+    curl http://localhost:8765/metrics
+
+POST /convert takes the PDF as the request body. Its query accepts format
+(xlsx or json), name (file name of the report), backend and od=1. GET
+/health and GET /metrics answer JSON. Requests beyond the queue limit are
+answered 503 at once, with a Retry-After header. If a worker process dies,
+the requests it took down are answered 503 too while the pool is started
+again, and /health answers 503 "broken" until it is.
+"""
+import argparse
+import collections
+import concurrent.futures
+import http.server
+import json
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures.process import BrokenProcessPool
+from cli import convert_file, STATUS_MESSAGES
+from options import BACKENDS, DEFAULT_BACKEND
+from parse_cache import ParseCache
+from profiling import Stats
+
+DEFAULT_PORT = 8765
+# Requests accepted at once, running or waiting for a worker
+DEFAULT_QUEUE_LIMIT = 16
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# Seconds a client may take to send its request
+REQUEST_TIMEOUT = 120
+# Conversions the latency percentiles and pages/s are computed over
+METRICS_WINDOW = 1000
+STREAM_CHUNK = 64 * 1024
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FORMATS = ("xlsx", "json")
+# HTTP status of every conversion status code, the PDF itself being the
+# problem when it cannot be read
+HTTP_STATUS = {0: 200, 1: 422, 2: 409, 3: 422, 4: 503}
+# Seconds clients are told to wait when the queue is full or the pool is
+# being started again
+RETRY_AFTER = "5"
+
+
+def _warm_up():
+    """
+    Run once by every worker process, so the first request does not pay for
+    the imports of pdfminer, NumPy and xlsxwriter
+    """
+    import dict_to_xl  # noqa: F401
+    import pdf_io  # noqa: F401
+    return os.getpid()
+
+
+def convert_upload(pdf_path, fmt="xlsx", report_od=False,
+                   backend=DEFAULT_BACKEND, cache=None):
+    """
+    Converts an uploaded PDF inside a worker process, writing the output
+    next to it
+
+    :param fmt: "xlsx" for the workbook of dict_to_xlsx, "json" for the
+                result of read_pdf
+    :return: Tuple (status code, output path or None, pages read, Stats
+             as_dict())
+    """
+    folder = os.path.dirname(pdf_path)
+    filename = os.path.splitext(os.path.basename(pdf_path))[0]
+    if fmt == "xlsx":
+        _, res, _, report = convert_file(pdf_path, folder, report_od, 1,
+                                         cache, backend=backend)
+        output = os.path.join(folder, f"Resultados {filename}.xlsx")
+    else:
+        from pdf_to_dict import read_pdf
+        stats = Stats()
+        output = os.path.join(folder, f"Resultados {filename}.json")
+        try:
+            reader = cache.read_pdf if cache is not None else read_pdf
+            result, molecule_names = reader(pdf_path, stats=stats,
+                                            backend=backend)
+            with open(output, "w", encoding="utf-8") as out:
+                json.dump({"molecules": molecule_names, "result": result},
+                          out, ensure_ascii=False)
+            res = 0
+        except PermissionError:
+            res = 2
+        except Exception:
+            res = 3
+        report = stats.as_dict()
+    pages = len(report["pages"]) + report["counters"].get("reused_pages", 0)
+    return res, output if res == 0 else None, pages, report
+
+
+class WorkerLost(Exception):
+    """
+    The worker process converting the request died, so the pool was started
+    again and the request is lost
+    """
+
+
+def _percentile(values, fraction):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    if not values:
+        return None
+    rank = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[rank]
+
+
+class ConversionService:
+    """
+    Process pool converting uploads, with a limit on the requests accepted
+    at once and the metrics of the last METRICS_WINDOW conversions
+    """
+
+    def __init__(self, workers=None, queue_limit=DEFAULT_QUEUE_LIMIT,
+                 cache=None, backend=DEFAULT_BACKEND, report_od=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        self.cache = cache
+        self.backend = backend
+        self.report_od = report_od
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.started = time.time()
+        self.ready = False
+        # True from the moment a dead worker is noticed until a new pool is
+        # warmed up
+        self.broken = False
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self.pending = 0
+        self.counters = collections.Counter()
+        # (start, end, pages) of the last conversions
+        self.recent = collections.deque(maxlen=METRICS_WINDOW)
+
+    def warm_up(self):
+        """
+        Starts every worker process and waits until it imported pdfminer
+        """
+        futures = [self.pool.submit(_warm_up) for _ in range(self.workers)]
+        pids = {future.result() for future in futures}
+        self.ready = True
+        return pids
+
+    @staticmethod
+    def _pool_broken(pool):
+        # Set by the executor as soon as it notices a dead worker, a bool
+        # before Python 3.9 and the reason since
+        return bool(getattr(pool, "_broken", False))
+
+    def _restart(self, pool):
+        """
+        Replaces pool, which lost a worker, with a new warmed up one. A
+        ProcessPoolExecutor stays broken once a worker dies, every submit
+        raising BrokenProcessPool. Requests that saw the same pool break
+        wait here and reuse the pool the first of them started.
+        """
+        with self._pool_lock:
+            if self.pool is not pool:
+                return
+            self.broken = True
+            with self._lock:
+                self.counters["restarts"] += 1
+            pool.shutdown(wait=False)
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+            try:
+                self.warm_up()
+            except BrokenProcessPool:
+                # Stays broken, the next request tries again
+                return
+            self.broken = False
+
+    def try_acquire(self):
+        """
+        :return: Whether a new request fits in the queue; if so, release
+                 must be called once it is answered
+        """
+        with self._lock:
+            if self.pending >= self.queue_limit:
+                self.counters["rejected"] += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+    def convert(self, pdf_path, fmt="xlsx", backend=None, report_od=None):
+        """
+        Converts pdf_path in the pool, blocking until it is done
+
+        :return: Same as convert_upload
+        :raises WorkerLost: A worker process died, the pool was started
+                            again
+        """
+        start = time.time()
+        pool = self.pool
+        if self._pool_broken(pool):
+            # Lost a worker while idle, nothing was running on it
+            self._restart(pool)
+            pool = self.pool
+        try:
+            future = pool.submit(
+                convert_upload, pdf_path, fmt,
+                self.report_od if report_od is None else report_od,
+                backend or self.backend, self.cache)
+            res, output, pages, report = future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                self.counters["requests"] += 1
+                self.counters["errors"] += 1
+            self._restart(pool)
+            raise WorkerLost()
+        except Exception:
+            # The task could not be sent or its result read back
+            res, output, pages, report = 3, None, 0, None
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["pages"] += pages
+            if res != 0:
+                self.counters["errors"] += 1
+            self.recent.append((start, time.time(), pages))
+        return res, output, pages, report
+
+    def metrics(self):
+        with self._lock:
+            recent = list(self.recent)
+            pending = self.pending
+            counters = dict(self.counters)
+        latencies = sorted(end - start for start, end, _ in recent)
+        span = max(end for _, end, _ in recent) - \
+            min(start for start, _, _ in recent) if recent else 0.0
+        pages = sum(pages for _, _, pages in recent)
+        return {"uptime": round(time.time() - self.started, 3),
+                "workers": self.workers,
+                "ready": self.ready,
+                "broken": self.broken,
+                "pending": pending,
+                "queue_depth": max(0, pending - self.workers),
+                "queue_limit": self.queue_limit,
+                "requests": counters.get("requests", 0),
+                "errors": counters.get("errors", 0),
+                "rejected": counters.get("rejected", 0),
+                "restarts": counters.get("restarts", 0),
+                "pages": counters.get("pages", 0),
+                "latency_p50": _percentile(latencies, 0.5),
+                "latency_p95": _percentile(latencies, 0.95),
+                "pages_per_second": pages / span if span > 0 else None}
+
+    def status(self):
+        """
+        :return: "ok", "starting" before warm_up or "broken" while the pool
+                 is started again after losing a worker
+        """
+        if self.broken or self._pool_broken(self.pool):
+            return "broken"
+        return "ok" if self.ready else "starting"
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class ConversionHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=()):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, message, headers=()):
+        # The body of the request may be unread, so the connection cannot
+        # be reused
+        self.close_connection = True
+        self._send_json(status, {"error": message},
+                        tuple(headers) + (("Connection", "close"),))
+
+    def _send_file(self, path, content_type, headers=()):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        quoted = urllib.parse.quote(os.path.basename(path))
+        self.send_header("Content-Disposition",
+                         f"attachment; filename*=UTF-8''{quoted}")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        with open(path, "rb") as output:
+            shutil.copyfileobj(output, self.wfile, STREAM_CHUNK)
+
+    def do_GET(self):
+        service = self.server.service
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/health":
+            status = service.status()
+            self._send_json(200 if status == "ok" else 503,
+                            {"status": status, "workers": service.workers})
+        elif path == "/metrics":
+            self._send_json(200, service.metrics())
+        else:
+            self._send_error(404, f"no existe {path}")
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/convert":
+            self._send_error(404, f"no existe {url.path}")
+            return
+        query = dict(urllib.parse.parse_qsl(url.query))
+        fmt = query.get("format", "xlsx").lower()
+        backend = query.get("backend", self.server.service.backend)
+        if fmt not in FORMATS:
+            self._send_error(400, f"formato desconocido {fmt!r}, se "
+                                  f"aceptan {', '.join(FORMATS)}")
+            return
+        if backend not in BACKENDS:
+            self._send_error(400, f"backend desconocido {backend!r}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._send_error(411, "falta Content-Length")
+            return
+        if length <= 0 or length > MAX_UPLOAD_BYTES:
+            self._send_error(413, f"el PDF debe pesar entre 1 y "
+                                  f"{MAX_UPLOAD_BYTES} bytes")
+            return
+        service = self.server.service
+        if not service.try_acquire():
+            self._send_error(503, "cola llena, reintentar más tarde",
+                             (("Retry-After", RETRY_AFTER),))
+            return
+        try:
+            self._convert(url, query, fmt, backend, length)
+        finally:
+            service.release()
+
+    def _convert(self, url, query, fmt, backend, length):
+        name = os.path.basename(query.get("name") or
+                                self.headers.get("X-Filename") or
+                                "reporte.pdf")
+        if not name.lower().endswith(".pdf"):
+            name += ".pdf"
+        folder = tempfile.mkdtemp(prefix="hplc-server-")
+        try:
+            pdf_path = os.path.join(folder, name)
+            with open(pdf_path, "wb") as upload:
+                remaining = length
+                while remaining:
+                    block = self.rfile.read(min(STREAM_CHUNK, remaining))
+                    if not block:
+                        break
+                    upload.write(block)
+                    remaining -= len(block)
+            if remaining:
+                self._send_error(400, "el PDF llegó incompleto")
+                return
+            start = time.perf_counter()
+            try:
+                res, output, pages, _ = self.server.service.convert(
+                    pdf_path, fmt, backend, query.get("od") == "1")
+            except WorkerLost:
+                self._send_error(503, "se detuvo un proceso de conversión, "
+                                      "reintentar más tarde",
+                                 (("Retry-After", RETRY_AFTER),))
+                return
+            headers = (("X-Status", str(res)), ("X-Pages", str(pages)),
+                       ("X-Elapsed", f"{time.perf_counter() - start:.3f}"))
+            if res != 0:
+                self._send_json(HTTP_STATUS.get(res, 500),
+                                {"status": res,
+                                 "error": STATUS_MESSAGES.get(
+                                     res, STATUS_MESSAGES[3])}, headers)
+                return
+            self._send_file(output, XLSX_TYPE if fmt == "xlsx" else
+                            "application/json; charset=utf-8", headers)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+class ConversionServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    HTTP server answering every request in its own thread, sharing one
+    ConversionService
+    """
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        super().__init__(address, ConversionHandler)
+        self.service = service
+        self.quiet = quiet
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def server_close(self):
+        super().server_close()
+        self.service.shutdown()
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, workers=None,
+                queue_limit=DEFAULT_QUEUE_LIMIT, cache=None,
+                backend=DEFAULT_BACKEND, quiet=False, warm=True):
+    """
+    :param port: 0 picks a free port, see ConversionServer.url
+    :param warm: Start the worker processes before returning
+    :return: ConversionServer, to be run with serve_forever
+    """
+    service = ConversionService(workers, queue_limit, cache, backend)
+    if warm:
+        service.warm_up()
+    try:
+        return ConversionServer((host, port), service, quiet)
+    except OSError:
+        service.shutdown()
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Servicio HTTP local que convierte reportes PDF de HPLC")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Dirección donde escuchar (0.0.0.0 para "
+                             "aceptar otros equipos de la red)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="Puerto (0 elige uno libre)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Número de procesos (por defecto, uno por CPU)")
+    parser.add_argument("-q", "--queue", type=int,
+                        default=DEFAULT_QUEUE_LIMIT,
+                        help="Solicitudes aceptadas a la vez; el resto "
+                             "recibe 503")
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        default=DEFAULT_BACKEND,
+                        help="Extracción de texto por defecto")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Volver a leer los PDFs aunque estén en caché")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Carpeta del caché de lectura")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1 or args.queue < 1:
+        print("--workers y --queue deben ser al menos 1", file=sys.stderr)
+        return 2
+    cache = None if args.no_cache else ParseCache(args.cache_dir)
+    server = make_server(args.host, args.port, args.workers, args.queue,
+                         cache, args.backend)
+    print(f"Escuchando en {server.url} con {server.service.workers} "
+          f"procesos", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Detenido")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Shared fixtures: the synthetic reports of benchmarks/parity.py, written once
+per session, and a reader of the cells of the workbooks dict_to_xlsx writes.
+"""
+import os
+import re
+import sys
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from parity import REPORTS  # noqa: E402
+from synthetic import write_report  # noqa: E402
+
+NS = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+@pytest.fixture(scope="session")
+def reports(tmp_path_factory):
+    """
+    :return: Dict {name: path} of the synthetic reports of parity.REPORTS
+    """
+    folder = tmp_path_factory.mktemp("reports")
+    paths = {}
+    for name, options in REPORTS.items():
+        paths[name] = str(folder / f"{name}.pdf")
+        write_report(paths[name], **options)
+    return paths
+
+
+@pytest.fixture(scope="session")
+def report(reports):
+    """
+    :return: Path of the report with mixed languages and a multi-page
+             standard
+    """
+    return reports["mixed"]
+
+
+def _text(element):
+    return "".join(t.text or "" for t in element.iter(f"{{{NS['x']}}}t"))
+
+
+def read_cells(xlsx_path):
+    """
+    :return: Dict {sheet name: {cell reference: (formula or None, value)}},
+             value being a float, a string or None
+    """
+    with zipfile.ZipFile(xlsx_path) as xlsx:
+        names = xlsx.namelist()
+        shared = []
+        if "xl/sharedStrings.xml" in names:
+            root = ElementTree.fromstring(xlsx.read("xl/sharedStrings.xml"))
+            shared = [_text(si) for si in root.findall("x:si", NS)]
+        workbook = ElementTree.fromstring(xlsx.read("xl/workbook.xml"))
+        sheets = {}
+        # xlsxwriter numbers the sheet files in workbook order
+        for n, sheet in enumerate(workbook.iterfind("x:sheets/x:sheet", NS),
+                                  1):
+            root = ElementTree.fromstring(
+                xlsx.read(f"xl/worksheets/sheet{n}.xml"))
+            cells = {}
+            for cell in root.iterfind("x:sheetData/x:row/x:c", NS):
+                formula = cell.find("x:f", NS)
+                value = cell.find("x:v", NS)
+                kind = cell.get("t")
+                if kind == "s":
+                    value = shared[int(value.text)]
+                elif kind == "inlineStr":
+                    value = _text(cell)
+                elif kind == "str":
+                    value = value.text if value is not None else None
+                elif value is not None:
+                    value = float(value.text)
+                cells[cell.get("r")] = (
+                    None if formula is None else formula.text, value)
+            sheets[sheet.get("name")] = cells
+    return sheets
+
+
+def column_values(cells, column, first_row):
+    """
+    :return: Values of column from first_row down to the first empty cell
+    """
+    values = []
+    row = first_row
+    while f"{column}{row}" in cells and cells[f"{column}{row}"][1] is not None:
+        values.append(cells[f"{column}{row}"][1])
+        row += 1
+    return values
+
+
+def find_row(cells, column, value):
+    """
+    :return: Number of the first row whose cell in column holds value
+    """
+    rows = [int(re.sub(r"\D", "", ref)) for ref, (_, cell) in cells.items()
+            if re.match(rf"{column}\d+$", ref) and cell == value]
+    return min(rows) if rows else None
+
+
+@pytest.fixture
+def cells():
+    return read_cells
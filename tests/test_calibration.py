@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from calibration import CalibrationModel, fit_calibrations, fit_quality, \
+    padded_standards, INVERSE_X, INVERSE_X2, NO_WEIGHTING, LINEAR, QUADRATIC
+from calibration_quality import reference_fit
+from peak_table import PeakTable
+from synthetic import synthetic_processed
+from writers import tidy_columns
+
+WEIGHTS = {NO_WEIGHTING: lambda x: np.ones_like(x), INVERSE_X: lambda x: 1 / x,
+           INVERSE_X2: lambda x: 1 / x ** 2}
+
+
+@pytest.fixture(scope="module")
+def table():
+    rng = np.random.RandomState(0)
+    processed, names = synthetic_processed(10, 12, 7)
+    for i, name in enumerate(sorted(processed["standards"])):
+        standards = processed["standards"][name]
+        for conc in standards:
+            standards[conc] *= 1 + rng.normal(0, 0.02)
+        # One standard far off in every fourth curve
+        if i % 4 == 0:
+            standards[max(standards)] *= 1.5
+    return PeakTable.from_processed(processed, names)
+
+
+def test_straight_line_matches_polyfit(table):
+    calibrations = fit_calibrations(table)
+    for m in range(len(table.molecule_names)):
+        x, y = table.standards(m)
+        if len(x) < 2:
+            assert not calibrations.fitted[m]
+            continue
+        slope, intercept = np.polyfit(x, y, 1)
+        assert calibrations.slope[m] == pytest.approx(slope)
+        assert calibrations.intercept[m] == pytest.approx(intercept)
+        assert calibrations.r2[m] == pytest.approx(
+            np.corrcoef(x, y)[0, 1] ** 2)
+        assert calibrations.slope_zero[m] == pytest.approx(
+            np.linalg.lstsq(x[:, None], y, rcond=None)[0][0])
+
+
+@pytest.mark.parametrize("model", [
+    CalibrationModel(),
+    CalibrationModel(INVERSE_X, LINEAR),
+    CalibrationModel(INVERSE_X2, QUADRATIC),
+], ids=str)
+def test_quality_matches_one_fit_per_curve(table, model):
+    quality = fit_quality(table, model)
+    conc, area, valid = padded_standards(table)
+    for m in np.flatnonzero(valid.any(axis=1)):
+        x, y = conc[m][valid[m]], area[m][valid[m]]
+        coefficients, studentized, cooks = reference_fit(
+            x, y, WEIGHTS[model.weighting](x), model.degree)
+        used = quality.used[m]
+        assert np.allclose(quality.coefficients[m, :model.degree + 1],
+                           coefficients)
+        assert np.allclose(quality.studentized[m][used], studentized)
+        assert np.allclose(quality.cooks[m][used], cooks)
+
+
+def test_rejecting_outliers_drops_the_spoiled_standards(table):
+    quality = fit_quality(table, CalibrationModel(INVERSE_X2, LINEAR, True))
+    spoiled = [table.molecule_names.index(name) for name in
+               sorted(table.molecule_names)[:quality.fitted.sum():4]]
+    assert quality.rejected.any(axis=1)[spoiled].all()
+
+
+def test_concentrations_invert_the_curve(table):
+    calibrations = fit_calibrations(table, CalibrationModel(
+        NO_WEIGHTING, QUADRATIC, False))
+    areas = table.sample_areas()[:, calibrations.fitted]
+    concentrations = calibrations.concentrations[:, calibrations.fitted]
+    coefficients = [values[calibrations.fitted] for values in (
+        calibrations.curvature, calibrations.slope, calibrations.intercept)]
+    # Areas past the vertex of a curve bent by a spoiled standard have no
+    # concentration
+    finite = np.isfinite(concentrations)
+    assert finite.mean() > 0.5
+    estimated = coefficients[0] * concentrations ** 2 + \
+        coefficients[1] * concentrations + coefficients[2]
+    assert np.allclose(estimated[finite], areas[finite])
+
+
+@pytest.mark.parametrize("model", [None, CalibrationModel(INVERSE_X2,
+                                                          QUADRATIC)])
+def test_long_table_carries_the_curvature(table, model):
+    calibrations = fit_calibrations(table, model)
+    columns = tidy_columns(table, calibrations, "corrida")
+    fitted = calibrations.fitted[table.molecule]
+    expected = np.where(fitted, calibrations.curvature[table.molecule],
+                        np.nan)
+    np.testing.assert_array_equal(columns["curvature"], expected)
+    # Straight lines have no curvature, quadratic ones do
+    assert (columns["curvature"][fitted] != 0).any() == (model is not None)
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from calibration import CalibrationModel, fit_calibrations, INVERSE_X2, \
+    QUADRATIC
+from dict_to_xl import dict_to_xlsx
+from history import RunHistory, record_run, add_pdfs, DAY
+from pdf_to_dict import read_pdf
+from peak_table import PeakTable, STANDARD
+from synthetic import synthetic_processed
+
+NOW = 1.8e9
+
+
+@pytest.fixture(scope="module")
+def table():
+    processed, names = synthetic_processed(6, 4)
+    return PeakTable.from_processed(processed, names)
+
+
+@pytest.fixture
+def history(tmp_path):
+    with RunHistory(str(tmp_path / "historial.sqlite")) as history:
+        yield history
+
+
+def test_areas_of_the_last_days_oldest_first(history, table):
+    calibrations = fit_calibrations(table)
+    for days_ago in (100, 30, 2, 1):
+        history.record(table, calibrations, f"hace {days_ago}",
+                       run_date=NOW - days_ago * DAY)
+    molecule = table.molecule_names[0]
+    samples = len(table.sample_list())
+    columns = history.areas(molecule, days=40, until=NOW)
+    assert len(columns["area"]) == 3 * samples
+    assert (np.diff(columns["date"].astype(np.int64)) >= 0).all()
+    m = table.molecule_names.index(molecule)
+    assert np.allclose(columns["area"][:samples], table.sample_areas()[:, m])
+    assert np.allclose(columns["concentration"][:samples],
+                       calibrations.concentrations[:, m])
+
+    sample = table.sample_list()[0]
+    columns = history.areas(molecule, sample=sample, until=NOW)
+    assert columns["sample"].tolist() == [sample] * 4
+    standards = history.areas(molecule, kind=STANDARD, until=NOW)
+    assert len(standards["area"]) == 4 * len(table.standards(m)[0])
+    assert history.molecules() == sorted(table.molecule_names)
+    assert [name for _, name, _, _, _ in history.runs(until=NOW)] == \
+        ["hace 100", "hace 30", "hace 2", "hace 1"]
+
+
+def test_fits_keep_the_model_of_the_workbook(history, table):
+    model = CalibrationModel(INVERSE_X2, QUADRATIC)
+    calibrations = fit_calibrations(table, model)
+    history.record(table, calibrations, "cuadratica", run_date=NOW)
+    fits = history.fits(table.molecule_names[1], until=NOW)
+    assert np.allclose(fits["curvature"], calibrations.curvature[1])
+    assert np.allclose(fits["slope"], calibrations.slope[1])
+    assert fits["model"].tolist() == [calibrations.quality.describe(1)]
+
+
+def test_recording_the_same_pdf_again_replaces_its_run(history, table):
+    calibrations = fit_calibrations(table)
+    for _ in range(2):
+        history.record(table, calibrations, "corrida", digest="abc",
+                       run_date=NOW)
+    assert len(history.runs(until=NOW)) == 1
+    assert len(history.areas(table.molecule_names[0], until=NOW)["area"]) \
+        == len(table.sample_list())
+
+
+def test_a_failed_run_leaves_nothing_behind(history, table, monkeypatch):
+    calibrations = fit_calibrations(table)
+
+    def broken(*args):
+        raise sqlite3.IntegrityError("fallo")
+
+    monkeypatch.setattr(history, "_record_fits", broken)
+    with pytest.raises(sqlite3.IntegrityError):
+        history.record(table, calibrations, "corrida", run_date=NOW)
+    assert history.runs(until=NOW) == []
+    assert history.connection.execute(
+        "SELECT COUNT(*) FROM areas").fetchone() == (0,)
+
+
+def test_conversions_and_added_pdfs_are_recorded(report, tmp_path):
+    db_path = str(tmp_path / "historial.sqlite")
+    assert dict_to_xlsx(report, str(tmp_path), history=db_path) == 0
+    assert add_pdfs(db_path, [report]) == {report: 0}
+    with RunHistory(db_path) as history:
+        runs = history.runs(since=0, until=os.path.getmtime(report) + 1)
+    # Both come from the same PDF, so the second replaced the first
+    assert len(runs) == 1
+    assert runs[0][3] == os.path.abspath(report)
+    table = PeakTable.from_processed(*read_pdf(report))
+    assert record_run(db_path, report, table, fit_calibrations(table)) == 0
@@ -0,0 +1,51 @@
+import time
+
+from jobs import JobManager, CANCELLED
+
+TIMEOUT = 30
+
+
+def _wait_for_cancel(cancel_event):
+    cancel_event.wait(TIMEOUT)
+    return CANCELLED
+
+
+def _finish_anyway(cancel_event):
+    cancel_event.wait(TIMEOUT)
+    return 0
+
+
+def _fail(cancel_event):
+    cancel_event.wait(TIMEOUT)
+    raise RuntimeError("fallo")
+
+
+def test_summary_counts_only_jobs_that_stopped_early():
+    manager = JobManager(3)
+    try:
+        batch = manager.submit_batch([("detenido", _wait_for_cancel),
+                                      ("terminado", _finish_anyway),
+                                      ("fallido", _fail),
+                                      ("en espera", _finish_anyway)])
+        # The fourth job waits for a worker, cancelling drops it
+        while sum(job.started is not None for job in batch.jobs) < 3:
+            time.sleep(0.01)
+        batch.cancel()
+        assert batch.wait(TIMEOUT)
+        summary = batch.summary()
+        assert summary["cancelled"] == 2
+        assert summary["failed"] == 1
+        assert summary["results"] == {"detenido": CANCELLED, "terminado": 0}
+    finally:
+        manager.shutdown()
+
+
+def test_cancelling_a_finished_batch_cancels_nothing():
+    manager = JobManager(1)
+    try:
+        batch = manager.submit_batch([("rapido", lambda cancel_event: 0)])
+        assert batch.wait(TIMEOUT)
+        batch.cancel()
+        assert batch.summary()["cancelled"] == 0
+    finally:
+        manager.shutdown()
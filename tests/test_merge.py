@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+
+import pytest
+
+import merge_xl
+from conftest import read_cells
+from pdf_to_dict import read_pdf
+from synthetic import write_report
+
+
+def _merge(paths, xlsx):
+    return merge_xl.merge_pdfs(paths, xlsx, workers=2)
+
+
+@pytest.fixture
+def runs(tmp_path):
+    paths = []
+    for n in range(3):
+        paths.append(str(tmp_path / f"corrida {n}.pdf"))
+        write_report(paths[-1], samples=5 + n, molecules=4, seed=n)
+    return paths
+
+
+def test_merge_keeps_every_run(runs, tmp_path):
+    xlsx = str(tmp_path / "consolidado.xlsx")
+    results, res = _merge(runs[:2], xlsx)
+    assert res == 0 and set(results.values()) == {0}
+    saved = merge_xl.load_runs(xlsx)
+    assert list(saved) == ["corrida 0", "corrida 1"]
+    assert saved["corrida 1"]["processed"] == read_pdf(runs[1])[0]
+
+    # Only the new PDF is read, the others come from the runs file
+    results, res = _merge(runs, xlsx)
+    assert res == 0 and set(results.values()) == {0}
+    assert list(merge_xl.load_runs(xlsx)) == \
+        ["corrida 0", "corrida 1", "corrida 2"]
+    summary = read_cells(xlsx)["Resumen"]
+    sources = {value for _, value in summary.values()}
+    assert {os.path.basename(path) for path in runs} <= sources
+
+
+@pytest.mark.parametrize("content", [b"", b"no es un zlib",
+                                     b"x\x9c\x03\x00"])
+def test_a_corrupt_runs_file_starts_over(runs, tmp_path, content):
+    xlsx = str(tmp_path / "consolidado.xlsx")
+    with open(merge_xl.state_path(xlsx), "wb") as state:
+        state.write(content)
+    assert len(merge_xl.load_runs(xlsx)) == 0
+    results, res = _merge(runs[:1], xlsx)
+    assert res == 0 and results == {runs[0]: 0}
+    assert list(merge_xl.load_runs(xlsx)) == ["corrida 0"]
+
+
+def test_runs_that_cannot_be_saved_are_reported(runs, tmp_path, monkeypatch):
+    xlsx = str(tmp_path / "consolidado.xlsx")
+
+    def read_only(*args):
+        raise PermissionError("solo lectura")
+
+    monkeypatch.setattr(merge_xl.os, "replace", read_only)
+    results, res = _merge(runs[:1], xlsx)
+    assert results == {runs[0]: 0} and res == 2
+    assert os.path.exists(xlsx)
+    assert not [name for name in os.listdir(str(tmp_path))
+                if name.endswith(".tmp")]
+
+
+_parse = merge_xl._parse
+
+
+def _crash_on_first_run(path, *args):
+    if path.endswith("corrida 0.pdf"):
+        os._exit(1)
+    return _parse(path, *args)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="the workers must inherit the patched parser")
+def test_a_crashed_parse_is_an_error_of_its_file(runs, tmp_path,
+                                                 monkeypatch):
+    monkeypatch.setattr(merge_xl, "_parse", _crash_on_first_run)
+    xlsx = str(tmp_path / "consolidado.xlsx")
+    results, res = merge_xl.merge_pdfs(runs[:1], xlsx, workers=1)
+    assert results == {runs[0]: 3}
+    assert res == 0
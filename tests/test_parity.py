@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from parse_cache import ParseCache
+from pdf_to_dict import EXTRACTORS, DEFAULT_BACKEND, read_pdf, \
+    iter_page_texts
+from profiling import Stats
+from synthetic import write_report
+
+OTHER_BACKENDS = sorted(set(EXTRACTORS) - {DEFAULT_BACKEND})
+
+
+def _same(result, reference):
+    # Dict order is the order of the pages, which the workbook follows
+    assert result == reference
+    for kind in reference[0]:
+        assert list(result[0][kind]) == list(reference[0][kind])
+
+
+@pytest.mark.parametrize("backend", OTHER_BACKENDS)
+def test_backends_match_the_reference(reports, backend):
+    for path in reports.values():
+        _same(read_pdf(path, backend=backend), read_pdf(path))
+
+
+def test_page_workers_match_sequential(reports):
+    for path in reports.values():
+        _same(read_pdf(path, workers=2), read_pdf(path))
+
+
+@pytest.mark.parametrize("backend", sorted(EXTRACTORS))
+def test_cache_matches_uncached(reports, tmp_path, backend):
+    for name, path in reports.items():
+        reference = read_pdf(path, backend=backend)
+        cache = ParseCache(str(tmp_path / name / backend))
+        _same(cache.read_pdf(path, backend=backend), reference)
+        # Pages known, result of the file forgotten
+        os.remove(cache._entry_path(cache.key(path, backend)))
+        stats = Stats()
+        _same(cache.read_pdf(path, backend=backend, stats=stats), reference)
+        assert stats.counters.get("reused_pages", 0) > 0
+        stats = Stats()
+        _same(cache.read_pdf(path, backend=backend, stats=stats), reference)
+        assert stats.counters["cache_hits"] == 1
+
+
+def test_unnamed_page_text_goes_to_the_next_page(reports):
+    """
+    As the original parser did, the table of a page without sample name is
+    read as the table of the next sample
+    """
+    processed, molecule_names = read_pdf(reports["unnamed"])
+    assert "Ruido" in molecule_names
+    assert processed["samples"]["Muestra 4"] == {"Ruido": 3.0}
+    assert "Ruido" not in processed["samples"]["Muestra 3"]
+
+
+def test_unnamed_page_next_to_cached_pages(tmp_path):
+    """
+    Pages known to the cache still get the text of an unnamed page before
+    them, even when that page is new
+    """
+    plain, unnamed = str(tmp_path / "plain.pdf"), str(tmp_path / "u.pdf")
+    write_report(plain, samples=9, molecules=4)
+    write_report(unnamed, samples=9, molecules=4, unnamed_every=3)
+    cache = ParseCache(str(tmp_path / "cache"))
+    cache.read_pdf(plain)
+    _same(cache.read_pdf(unnamed), read_pdf(unnamed))
+
+
+def test_page_texts_are_yielded_in_order(report):
+    sequential = list(iter_page_texts(report))
+    assert list(iter_page_texts(report, workers=3)) == sequential
+    assert list(iter_page_texts(report, only=[0, 2])) == \
+        [sequential[0], sequential[2]]
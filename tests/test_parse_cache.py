@@ -0,0 +1,54 @@
+import os
+
+from parse_cache import ParseCache
+from pdf_to_dict import read_pdf, page_fingerprints
+from profiling import Stats
+from synthetic import write_report
+
+
+def test_invalidate_drops_the_result_and_the_pages(report, tmp_path):
+    cache = ParseCache(str(tmp_path))
+    result = cache.read_pdf(report)
+    cache.read_pdf(report, backend="fast")
+    assert cache.stats()[0] == 4
+    cache.invalidate(report)
+    assert cache.stats() == (0, 0)
+    assert cache.read_pdf(report) == result
+
+
+def test_invalidate_ignores_files_that_are_not_pdfs(tmp_path):
+    path = tmp_path / "notas.pdf"
+    path.write_bytes(b"no es un PDF")
+    cache = ParseCache(str(tmp_path / "cache"))
+    cache.invalidate(str(path))
+    assert cache.stats() == (0, 0)
+
+
+def test_a_longer_sequence_reuses_the_pages_read(tmp_path):
+    short, longer = str(tmp_path / "short.pdf"), str(tmp_path / "long.pdf")
+    write_report(short, samples=10, molecules=4)
+    write_report(longer, samples=14, molecules=4)
+    # The same template, so the first page and the shared pages match
+    assert page_fingerprints(longer)[:len(page_fingerprints(short))] == \
+        page_fingerprints(short)
+    cache = ParseCache(str(tmp_path / "cache"))
+    cache.read_pdf(short)
+    stats = Stats()
+    assert cache.read_pdf(longer, stats=stats) == read_pdf(longer)
+    # Only the four new samples are extracted
+    assert len(stats.pages) == 4
+    assert stats.counters["reused_pages"] == len(page_fingerprints(short))
+
+
+def test_evict_keeps_the_most_recent_entries(reports, tmp_path):
+    cache = ParseCache(str(tmp_path))
+    paths = sorted(reports.values())
+    for path in paths:
+        cache.read_pdf(path)
+    for _, _, entry in cache._entries():
+        os.utime(entry, (0, 0))
+    newest = cache._entry_path(cache.key(paths[-1]))
+    os.utime(newest, (100, 100))
+    cache.max_bytes = os.path.getsize(newest)
+    cache.evict()
+    assert [entry for _, _, entry in cache._entries()] == [newest]
@@ -0,0 +1,89 @@
+import json
+import multiprocessing
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import server
+
+
+def _request(url, data=None):
+    """
+    :return: Tuple (HTTP status, body)
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data),
+                                    timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+@pytest.fixture
+def service_url():
+    conversion_server = server.make_server(port=0, workers=1, quiet=True)
+    thread = threading.Thread(target=conversion_server.serve_forever,
+                              daemon=True)
+    thread.start()
+    try:
+        yield conversion_server.url
+    finally:
+        conversion_server.shutdown()
+        conversion_server.server_close()
+
+
+def test_converts_to_json_and_xlsx(service_url, report):
+    from pdf_to_dict import read_pdf
+    with open(report, "rb") as pdf:
+        data = pdf.read()
+    status, body = _request(service_url + "/convert?format=json", data)
+    assert status == 200
+    processed, molecule_names = read_pdf(report)
+    assert json.loads(body.decode("utf-8"))["molecules"] == molecule_names
+    status, body = _request(service_url + "/convert", data)
+    assert status == 200 and body[:2] == b"PK"
+    status, body = _request(service_url + "/convert", b"no es un PDF")
+    assert status == 422
+
+
+_convert_upload = server.convert_upload
+
+
+def _crash_once(pdf_path, *args):
+    marker = os.path.join(os.path.dirname(os.path.dirname(pdf_path)),
+                          "hplc-test-crashed")
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return _convert_upload(pdf_path, *args)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="the workers must inherit the patched conversion")
+def test_a_dead_worker_loses_only_its_request(report, tmp_path,
+                                              monkeypatch):
+    # Uploads go to folders under the temporary directory, the marker sits
+    # next to them
+    monkeypatch.setattr(server.tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(server, "convert_upload", _crash_once)
+    conversion_server = server.make_server(port=0, workers=1, quiet=True)
+    threading.Thread(target=conversion_server.serve_forever,
+                     daemon=True).start()
+    url = conversion_server.url
+    try:
+        with open(report, "rb") as pdf:
+            data = pdf.read()
+        status, _ = _request(url + "/convert?format=json", data)
+        assert status == 503
+        status, body = _request(url + "/health")
+        assert status == 200, body
+        status, _ = _request(url + "/convert?format=json", data)
+        assert status == 200
+        metrics = json.loads(_request(url + "/metrics")[1].decode("utf-8"))
+        assert metrics["restarts"] == 1 and not metrics["broken"]
+    finally:
+        conversion_server.shutdown()
+        conversion_server.server_close()
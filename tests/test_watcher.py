@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+import watcher
+from cli import convert_file
+
+TIMEOUT = 60
+
+
+def _run_until(folder_watcher, done):
+    """
+    Runs the watcher in a thread until done() or TIMEOUT seconds
+    """
+    stop = threading.Event()
+    thread = threading.Thread(target=folder_watcher.run, args=(stop,))
+    thread.start()
+    try:
+        deadline = time.time() + TIMEOUT
+        while not done() and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        thread.join(TIMEOUT)
+    assert not thread.is_alive()
+
+
+@pytest.fixture
+def folders(tmp_path):
+    incoming, output = tmp_path / "entrada", tmp_path / "salida"
+    incoming.mkdir()
+    output.mkdir()
+    return str(incoming), str(output)
+
+
+def test_files_wait_until_they_settle(folders, report):
+    incoming, output = folders
+    path = shutil.copy(report, incoming)
+    folder_watcher = watcher.FolderWatcher(incoming, output, settle=5)
+    assert folder_watcher.scan(100) == []
+    assert folder_watcher.scan(102) == []
+    stat = os.stat(path)
+    assert folder_watcher.scan(105) == [(path, stat.st_size, stat.st_mtime)]
+
+    # A file still growing starts over
+    with open(path, "ab") as pdf:
+        pdf.write(b"\n")
+    assert folder_watcher.scan(106) == []
+    assert len(folder_watcher.scan(111)) == 1
+
+
+def test_converted_files_are_not_converted_again(folders, report):
+    incoming, output = folders
+    path = os.path.normpath(shutil.copy(report, incoming))
+    folder_watcher = watcher.FolderWatcher(incoming, output, workers=1,
+                                           interval=0.05, settle=0)
+    _run_until(folder_watcher, lambda: path in folder_watcher.state)
+    assert folder_watcher.state[path]["status"] == 0
+    name = os.path.splitext(os.path.basename(path))[0]
+    assert os.path.exists(os.path.join(output, f"Resultados {name}.xlsx"))
+
+    restarted = watcher.FolderWatcher(incoming, output, settle=0)
+    assert restarted.state == folder_watcher.state
+    restarted.scan(0)
+    assert restarted.scan(1) == []
+
+
+def test_a_state_file_that_cannot_be_saved_is_logged(folders, monkeypatch):
+    incoming, output = folders
+    folder_watcher = watcher.FolderWatcher(incoming, output)
+
+    def disk_full(*args):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(watcher.os, "replace", disk_full)
+    assert folder_watcher.save_state() is False
+    assert os.listdir(output) == []
+
+
+def _crash_once(path, *args):
+    marker = path + ".crashed"
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return convert_file(path, *args)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="the workers must inherit the patched conversion")
+def test_files_in_flight_when_a_worker_dies_are_retried(folders, report,
+                                                        monkeypatch):
+    incoming, output = folders
+    path = os.path.normpath(shutil.copy(report, incoming))
+    monkeypatch.setattr(watcher, "convert_file", _crash_once)
+    folder_watcher = watcher.FolderWatcher(incoming, output, workers=1,
+                                           interval=0.05, settle=0)
+    _run_until(folder_watcher, lambda: path in folder_watcher.state)
+    assert os.path.exists(path + ".crashed")
+    assert folder_watcher.state[path]["status"] == 0
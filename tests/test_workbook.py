@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from calibration import fit_calibrations
+from conftest import read_cells, column_values, find_row
+from dict_to_xl import dict_to_xlsx, sanitize_sheet_name
+from parse_cache import ParseCache
+from pdf_to_dict import read_pdf
+from peak_table import PeakTable
+
+
+def _workbook(path, folder, **kwargs):
+    os.makedirs(folder)
+    assert dict_to_xlsx(path, folder, **kwargs) == 0
+    name = os.path.splitext(os.path.basename(path))[0]
+    return read_cells(os.path.join(folder, f"Resultados {name}.xlsx"))
+
+
+@pytest.fixture(scope="module")
+def reference(report, tmp_path_factory):
+    return _workbook(report, str(tmp_path_factory.mktemp("reference") / "x"))
+
+
+@pytest.mark.parametrize("options", [
+    {"backend": "fast"},
+    {"page_workers": 2},
+    {"constant_memory": True},
+    {"cache": True},
+], ids=lambda options: ",".join(options))
+def test_workbook_does_not_depend_on_how_it_is_read(report, reference,
+                                                    tmp_path, options):
+    options = dict(options)
+    if options.get("cache"):
+        cache = ParseCache(str(tmp_path / "cache"))
+        _workbook(report, str(tmp_path / "cold"), cache=cache)
+        options["cache"] = cache
+    assert _workbook(report, str(tmp_path / "out"), **options) == reference
+
+
+def test_workbook_holds_the_parsed_values(report, reference):
+    processed, molecule_names = read_pdf(report)
+    table = PeakTable.from_processed(processed, molecule_names)
+    calibrations = fit_calibrations(table)
+    samples = table.sample_list()
+    sample_areas = table.sample_areas()
+    for m_idx, molecule in enumerate(table.molecule_names):
+        cells = reference[sanitize_sheet_name(molecule)]
+        x_vals, y_vals = table.standards(m_idx)
+        if len(x_vals) < 2:
+            # Internal standard, only the areas of the samples
+            assert cells["B2"][1] == "DATOS DE CALIBRADO NO ENCONTRADOS"
+            assert column_values(cells, "B", 5) == list(samples)
+            assert column_values(cells, "C", 5) == \
+                list(sample_areas[:, m_idx])
+            continue
+        assert column_values(cells, "B", 5) == list(x_vals)
+        assert column_values(cells, "C", 5) == list(y_vals)
+
+        first = find_row(cells, "B", "Muestra") + 1
+        assert column_values(cells, "B", first) == list(samples)
+        assert column_values(cells, "C", first) == \
+            list(sample_areas[:, m_idx])
+        # Concentrations are formulas, their cached results must be the
+        # ones of the calibration
+        written = [cells[f"D{row}"] for row in
+                   range(first, first + len(samples))]
+        assert all(formula for formula, _ in written)
+        expected = calibrations.concentrations[:, m_idx]
+        assert np.allclose([value for _, value in written],
+                           np.where(np.isfinite(expected), expected, 0))
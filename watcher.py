@@ -0,0 +1,264 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from cli import convert_file, STATUS_MESSAGES
+from parse_cache import ParseCache
+
+STATE_FILE = ".hplc_watch.json"
+# Times a file may be in flight when a worker process dies before it is
+# recorded as an error, in case it is the file crashing the worker
+MAX_CRASHES = 3
+
+
+def _log(message):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}  {message}", flush=True)
+
+
+class FolderWatcher:
+    """
+    Polls a folder for new or modified PDFs and converts them with
+    dict_to_xlsx in a bounded process pool.
+
+    A file is only queued once its size and modification time have not
+    changed for settle seconds, so PDFs still being written by the
+    instrument are left alone. Finished files are recorded in a state file,
+    so a restarted watcher does not convert them again. Files that are
+    locked (status 2) are retried with exponential backoff, and so are the
+    files that were converting when a worker process died, the pool being
+    started again.
+    """
+
+    def __init__(self, folder, output_path=None, workers=2, interval=2.0,
+                 settle=5.0, max_retry_delay=600.0, state_path=None,
+                 recursive=False, report_od=False, cache=None,
+                 constant_memory=True):
+        self.folder = folder
+        self.output_path = output_path
+        self.workers = workers
+        self.interval = interval
+        self.settle = settle
+        self.max_retry_delay = max_retry_delay
+        self.state_path = state_path or os.path.join(output_path or folder,
+                                                     STATE_FILE)
+        self.recursive = recursive
+        self.report_od = report_od
+        self.cache = cache
+        self.constant_memory = constant_memory
+        # path -> (size, mtime, time since when it has looked like that)
+        self.seen = {}
+        # path -> (size, mtime, attempts, time of the next attempt)
+        self.retries = {}
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as state:
+                return json.load(state)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self):
+        """
+        :return: Whether the state file could be written. A full or read-only
+                 disk is only logged, the state is kept in memory and saved
+                 with the next conversion.
+        """
+        folder = os.path.dirname(self.state_path) or "."
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+                json.dump(self.state, tmp, indent=1)
+            os.replace(tmp_path, self.state_path)
+        except OSError as error:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            _log(f"No se pudo guardar {self.state_path}: {error}")
+            return False
+        return True
+
+    def _pdfs(self):
+        for root, dirs, files in os.walk(self.folder):
+            for name in files:
+                if name.lower().endswith(".pdf"):
+                    yield os.path.normpath(os.path.join(root, name))
+            if not self.recursive:
+                break
+
+    def scan(self, now):
+        """
+        :return: List of (path, size, mtime) of the files ready to be
+                 converted
+        """
+        ready = []
+        present = set()
+        for path in self._pdfs():
+            present.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            done = self.state.get(path)
+            if done and (done["size"], done["mtime"]) == signature:
+                continue
+            retry = self.retries.get(path)
+            if retry and retry[:2] == signature and retry[3] > now:
+                continue
+            previous = self.seen.get(path)
+            if previous is None or previous[:2] != signature:
+                # New or still growing, wait until it settles
+                self.seen[path] = signature + (now,)
+                continue
+            if now - previous[2] >= self.settle and stat.st_size > 0:
+                ready.append((path,) + signature)
+        for path in set(self.seen) - present:
+            del self.seen[path]
+            self.retries.pop(path, None)
+        return ready
+
+    def _retry(self, path, size, mtime, message):
+        """
+        Schedules another attempt of path with exponential backoff
+
+        :return: Number of attempts so far
+        """
+        attempts = self.retries.get(path, (size, mtime, 0))[2] + 1
+        delay = min(self.max_retry_delay, self.interval * 2 ** attempts)
+        self.retries[path] = (size, mtime, attempts, time.time() + delay)
+        _log(f"{message}, reintento en {delay:.0f} s")
+        return attempts
+
+    def _finished(self, path, size, mtime, res, elapsed):
+        if res == 2:
+            self._retry(path, size, mtime, f"{res}  {path}  "
+                                           f"{STATUS_MESSAGES[2]}")
+            return
+        self.retries.pop(path, None)
+        self.seen.pop(path, None)
+        self.state[path] = {"size": size, "mtime": mtime, "status": res,
+                            "elapsed": round(elapsed, 3),
+                            "converted": time.time()}
+        self.save_state()
+        _log(f"{res}  {path}  "
+             f"{STATUS_MESSAGES.get(res, STATUS_MESSAGES[3])} "
+             f"({elapsed:.1f} s)")
+
+    def _collect(self, future, running):
+        """
+        Records the result of a finished conversion. A file that was in
+        flight when a worker died is retried, it only counts as an error
+        after MAX_CRASHES attempts. Any other failure to run the task is an
+        error.
+
+        :return: Whether the pool is broken
+        """
+        path, size, mtime = running.pop(future)
+        try:
+            _, res, elapsed, _ = future.result()
+        except BrokenProcessPool:
+            attempts = self._retry(path, size, mtime,
+                                   f"3  {path}  se detuvo un proceso de "
+                                   f"conversión")
+            if attempts >= MAX_CRASHES:
+                self._finished(path, size, mtime, 3, 0.0)
+            return True
+        except Exception:
+            res, elapsed = 3, 0.0
+        self._finished(path, size, mtime, res, elapsed)
+        return False
+
+    def run(self, stop_event=None):
+        """
+        Watches the folder until stop_event is set (or forever)
+        """
+        stop_event = stop_event or threading.Event()
+        running = {}
+        _log(f"Vigilando {self.folder} con {self.workers} procesos")
+        pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        try:
+            while not stop_event.is_set():
+                broken = False
+                for future in [f for f in running if f.done()]:
+                    broken |= self._collect(future, running)
+
+                busy = {path for path, _, _ in running.values()}
+                for path, size, mtime in self.scan(time.time()):
+                    # Keep at most one file waiting per worker, the rest
+                    # are picked up again by the next scans
+                    if broken or len(running) >= 2 * self.workers:
+                        break
+                    if path in busy:
+                        continue
+                    try:
+                        future = pool.submit(convert_file, path,
+                                             self.output_path,
+                                             self.report_od, 1, self.cache,
+                                             self.constant_memory)
+                    except BrokenProcessPool:
+                        # Lost a worker while idle
+                        broken = True
+                        break
+                    running[future] = (path, size, mtime)
+                if broken:
+                    # A ProcessPoolExecutor stays broken once a worker dies,
+                    # every future still running fails with it
+                    for future in list(running):
+                        self._collect(future, running)
+                    pool.shutdown(wait=False)
+                    pool = concurrent.futures.ProcessPoolExecutor(
+                        self.workers)
+                    _log("Procesos reiniciados")
+                    continue
+                stop_event.wait(self.interval)
+            for future in concurrent.futures.as_completed(list(running)):
+                self._collect(future, running)
+        finally:
+            pool.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convierte a Excel los PDFs que aparecen en una carpeta")
+    parser.add_argument("folder", help="Carpeta donde el equipo deja los PDFs")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Carpeta de destino (por defecto, la misma)")
+    parser.add_argument("-j", "--workers", type=int, default=2,
+                        help="Número de procesos")
+    parser.add_argument("-i", "--interval", type=float, default=2.0,
+                        help="Segundos entre revisiones de la carpeta")
+    parser.add_argument("-s", "--settle", type=float, default=5.0,
+                        help="Segundos sin cambios antes de leer un PDF")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Vigilar también las subcarpetas")
+    parser.add_argument("--od", action="store_true",
+                        help="Agregar columnas de rendimiento (OD y mg/g)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="No usar el caché de lectura")
+    args = parser.parse_args(argv)
+    for folder in (args.folder, args.output):
+        if folder and not os.path.isdir(folder):
+            print(f"La carpeta {folder} no existe", file=sys.stderr)
+            return 2
+    watcher = FolderWatcher(args.folder, args.output, workers=args.workers,
+                            interval=args.interval, settle=args.settle,
+                            recursive=args.recursive, report_od=args.od,
+                            cache=None if args.no_cache else ParseCache())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        _log("Detenido")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Exports of the results of one PDF besides the per-molecule workbook of
+dict_to_xl: a tidy long table with one row per peak, written as CSV or, with
+the optional pyarrow package, as Parquet or Arrow IPC files that notebooks
+and LIMS imports load with their types.
+"""
+import csv
+import numpy as np
+from options import TABLE_FORMATS, available_formats  # noqa: F401
+from peak_table import SAMPLE, STANDARD, INT_STANDARD
+
+COLUMNS = ("run", "sample", "molecule", "area", "concentration",
+           "is_standard", "is_internal_standard", "slope", "intercept",
+           "curvature", "r2")
+# Rows converted to Python objects at a time while writing CSV
+CSV_CHUNK_ROWS = 65536
+
+
+def tidy_columns(table, calibrations, run):
+    """
+    Long format of a PeakTable, one row per peak in table order
+
+    :param table: PeakTable
+    :param calibrations: calibration.Calibrations of the table
+    :param run: Name of the run, usually the PDF file name
+    :return: Dict {column: numpy array} with the COLUMNS:
+             sample is None for standards, concentration is the standard
+             concentration, the one estimated from the calibration for
+             samples, or NaN, and slope, intercept, curvature (a of
+             y = a x² + m x + n, 0 for straight lines) and r2 are those of
+             the fit the workbook uses for the molecule, NaN without one
+    """
+    kind = table.kind
+    molecule = table.molecule
+
+    # Estimated concentrations are a (samples x molecules) matrix whose
+    # rows follow table.sample_order
+    position = np.full(len(table.sample_names), -1, dtype=np.int64)
+    position[table.sample_order] = np.arange(len(table.sample_order))
+    concentration = table.conc.copy()
+    samples = kind == SAMPLE
+    concentration[samples] = calibrations.concentrations[
+        position[table.sample[samples]], molecule[samples]]
+
+    fitted = calibrations.fitted
+    zero = calibrations.zero_intercept
+    slope = np.where(zero, calibrations.slope_zero, calibrations.slope)
+    intercept = np.where(zero, 0.0, calibrations.intercept)
+    curvature = np.where(zero, 0.0, calibrations.curvature)
+    r2 = np.where(zero, calibrations.r2_zero, calibrations.r2)
+    slope, intercept, curvature, r2 = (
+        np.where(fitted, values, np.nan)
+        for values in (slope, intercept, curvature, r2))
+
+    # Standards have sample -1, which picks the trailing None
+    sample_names = np.array(list(table.sample_names) + [None], dtype=object)
+    molecule_names = np.array(table.molecule_names, dtype=object)
+    runs = np.empty(len(table), dtype=object)
+    runs[:] = run
+    return {"run": runs,
+            "sample": sample_names[table.sample],
+            "molecule": molecule_names[molecule],
+            "area": table.area,
+            "concentration": concentration,
+            "is_standard": kind == STANDARD,
+            "is_internal_standard": kind == INT_STANDARD,
+            "slope": slope[molecule],
+            "intercept": intercept[molecule],
+            "curvature": curvature[molecule],
+            "r2": r2[molecule]}
+
+
+def _csv_values(values):
+    """
+    :return: List of CSV fields of one column: empty for None and NaN,
+             "true"/"false" for booleans
+    """
+    if values.dtype == np.bool_:
+        return ["true" if value else "false" for value in values.tolist()]
+    if values.dtype.kind == "f":
+        return ["" if value != value else value for value in values.tolist()]
+    return ["" if value is None else value for value in values.tolist()]
+
+
+def write_csv(columns, path):
+    """
+    Streams the tidy columns into a comma separated file, a chunk of rows
+    at a time
+
+    :return: 0 if saved, 2 if the file is locked
+    """
+    rows = len(columns["run"])
+    try:
+        with open(path, "w", newline="", encoding="utf-8") as output:
+            writer = csv.writer(output)
+            writer.writerow(COLUMNS)
+            for start in range(0, rows, CSV_CHUNK_ROWS):
+                writer.writerows(zip(*(
+                    _csv_values(columns[name][start:start + CSV_CHUNK_ROWS])
+                    for name in COLUMNS)))
+    except PermissionError:
+        return 2
+    return 0
+
+
+def _arrow_table(columns):
+    import pyarrow
+    # from_pandas makes NaN a null, pandas itself is not needed
+    return pyarrow.table({name: pyarrow.array(columns[name],
+                                              from_pandas=True)
+                          for name in COLUMNS})
+
+
+def write_parquet(columns, path):
+    """
+    :return: 0 if saved, 2 if the file is locked
+    """
+    import pyarrow.parquet
+    try:
+        pyarrow.parquet.write_table(_arrow_table(columns), path)
+    except PermissionError:
+        return 2
+    return 0
+
+
+def write_arrow(columns, path):
+    """
+    Writes an Arrow IPC file, readable with pyarrow.ipc.open_file or as a
+    Feather v2 file
+
+    :return: 0 if saved, 2 if the file is locked
+    """
+    import pyarrow.ipc
+    table = _arrow_table(columns)
+    try:
+        with pyarrow.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+    except PermissionError:
+        return 2
+    return 0
+
+
+# Format: (file extension, writer, module it needs besides the standard
+# library and numpy, see options.TABLE_FORMATS)
+WRITERS = {
+    "csv": (".csv", write_csv, TABLE_FORMATS["csv"]),
+    "parquet": (".parquet", write_parquet, TABLE_FORMATS["parquet"]),
+    "arrow": (".arrow", write_arrow, TABLE_FORMATS["arrow"]),
+}